@@ -3,9 +3,10 @@
 # ---------------------------------------------------
 import os
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, jsonify, flash, redirect, request, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_wtf.csrf import CSRFProtect
-from flask_login import LoginManager
+from flask_login import LoginManager, login_required
 from flask_bcrypt import Bcrypt
 from flask_talisman import Talisman
 import pytz
@@ -21,6 +22,7 @@ from routes.resoconto import resoconto_bp
 from routes.google_calendar import google_calendar_bp
 from routes.stato_crediti import stato_crediti_bp
 from routes.contratti import contratti_bp
+from routes.jobs import jobs_bp
 
 load_dotenv()
 
@@ -34,6 +36,9 @@ else:
 print("Verifica e inizializzazione del database...")
 ensure_database()
 
+from migrazioni import applica_migrazioni
+applica_migrazioni()
+
 # ---------------------------------------------------
 # CREAZIONE APP FLASK
 # ---------------------------------------------------
@@ -49,6 +54,10 @@ except:
 app.config['SECRET_KEY'] = os.environ.get('FLASK_SECRET_KEY', 'fallback-secret-key-solo-per-sviluppo-locale-DA-CAMBIARE')
 app.config['DEBUG'] = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
 
+# Limite del corpo delle richieste (upload CSV e PDF): oltre risponde 413
+from utils.upload import MAX_CONTENT_LENGTH
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+
 csrf = CSRFProtect(app)
 bcrypt = Bcrypt(app)
 
@@ -89,10 +98,37 @@ app.register_blueprint(resoconto_bp)
 app.register_blueprint(google_calendar_bp)
 app.register_blueprint(stato_crediti_bp)
 app.register_blueprint(contratti_bp)
+app.register_blueprint(jobs_bp)
+
+# Connessione al database per richiesta (pool PostgreSQL), restituita a fine richiesta
+import db_utils
+db_utils.init_app(app)
+
+@app.errorhandler(RequestEntityTooLarge)
+def file_troppo_grande(errore):
+    flash(f"❌ File troppo grande (massimo {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB)", "danger")
+    return redirect(request.referrer or url_for('lezioni.dashboard'))
+
+@app.route("/stato/db")
+@login_required
+def stato_db():
+    """Metriche del pool di connessioni PostgreSQL (attese e saturazione)"""
+    if db_utils.statistiche_pool is None:
+        return jsonify({"success": True, "pool": None, "messaggio": "SQLite: nessun pool di connessioni"})
+    return jsonify({"success": True, "pool": db_utils.statistiche_pool()})
 
 # ---------------------------------------------------
 # AVVIO SERVER
 # ---------------------------------------------------
 if __name__ == "__main__":
+    # Con gunicorn il worker dei lavori in background lo avvia gunicorn.conf.py; qui lo avvia
+    # il processo principale (non il processo riavviato a ogni modifica dal reloader di debug)
+    if os.environ.get('AVVIA_WORKER_JOB', 'true').lower() == 'true' and not os.environ.get('WERKZEUG_RUN_MAIN'):
+        import atexit
+        import subprocess
+        import sys
+        worker_job = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')])
+        atexit.register(worker_job.terminate)
+        print(f">>> Worker lavori in background avviato (pid {worker_job.pid})")
     print(">>> Avvio applicazione Flask...")
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,119 @@
+"""
+Benchmark chat sul contratto: token e latenza per domanda con ClientFinto.
+
+Confronta il vecchio formato (testo del contratto incollato in ogni messaggio,
+nessuno storico) con chat_with_contract (contratto nel system come blocco
+cacheabile + storico della conversazione). I token vengono letti dalla
+tabella utilizzo_claude, come in produzione.
+
+Con SQLite usa un database temporaneo, il database dell'app non viene toccato.
+
+Uso: python benchmarks/bench_chat_contratto.py [--domande 8] [--pagine-contratto 12]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+if not db_utils.USE_POSTGRES:
+    import database
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_chat.db')
+    database.init_db()
+from migrazioni import applica_migrazioni
+applica_migrazioni()
+
+from db_utils import db_connection
+from routes.contratti import chat_with_contract
+from utils.claude_client import ClientFinto, invia_messaggio
+
+# Prezzi Sonnet in $ per milione di token
+PREZZO_INPUT = 3.0
+PREZZO_CACHE_SCRITTURA = 3.75
+PREZZO_CACHE_LETTURA = 0.30
+PREZZO_OUTPUT = 15.0
+
+DOMANDE = [
+    "Dammi il numero del corso", "Qual è il compenso orario?", "Quali sono le date del contratto?",
+    "Quante ore sono previste?", "Dove si svolge il corso?", "Quali sono le modalità di pagamento?",
+    "Chi è il referente?", "Ci sono penali per le assenze?",
+]
+
+
+def testo_contratto(pagine):
+    riga = "Art. {n} - Il docente si impegna a svolgere le lezioni secondo il calendario allegato. "
+    return "\n".join(riga.format(n=i) * 12 for i in range(pagine * 10))
+
+
+def chat_vecchia(client, contratto, domanda, riferimento):
+    """Formato precedente: contratto incollato nel messaggio utente, nessuno storico"""
+    return invia_messaggio(client, [{
+        "role": "user",
+        "content": f"Sei un assistente che aiuta a rispondere a domande su un contratto.\n\n"
+                   f"Ecco il testo completo del contratto:\n\n{contratto}\n\nDomanda dell'utente: {domanda}"
+    }], max_tokens=2000, operazione="bench_vecchia", riferimento=riferimento)
+
+
+def chat_nuova(client, contratto, domanda, storico, riferimento):
+    risposta, errore = chat_with_contract(contratto, domanda, conversation_history=storico,
+                                          client=client, riferimento=riferimento)
+    if errore:
+        raise RuntimeError(errore)
+    storico.extend([{"role": "user", "content": domanda}, {"role": "assistant", "content": risposta}])
+    return risposta
+
+
+def riepilogo(operazione):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT input_tokens, output_tokens, cache_creation_tokens, cache_read_tokens, durata_ms
+            FROM utilizzo_claude WHERE operazione = {db_utils.get_placeholder()} ORDER BY id
+        """, (operazione,))
+        return cursor.fetchall()
+
+
+def costo(r):
+    return (r['input_tokens'] * PREZZO_INPUT + r['cache_creation_tokens'] * PREZZO_CACHE_SCRITTURA
+            + r['cache_read_tokens'] * PREZZO_CACHE_LETTURA + r['output_tokens'] * PREZZO_OUTPUT) / 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--domande', type=int, default=8)
+    parser.add_argument('--pagine-contratto', type=int, default=12)
+    parser.add_argument('--secondi-per-mille-token', type=float, default=0.02,
+                        help="latenza simulata per 1000 token non in cache")
+    args = parser.parse_args()
+
+    contratto = testo_contratto(args.pagine_contratto)
+    domande = [DOMANDE[i % len(DOMANDE)] for i in range(args.domande)]
+    riferimento = f"bench-{int(time.time())}"
+    risposta = "Secondo il contratto, la risposta è riportata all'articolo 3. " * 4
+
+    client = ClientFinto(risposta, args.secondi_per_mille_token)
+    for domanda in domande:
+        chat_vecchia(client, contratto, domanda, riferimento)
+
+    client = ClientFinto(risposta, args.secondi_per_mille_token)
+    storico = []
+    for domanda in domande:
+        chat_nuova(client, contratto, domanda, storico, riferimento)
+
+    print(f"Contratto: ~{len(contratto) // 4} token, {len(domande)} domande\n")
+    print(f"{'modalità':<8} {'#':>3} {'input':>7} {'cache W':>8} {'cache R':>8} {'output':>7} {'ms':>7} {'$':>9}")
+    for nome, operazione in (("vecchia", "bench_vecchia"), ("nuova", "chat_contratto")):
+        righe = riepilogo(operazione)[-len(domande):]
+        for i, r in enumerate(righe, start=1):
+            print(f"{nome:<8} {i:>3} {r['input_tokens']:>7} {r['cache_creation_tokens']:>8} "
+                  f"{r['cache_read_tokens']:>8} {r['output_tokens']:>7} {r['durata_ms']:>7} {costo(r):>9.5f}")
+        seguenti = righe[1:] or righe
+        print(f"{nome:<8} media domande successive: {sum(r['durata_ms'] for r in seguenti) / len(seguenti):.0f} ms, "
+              f"${sum(costo(r) for r in seguenti) / len(seguenti):.5f}\n")
+
+
+if __name__ == "__main__":
+    main()
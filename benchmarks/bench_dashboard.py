@@ -0,0 +1,146 @@
+"""
+Benchmark dashboard: tempo di risposta di /dashboard al crescere delle lezioni
+(1.000, 10.000, 100.000), con la paginazione keyset di pagina_lezioni.
+
+Per ogni dimensione misura:
+- la lista come prima (SELECT * di tutte le lezioni filtrate, senza LIMIT);
+- la prima pagina e una pagina a metà tabella (cursore "dopo");
+- la risposta completa di /dashboard e di /api/lezioni (client di test Flask).
+
+Con la paginazione i tempi delle pagine devono restare piatti, mentre la
+lista completa cresce con la tabella.
+
+Usa un database SQLite temporaneo, il database dell'app non viene toccato.
+
+Uso: python benchmarks/bench_dashboard.py [--dimensioni 1000 10000 100000] [--ripetizioni 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+if db_utils.USE_POSTGRES:
+    sys.exit("Questo benchmark popola un database SQLite temporaneo: eseguirlo senza DATABASE_URL")
+
+import database
+import ensure_db
+database.DB_PATH = ensure_db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_dashboard.db')
+database.init_db()
+
+from app import app
+from db_utils import db_connection
+from routes.lezioni import codifica_cursore, pagina_lezioni
+from utils.riepilogo_corsi import ricostruisci_riepilogo
+from utils.time_utils import durata_e_importo
+
+STATI = ["Completato"] * 6 + ["Pianificato"] * 3 + ["Cancellato"]
+ORARI = [("09:00", "13:00"), ("14:00", "18:00"), ("09:30", "12:30"), ("15:00", "17:00")]
+N_CORSI = 200
+
+
+def popola(da, a):
+    """Aggiunge le lezioni con indice da..a-1 (date distribuite su 6 anni)"""
+    rnd = random.Random(da)
+    inizio = date(2020, 1, 1)
+    corsi = [f"CORSO{i:04d}" for i in range(N_CORSI)]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if da == 0:
+            cursor.executemany("INSERT INTO corsi (id_corso, nome, cliente) VALUES (?, ?, ?)",
+                               [(c, f"Corso {c}", f"Cliente {i % 20}") for i, c in enumerate(corsi)])
+
+        def lezioni():
+            for _ in range(da, a):
+                ora_inizio, ora_fine = rnd.choice(ORARI)
+                stato = rnd.choice(STATI)
+                giorno = inizio + timedelta(days=rnd.randrange(365 * 6))
+                yield (rnd.choice(corsi), "Materia", giorno.isoformat(), ora_inizio, ora_fine, "Aula", 30.0,
+                       stato, 1 if stato == "Completato" and rnd.random() < 0.7 else 0,
+                       *durata_e_importo(ora_inizio, ora_fine, 30.0))
+
+        cursor.executemany("""
+            INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario,
+                                 stato, fatturato, durata_minuti, importo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, lezioni())
+        ricostruisci_riepilogo(cursor)
+        cursor.execute("ANALYZE")
+        conn.commit()
+
+
+def cronometra(funzione, ripetizioni):
+    funzione()  # riscaldamento
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append((time.perf_counter() - inizio) * 1000)
+    return statistics.median(tempi)
+
+
+def lista_completa():
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM lezioni WHERE id_corso IS NOT NULL")
+        return cursor.fetchall()
+
+
+def pagina(args):
+    with db_connection() as conn:
+        return pagina_lezioni(conn.cursor(), args)
+
+
+def cursore_a_meta(n_lezioni):
+    """Cursore della pagina che parte a metà tabella"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT data, ora_inizio, id FROM lezioni ORDER BY data, ora_inizio, id LIMIT 1 OFFSET ?",
+                       (n_lezioni // 2,))
+        return codifica_cursore(cursor.fetchone())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dimensioni', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    args = parser.parse_args()
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    with client.session_transaction() as sessione:
+        sessione['_user_id'] = '1'
+        sessione['_fresh'] = True
+
+    def richiesta(url):
+        risposta = client.get(url)
+        if risposta.status_code != 200:
+            raise RuntimeError(f"{url}: risposta inattesa {risposta.status_code}")
+
+    print(f"{'lezioni':>8} {'lista completa':>15} {'prima pagina':>13} {'pagina a metà':>14} "
+          f"{'/dashboard':>11} {'/dashboard a metà':>18} {'/api/lezioni':>13}   (ms, mediana)")
+    presenti = 0
+    for dimensione in sorted(args.dimensioni):
+        popola(presenti, dimensione)
+        presenti = dimensione
+        meta = cursore_a_meta(dimensione)
+        tempi = (
+            cronometra(lista_completa, args.ripetizioni),
+            cronometra(lambda: pagina({}), args.ripetizioni),
+            cronometra(lambda: pagina({"dopo": meta}), args.ripetizioni),
+            cronometra(lambda: richiesta('/dashboard'), args.ripetizioni),
+            cronometra(lambda: richiesta(f'/dashboard?dopo={meta}'), args.ripetizioni),
+            cronometra(lambda: richiesta(f'/api/lezioni?dopo={meta}'), args.ripetizioni),
+        )
+        print(f"{dimensione:>8} {tempi[0]:>15.2f} {tempi[1]:>13.2f} {tempi[2]:>14.2f} "
+              f"{tempi[3]:>11.2f} {tempi[4]:>18.2f} {tempi[5]:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
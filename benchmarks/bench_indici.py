@@ -0,0 +1,160 @@
+"""
+Benchmark indici: tempi delle query di dashboard, compenso e stato_crediti
+prima e dopo la migrazione 0006 (indici), su 100.000 lezioni.
+
+Usa un database SQLite temporaneo popolato con dati sintetici; il database
+dell'app non viene toccato.
+
+Uso: python benchmarks/bench_indici.py [--lezioni 100000] [--corsi 500] [--ripetizioni 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+if db_utils.USE_POSTGRES:
+    sys.exit("Questo benchmark popola un database SQLite temporaneo: eseguirlo senza DATABASE_URL")
+
+import database
+database.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_indici.db')
+
+from db_utils import db_connection
+from migrazioni import applica_migrazioni
+
+STATI = ["Completato"] * 6 + ["Pianificato"] * 3 + ["Cancellato"]
+ORARI = [("09:00", "13:00"), ("14:00", "18:00"), ("09:30", "12:30"), ("15:00", "17:00")]
+
+
+def popola(n_lezioni, n_corsi, n_archiviate):
+    rnd = random.Random(42)
+    inizio = date(2020, 1, 1)
+    corsi = [f"CORSO{i:04d}" for i in range(n_corsi)]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO corsi (id_corso, nome, cliente) VALUES (?, ?, ?)",
+                           [(c, f"Corso {c}", f"Cliente {i % 20}") for i, c in enumerate(corsi)])
+
+        def lezioni(totale):
+            # Come nei dati reali: le lezioni di un corso vengono inserite insieme
+            # (calendario o import CSV), in ordine di data
+            for i in range(totale):
+                corso = corsi[i * len(corsi) // totale]
+                ora_inizio, ora_fine = rnd.choice(ORARI)
+                stato = rnd.choice(STATI)
+                fatturato = 1 if stato == "Completato" and rnd.random() < 0.7 else 0
+                giorno = inizio + timedelta(days=(i * 365 * 6) // totale + rnd.randrange(30))
+                yield (corso, "Materia", giorno.isoformat(), ora_inizio, ora_fine,
+                       "Aula", 30.0, stato, fatturato)
+
+        colonne = "id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato"
+        cursor.executemany(f"INSERT INTO lezioni ({colonne}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           lezioni(n_lezioni))
+        cursor.executemany(f"INSERT INTO archiviate ({colonne}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           lezioni(n_archiviate))
+
+        cursor.executemany("""
+            INSERT INTO fatture (numero_fattura, id_corso, data_fattura, importo, tipo_fatturazione, file_pdf)
+            VALUES (?, ?, ?, 1000, 'parziale', 'x.pdf')
+        """, [(str(i), corsi[i % n_corsi], "2024-01-01") for i in range(n_corsi * 4)])
+        cursor.execute("SELECT id FROM lezioni WHERE fatturato = 1")
+        cursor.executemany("INSERT INTO fatture_lezioni (id_fattura, id_lezione) VALUES (?, ?)",
+                           [(row[0] % (n_corsi * 4) + 1, row[0]) for row in cursor.fetchall()])
+        conn.commit()
+    return corsi
+
+
+# Query delle pagine (variante SQLite), con parametri rappresentativi
+def query_benchmark(corso):
+    compenso = """
+        SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine,
+               l.luogo, l.compenso_orario, l.stato, l.fatturato, l.mese_fatturato,
+               COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
+        FROM {tabella} l
+        LEFT JOIN corsi c ON l.id_corso = c.id_corso
+        LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
+        WHERE l.ora_inizio IS NOT NULL AND l.ora_fine IS NOT NULL
+    """
+    return [
+        ("dashboard filtro corso",
+         "SELECT * FROM lezioni WHERE id_corso IS NOT NULL AND id_corso = ?", (corso,)),
+        ("dashboard filtro data",
+         "SELECT * FROM lezioni WHERE id_corso IS NOT NULL AND data = ?", ("2024-03-15",)),
+        ("dashboard grafico mesi", """
+            SELECT strftime('%Y-%m', data) as mese, COUNT(*) as numero_lezioni
+            FROM lezioni GROUP BY mese ORDER BY mese
+         """, ()),
+        ("compenso corso", compenso.format(tabella="lezioni") + " AND l.id_corso = ?", (corso,)),
+        ("compenso intervallo", compenso.format(tabella="lezioni") + " AND l.data BETWEEN ? AND ?",
+         ("2024-03-01", "2024-03-31")),
+        ("compenso archiviate corso", compenso.format(tabella="archiviate") + " AND l.id_corso = ?", (corso,)),
+        ("stato_crediti", """
+            SELECT COALESCE(c.cliente, 'Senza Cliente') as cliente, l.id_corso,
+                   COALESCE(c.nome, l.id_corso) as nome_corso,
+                   COUNT(l.id) as totale_lezioni,
+                   SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) as lezioni_completate,
+                   SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0 THEN
+                       ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario
+                   ELSE 0 END) as credito_maturato,
+                   MAX(l.data) as ultima_data_lezione
+            FROM lezioni l
+            LEFT JOIN corsi c ON l.id_corso = c.id_corso
+            GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
+            ORDER BY cliente, nome_corso
+         """, ()),
+        ("lezioni di un corso da fatturare", """
+            SELECT * FROM lezioni WHERE id_corso = ? AND stato = 'Completato' AND fatturato = 0
+            ORDER BY data
+         """, (corso,)),
+        ("lezioni di una fattura", """
+            SELECT l.* FROM fatture_lezioni fl JOIN lezioni l ON l.id = fl.id_lezione
+            WHERE fl.id_fattura = ?
+         """, (7,)),
+    ]
+
+
+def misura(query, params, ripetizioni):
+    tempi = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for _ in range(ripetizioni):
+            inizio = time.perf_counter()
+            cursor.execute(query, params)
+            cursor.fetchall()
+            tempi.append((time.perf_counter() - inizio) * 1000)
+    return statistics.median(tempi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lezioni', type=int, default=100_000)
+    parser.add_argument('--corsi', type=int, default=500)
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    args = parser.parse_args()
+
+    database.init_db()
+    applica_migrazioni(fino_a=5)
+    print(f"⏳ Popolamento: {args.lezioni} lezioni, {args.corsi} corsi...")
+    corsi = popola(args.lezioni, args.corsi, args.lezioni // 5)
+    queries = query_benchmark(corsi[len(corsi) // 2])
+
+    prima = [misura(q, p, args.ripetizioni) for _, q, p in queries]
+    inizio = time.perf_counter()
+    applica_migrazioni(fino_a=6)
+    durata_indici = time.perf_counter() - inizio
+    dopo = [misura(q, p, args.ripetizioni) for _, q, p in queries]
+
+    print(f"\nCreazione indici: {durata_indici:.2f} s\n")
+    print(f"{'query':<34} {'prima ms':>9} {'dopo ms':>9} {'speedup':>8}")
+    for (nome, _, _), t_prima, t_dopo in zip(queries, prima, dopo):
+        print(f"{nome:<34} {t_prima:>9.2f} {t_dopo:>9.2f} {t_prima / t_dopo:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark rendering PDF seriale vs pool di processi (utils/pdf_images).
+
+Genera PDF sintetici multi-pagina (scansioni A4) e misura pagine/secondo
+con pagine_jpeg_base64 in modalità seriale e con 2, 3, 4 processi,
+verificando che l'ordine delle pagine coincida con quello seriale.
+Richiede poppler (pdftoppm) installato.
+
+Uso: python benchmarks/bench_pdf_pool.py [--pagine 5 10 20] [--processi 2 3 4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pdf_render import genera_pdf_scansione
+from utils.pdf_images import pagine_jpeg_base64
+
+
+def converti(pdf, pagine, processi):
+    inizio = time.perf_counter()
+    risultato = list(pagine_jpeg_base64(pdf, max_pagine=pagine, processi=processi, limite_memoria_mb=None))
+    return risultato, time.perf_counter() - inizio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pagine', type=int, nargs='+', default=[5, 10, 20])
+    parser.add_argument('--processi', type=int, nargs='+', default=[2, 3, 4])
+    args = parser.parse_args()
+
+    cartella = tempfile.mkdtemp()
+    print(f"{'pagine':>6} {'processi':>8} {'secondi':>8} {'pagine/s':>9} {'speedup':>8} {'ordine':>7}")
+    for pagine in args.pagine:
+        pdf = os.path.join(cartella, f"scansione_{pagine}.pdf")
+        genera_pdf_scansione(pdf, pagine)
+
+        seriale, t_seriale = converti(pdf, pagine, 1)
+        print(f"{pagine:>6} {'seriale':>8} {t_seriale:>8.2f} {pagine / t_seriale:>9.2f} {1.0:>8.2f} {'ok':>7}")
+        for processi in args.processi:
+            pool, t_pool = converti(pdf, pagine, processi)
+            ordine = 'ok' if pool == seriale else 'DIVERSO'
+            print(f"{pagine:>6} {processi:>8} {t_pool:>8.2f} {pagine / t_pool:>9.2f} "
+                  f"{t_seriale / t_pool:>8.2f} {ordine:>7}")
+
+
+if __name__ == "__main__":
+    main()
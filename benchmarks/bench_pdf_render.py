@@ -0,0 +1,112 @@
+"""
+Benchmark conversione PDF → JPEG base64 per Claude Vision.
+
+Confronta la conversione precedente (tutte le pagine a 300 DPI in memoria,
+poi resize e JPEG) con utils/pdf_images.pagine_jpeg_base64 (una pagina alla
+volta al DPI calcolato da 1568px), per i due chiamanti:
+contratti (max 20 pagine) e fatture (max 10 pagine).
+
+Ogni misura gira in un processo separato, così il picco di RSS è pulito.
+Richiede poppler (pdftoppm) installato.
+
+Uso: python benchmarks/bench_pdf_render.py [--pagine 20] [--pdf file.pdf]
+"""
+import argparse
+import base64
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHIAMANTI = {'contratti': 20, 'fatture': 10}
+
+
+def genera_pdf_scansione(percorso, pagine):
+    """PDF sintetico simile a una scansione: pagine A4 a 300 DPI con testo e rumore"""
+    from PIL import Image, ImageDraw
+    random.seed(42)
+    immagini = []
+    for n in range(pagine):
+        img = Image.effect_noise((2480, 3508), 20).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        for riga in range(60):
+            y = 150 + riga * 52
+            draw.text((150, y), f"Pagina {n + 1} riga {riga} 13/02/2026 09:00-13:00 " + "x" * random.randint(10, 60),
+                      fill=(0, 0, 0))
+        immagini.append(img)
+    immagini[0].save(percorso, "PDF", resolution=300, save_all=True, append_images=immagini[1:])
+    for img in immagini:
+        img.close()
+
+
+def converti_vecchio(file_path, max_pages):
+    """Conversione precedente: tutte le pagine a 300 DPI caricate insieme"""
+    from pdf2image import convert_from_path
+    from PIL import Image
+    images = convert_from_path(file_path, first_page=1, last_page=max_pages, dpi=300)
+    risultato = []
+    for img in images:
+        if img.width > 1568 or img.height > 1568:
+            ratio = min(1568 / img.width, 1568 / img.height)
+            img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+        buffered = BytesIO()
+        img.convert('RGB').save(buffered, format="JPEG", quality=92, optimize=True)
+        risultato.append(base64.b64encode(buffered.getvalue()).decode())
+    return risultato
+
+
+def converti_nuovo(file_path, max_pages):
+    from utils.pdf_images import pagine_jpeg_base64
+    return list(pagine_jpeg_base64(file_path, max_pagine=max_pages, limite_memoria_mb=None))
+
+
+def misura(modalita, file_path, max_pages):
+    """Eseguito nel processo figlio: stampa pagine, secondi e picco RSS (MB)"""
+    funzione = converti_vecchio if modalita == 'vecchio' else converti_nuovo
+    inizio = time.perf_counter()
+    pagine = funzione(file_path, max_pages)
+    durata = time.perf_counter() - inizio
+    picco_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    byte_jpeg = sum(len(p) for p in pagine) * 3 // 4
+    print(f"{len(pagine)} {durata:.3f} {picco_mb:.1f} {byte_jpeg}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pagine', type=int, default=20, help="pagine del PDF sintetico")
+    parser.add_argument('--pdf', help="usa questo PDF invece di generarne uno")
+    parser.add_argument('--_figlio', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._figlio:
+        modalita, file_path, max_pages = args._figlio
+        misura(modalita, file_path, int(max_pages))
+        return
+
+    pdf = args.pdf
+    if not pdf:
+        pdf = os.path.join(tempfile.mkdtemp(), 'scansione.pdf')
+        print(f"Generazione PDF sintetico di {args.pagine} pagine...")
+        genera_pdf_scansione(pdf, args.pagine)
+
+    print(f"\n{'chiamante':<10} {'modalità':<8} {'pagine':>6} {'s/pagina':>9} {'picco RSS MB':>13} {'KB JPEG':>8}")
+    for chiamante, max_pages in CHIAMANTI.items():
+        for modalita in ('vecchio', 'nuovo'):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--_figlio', modalita, pdf, str(max_pages)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            pagine, durata, picco, byte_jpeg = out.split()
+            pagine = int(pagine)
+            print(f"{chiamante:<10} {modalita:<8} {pagine:>6} {float(durata) / max(pagine, 1):>9.3f} "
+                  f"{float(picco):>13.1f} {int(byte_jpeg) // 1024:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark user loader: richieste/secondo su una route autenticata banale
+(/stato/db) con e senza la cache degli utenti di models.user.
+
+Senza cache ogni richiesta esegue SELECT * FROM users WHERE id = ? per
+ricaricare l'utente della sessione; con la cache la query viene eseguita solo
+alla prima richiesta (e poi ogni USER_CACHE_TTL_SECONDI).
+
+Con SQLite usa un database temporaneo, il database dell'app non viene toccato.
+
+Uso: python benchmarks/bench_user_loader.py [--richieste 3000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+if not db_utils.USE_POSTGRES:
+    import database
+    import ensure_db
+    database.DB_PATH = ensure_db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_user_loader.db')
+    database.init_db()
+
+from app import app
+from db_utils import db_connection
+import models.user
+
+
+def misura(client, richieste, ttl):
+    models.user.USER_CACHE_TTL = ttl
+    models.user.invalida_utente()
+    client.get('/stato/db')  # riscaldamento
+    inizio = time.perf_counter()
+    for _ in range(richieste):
+        risposta = client.get('/stato/db')
+        if risposta.status_code != 200:
+            raise RuntimeError(f"Risposta inattesa {risposta.status_code}: la sessione non è autenticata")
+    return richieste / (time.perf_counter() - inizio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--richieste', type=int, default=3000)
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
+        user_id = cursor.fetchone()[0]
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    with client.session_transaction() as sessione:
+        sessione['_user_id'] = str(user_id)
+        sessione['_fresh'] = True
+
+    senza = misura(client, args.richieste, 0)
+    con = misura(client, args.richieste, 300)
+
+    print(f"\n{args.richieste} richieste GET /stato/db autenticate\n")
+    print(f"{'user loader':<12} {'req/s':>9}")
+    print(f"{'senza cache':<12} {senza:>9.0f}")
+    print(f"{'con cache':<12} {con:>9.0f}")
+    print(f"\nSpeedup: {con / senza:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import os
 import sqlite3
 from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
 from flask_bcrypt import generate_password_hash
+from utils.time_utils import minuti_da_orario
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lezioni.db")
 SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
@@ -9,9 +12,65 @@ SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.s
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "fatture")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Attesa massima (secondi) quando un altro processo/thread tiene il lock di scrittura
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '5'))
+
+# ---------------------------------------------------
+# Funzioni SQL di schema_postgres.sql (calcola_ore, extract_*) per SQLite.
+# Stessi risultati delle versioni PL/pgSQL; il parsing di date e orari è
+# memoizzato perché gli stessi valori si ripetono su migliaia di righe.
+# ---------------------------------------------------
+
+@lru_cache(maxsize=8192)
+def _data(testo):
+    try:
+        return datetime.strptime(testo.strip()[:10], "%Y-%m-%d").date()
+    except (AttributeError, ValueError):
+        return None
+
+def sql_calcola_ore(ora_inizio, ora_fine):
+    inizio, fine = minuti_da_orario(ora_inizio), minuti_da_orario(ora_fine)
+    if inizio is None or fine is None:
+        return None
+    # Come utils.time_utils.calcola_ore: se ora_fine precede ora_inizio la lezione passa la mezzanotte
+    return (fine - inizio) % (24 * 60) / 60.0
+
+def sql_extract_year(data):
+    d = _data(data)
+    return str(d.year) if d else None
+
+def sql_extract_year_month(data):
+    d = _data(data)
+    return f"{d.year:04d}-{d.month:02d}" if d else None
+
+def sql_extract_year_week(data):
+    # TO_CHAR(..., 'YYYY-IW'): anno di calendario + settimana ISO, come su PostgreSQL
+    d = _data(data)
+    return f"{d.year:04d}-{d.isocalendar()[1]:02d}" if d else None
+
+def sql_extract_weekday(data):
+    # EXTRACT(DOW ...): 0 = domenica, 6 = sabato
+    d = _data(data)
+    return str((d.weekday() + 1) % 7) if d else None
+
+FUNZIONI_SQL = (
+    ("calcola_ore", 2, sql_calcola_ore),
+    ("extract_year", 1, sql_extract_year),
+    ("extract_year_month", 1, sql_extract_year_month),
+    ("extract_year_week", 1, sql_extract_year_week),
+    ("extract_weekday", 1, sql_extract_weekday),
+)
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=SQLITE_BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row
+    # Impostazioni applicate una volta per connessione: con WAL le letture non
+    # bloccano le scritture (e viceversa) tra i worker di gunicorn
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}")
+    for nome, n_argomenti, funzione in FUNZIONI_SQL:
+        conn.create_function(nome, n_argomenti, funzione, deterministic=True)
     return conn
 
 @contextmanager
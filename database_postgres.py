@@ -1,5 +1,9 @@
 import os
+import threading
+import time
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import connection as _Connessione, TRANSACTION_STATUS_IDLE
 from psycopg2.extras import DictCursor
 from contextlib import contextmanager
 from flask_bcrypt import generate_password_hash
@@ -14,11 +18,149 @@ if not DATABASE_URL:
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "fatture")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Pool di connessioni (per processo): PG_POOL_MIN connessioni restano aperte
+# tra una richiesta e l'altra, fino a PG_POOL_MAX in uso contemporaneamente
+POOL_MIN = int(os.environ.get('PG_POOL_MIN', '2'))
+POOL_MAX = int(os.environ.get('PG_POOL_MAX', '5'))
+POOL_ATTESA_MAX = float(os.environ.get('PG_POOL_ATTESA_SECONDI', '10'))
+# Le connessioni inattive da più di PG_POOL_VERIFICA_SECONDI vengono verificate con SELECT 1
+POOL_VERIFICA_SECONDI = float(os.environ.get('PG_POOL_VERIFICA_SECONDI', '30'))
+POOL_SOGLIA_LOG_MS = float(os.environ.get('PG_POOL_SOGLIA_LOG_MS', '100'))
+
+
+class ConnessionePool(_Connessione):
+    """Connessione del pool: close() la restituisce al pool invece di chiuderla"""
+    stato_pool = None      # 'in_uso', 'libera' o None (fuori dal pool / in chiusura)
+    ultimo_uso = None
+    _restituisci = None
+
+    def close(self):
+        if self.stato_pool == 'in_uso':
+            self.stato_pool = None
+            self._restituisci(self)
+        elif self.stato_pool != 'libera':  # una seconda close() su una connessione già restituita non fa nulla
+            super().close()
+
+
+class PoolConnessioni:
+    """ThreadedConnectionPool con attesa (invece di PoolError), verifica delle connessioni e metriche"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.creato_il = time.monotonic()
+        self._pool = pg_pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, DATABASE_URL,
+                                                    connection_factory=ConnessionePool,
+                                                    cursor_factory=DictCursor)
+        self._posti = threading.BoundedSemaphore(POOL_MAX)
+        self._lock = threading.Lock()
+        self.metriche = {'prelievi': 0, 'attese': 0, 'timeout': 0, 'scartate': 0,
+                         'attesa_totale_ms': 0.0, 'attesa_max_ms': 0.0, 'in_uso': 0, 'picco_in_uso': 0}
+
+    def _scarta(self, conn):
+        conn.stato_pool = None
+        try:
+            self._pool.putconn(conn, close=True)
+        except pg_pool.PoolError:
+            pass
+        with self._lock:
+            self.metriche['scartate'] += 1
+
+    def _connessione_valida(self):
+        """Preleva dal pool una connessione funzionante, scartando quelle cadute"""
+        for _ in range(POOL_MAX + 1):
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._scarta(conn)
+                continue
+            # le connessioni aperte alla creazione del pool non hanno ancora ultimo_uso
+            if time.monotonic() - (conn.ultimo_uso or self.creato_il) > POOL_VERIFICA_SECONDI:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    self._scarta(conn)
+                    continue
+            return conn
+        raise pg_pool.PoolError("Impossibile ottenere una connessione PostgreSQL valida dal pool")
+
+    def preleva(self):
+        inizio = time.perf_counter()
+        saturo = not self._posti.acquire(blocking=False)
+        if saturo and not self._posti.acquire(timeout=POOL_ATTESA_MAX):
+            with self._lock:
+                self.metriche['timeout'] += 1
+            raise pg_pool.PoolError(f"Pool PostgreSQL esaurito: nessuna connessione libera "
+                                    f"dopo {POOL_ATTESA_MAX:g} s ({POOL_MAX} in uso)")
+        try:
+            conn = self._connessione_valida()
+        except Exception:
+            self._posti.release()
+            raise
+        attesa_ms = (time.perf_counter() - inizio) * 1000
+
+        conn.stato_pool = 'in_uso'
+        conn._restituisci = self.restituisci
+        with self._lock:
+            m = self.metriche
+            m['prelievi'] += 1
+            m['attese'] += 1 if saturo else 0
+            m['attesa_totale_ms'] += attesa_ms
+            m['attesa_max_ms'] = max(m['attesa_max_ms'], attesa_ms)
+            m['in_uso'] += 1
+            m['picco_in_uso'] = max(m['picco_in_uso'], m['in_uso'])
+            in_uso = m['in_uso']
+        if saturo or attesa_ms >= POOL_SOGLIA_LOG_MS:
+            print(f"⚠️ Pool PostgreSQL: attesa connessione {attesa_ms:.0f} ms ({in_uso}/{POOL_MAX} in uso)")
+        return conn
+
+    def restituisci(self, conn):
+        with self._lock:
+            self.metriche['in_uso'] -= 1
+        try:
+            if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn.ultimo_uso = time.monotonic()
+            conn.stato_pool = 'libera'
+            self._pool.putconn(conn)
+        except Exception:
+            self._scarta(conn)
+        finally:
+            self._posti.release()
+
+    def statistiche(self):
+        with self._lock:
+            m = dict(self.metriche)
+        m['attesa_media_ms'] = round(m['attesa_totale_ms'] / m['prelievi'], 2) if m['prelievi'] else 0.0
+        m['attesa_totale_ms'] = round(m['attesa_totale_ms'], 1)
+        m['attesa_max_ms'] = round(m['attesa_max_ms'], 1)
+        m.update({'min': POOL_MIN, 'max': POOL_MAX, 'libere': len(self._pool._pool),
+                  'saturazione': round(m['in_uso'] / POOL_MAX, 2)})
+        return m
+
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def _pool_corrente():
+    """Pool del processo corrente (ricreato dopo un fork, es. nei worker di gunicorn)"""
+    global _pool
+    if _pool is None or _pool.pid != os.getpid():
+        with _lock_pool:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = PoolConnessioni()
+    return _pool
+
+
+def statistiche_pool():
+    """Metriche del pool: connessioni in uso, saturazione, tempi di attesa"""
+    return _pool_corrente().statistiche()
+
+
 def get_db_connection():
-    """Crea una connessione al database PostgreSQL"""
-    conn = psycopg2.connect(DATABASE_URL)
-    conn.cursor_factory = DictCursor
-    return conn
+    """Connessione PostgreSQL dal pool; close() la restituisce al pool"""
+    return _pool_corrente().preleva()
 
 @contextmanager
 def db_connection():
@@ -132,9 +274,6 @@ def ensure_database():
                 WHERE numero_fattura IS NULL
             """)
             
-            # Aggiunge il vincolo UNIQUE
-            cursor.execute("ALTER TABLE fatture ADD CONSTRAINT numero_fattura_unique UNIQUE (numero_fattura)")
-            
             print("✅ Colonna 'numero_fattura' aggiunta con successo alla tabella 'fatture'")
         
         # Verifica e crea la tabella contratti se non esiste
@@ -1,14 +1,74 @@
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g, has_app_context
 
 load_dotenv()
 
 USE_POSTGRES = os.environ.get("DATABASE_URL") and "postgresql" in os.environ.get("DATABASE_URL")
 
 if USE_POSTGRES:
-    from database_postgres import db_connection, get_db_connection
+    from database_postgres import db_connection as _db_connection, get_db_connection, statistiche_pool
 else:
-    from database import db_connection, get_db_connection
+    from database import db_connection as _db_connection, get_db_connection
+    statistiche_pool = None
+
+@contextmanager
+def db_connection():
+    """Connessione al database.
+
+    Dentro una richiesta Flask tutti i blocchi (user loader, route, helper)
+    riusano la stessa connessione, aperta al primo uso e chiusa (o restituita al
+    pool PostgreSQL) a fine richiesta da chiudi_connessione_richiesta.
+    All'uscita dal blocco più esterno la transazione non confermata viene
+    annullata, come quando la connessione veniva chiusa; i blocchi annidati
+    (helper chiamati dentro un altro blocco) non annullano le scritture ancora
+    da confermare del blocco esterno. Fuori da una richiesta (script, job) ogni
+    blocco apre e chiude la propria connessione.
+    """
+    if not has_app_context():
+        with _db_connection() as conn:
+            yield conn
+        return
+
+    conn = connessione_richiesta()
+    g.profondita_db = g.get('profondita_db', 0) + 1
+    try:
+        yield conn
+    finally:
+        g.profondita_db -= 1
+        if g.profondita_db == 0:
+            try:
+                conn.rollback()
+            except Exception:
+                # connessione caduta: la prossima query della richiesta ne userà un'altra
+                g.pop('conn_db', None)
+                conn.close()
+
+def _chiusa(conn):
+    if USE_POSTGRES:
+        return conn.closed
+    try:
+        conn.total_changes  # sqlite3 solleva ProgrammingError su connessione chiusa
+        return False
+    except Exception:
+        return True
+
+def connessione_richiesta():
+    """Connessione della richiesta corrente, aperta (prelevata dal pool) al primo uso"""
+    conn = g.get('conn_db')
+    if conn is None or _chiusa(conn):
+        conn = g.conn_db = get_db_connection()
+    return conn
+
+def chiudi_connessione_richiesta(exc=None):
+    """Chiude (o restituisce al pool) la connessione della richiesta (teardown_appcontext)"""
+    conn = g.pop('conn_db', None)
+    if conn is not None:
+        conn.close()
+
+def init_app(app):
+    app.teardown_appcontext(chiudi_connessione_richiesta)
 
 def get_placeholder():
     """Restituisce il placeholder corretto per il database in uso (%s per PostgreSQL, ? per SQLite)"""
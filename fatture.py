@@ -1,46 +1,30 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 import os
-import base64
 import json
-import tempfile
-from io import BytesIO
 from datetime import datetime
-from utils.time_utils import get_local_now, format_date_for_template, format_datetime_for_db
-from werkzeug.utils import secure_filename
-from db_utils import db_connection, get_db_connection, get_placeholder
+from utils.time_utils import get_local_now, format_date_for_template, format_datetime_for_db, durata_e_importo
+from utils.upload import UploadNonValido, salva_upload, salva_upload_temporaneo
+from db_utils import db_connection, get_placeholder
 from utils.security import sanitize_input, sanitize_form_data
+from utils.riepilogo_corsi import aggiorna_riepilogo, corsi_delle_lezioni
 from utils.sql_utils import sanitize_sql_identifier
+from utils.job_queue import registra_job, accoda_job, annullamento_richiesto
+from utils.pdf_images import ConversioneAnnullata
+from utils.pdf_cache import pagine_jpeg_con_cache, invalida_file
+from utils.claude_client import crea_client, invia_messaggio
 
 fatture_bp = Blueprint('fatture', __name__, url_prefix='/fatture')
 
 # ─── Helpers per Claude Vision ────────────────────────────────────────────────
-def _pdf_to_base64_images_fattura(file_path, max_pages=10):
-    """Converte PDF fattura in immagini JPEG base64 per Claude Vision."""
-    import gc
-    from pdf2image import convert_from_path
-    from PIL import Image
+def _pdf_to_base64_images_fattura(file_path, max_pages=10, annulla=None):
+    """Converte PDF fattura in immagini JPEG base64 per Claude Vision (una pagina alla volta, con cache)."""
     try:
-        images = convert_from_path(file_path, first_page=1, last_page=max_pages, dpi=300)
-        base64_images = []
-        for img in images:
-            max_size = 1568
-            if img.width > max_size or img.height > max_size:
-                ratio = min(max_size / img.width, max_size / img.height)
-                img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG", quality=92, optimize=True)
-            base64_images.append(base64.b64encode(buffered.getvalue()).decode())
-            img.close()
-            buffered.close()
-        del images
-        gc.collect()
-        return base64_images
+        return pagine_jpeg_con_cache(file_path, max_pagine=max_pages, annulla=annulla)
+    except ConversioneAnnullata:
+        raise
     except Exception as e:
         print(f"Errore conversione PDF fattura: {e}")
-        gc.collect()
         return None
 
 
@@ -87,40 +71,45 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 print(f"✅ Cartella per le fatture verificata: {UPLOAD_FOLDER}")
 
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def salva_pdf_fattura(file):
+    """Salva il PDF caricato in UPLOAD_FOLDER; restituisce il nome del file, None se assente o non valido"""
+    if not file or not file.filename:
+        return None
+    timestamp = format_datetime_for_db().replace('-', '').replace(' ', '').replace(':', '')
+    try:
+        return os.path.basename(salva_upload(file, UPLOAD_FOLDER, ALLOWED_EXTENSIONS, prefisso=timestamp))
+    except UploadNonValido as e:
+        flash(f"⚠️ PDF non salvato: {e}", "warning")
+        return None
 
 
 def get_corsi():
     """Recupera la lista di corsi disponibili nel database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
-    corsi = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
+        corsi = [row[0] for row in cursor.fetchall()]
     return corsi
 
 
 def get_fatture():
     """Recupera tutte le fatture emesse"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     from db_utils import get_group_concat_function
     group_concat_func = get_group_concat_function()
 
-    cursor.execute(f'''
-        SELECT f.id_fattura, f.numero_fattura, f.id_corso, f.data_fattura, f.importo, f.tipo_fatturazione,
-               f.file_pdf, f.note, f.cliente, f.progetto, f.tranche,
-               {group_concat_func}(l.data, ', ') AS lezioni_fatturate
-        FROM fatture f
-        LEFT JOIN fatture_lezioni fl ON f.id_fattura = fl.id_fattura
-        LEFT JOIN lezioni l ON fl.id_lezione = l.id
-        GROUP BY f.id_fattura
-        ORDER BY f.data_fattura DESC
-    ''')
-    fatture = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT f.id_fattura, f.numero_fattura, f.id_corso, f.data_fattura, f.importo, f.tipo_fatturazione,
+                   f.file_pdf, f.note, f.cliente, f.progetto, f.tranche,
+                   {group_concat_func}(l.data, ', ') AS lezioni_fatturate
+            FROM fatture f
+            LEFT JOIN fatture_lezioni fl ON f.id_fattura = fl.id_fattura
+            LEFT JOIN lezioni l ON fl.id_lezione = l.id
+            GROUP BY f.id_fattura
+            ORDER BY f.data_fattura DESC
+        ''')
+        fatture = cursor.fetchall()
 
     # Ordina per anno e numero fattura decrescenti (piu' recente in cima),
     # robusto rispetto al formato del numero (es. '16', 'NC.01', 'Ricevuta 03')
@@ -148,52 +137,51 @@ def index():
     ore_totali_corso = 0
 
     if corso_scelto:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        placeholder = get_placeholder()
-        cursor.execute(f"""
-            SELECT id, data, ora_inizio, ora_fine
-            FROM lezioni
-            WHERE id_corso = {placeholder} AND fatturato = 1
-            ORDER BY data
-        """, (corso_scelto,))
-        lezioni_fatturate_rows = cursor.fetchall()
-
-        lezioni_fatturate = [
-            {"id": row["id"], "data": row["data"], "ora_inizio": row["ora_inizio"], "ora_fine": row["ora_fine"]}
-            for row in lezioni_fatturate_rows
-        ]
-
-        cursor.execute(f"""
-            SELECT COUNT(*) as totale FROM lezioni WHERE id_corso = {placeholder}
-        """, (corso_scelto,))
-        totale_lezioni = cursor.fetchone()["totale"]
+            placeholder = get_placeholder()
+            cursor.execute(f"""
+                SELECT id, data, ora_inizio, ora_fine
+                FROM lezioni
+                WHERE id_corso = {placeholder} AND fatturato = 1
+                ORDER BY data
+            """, (corso_scelto,))
+            lezioni_fatturate_rows = cursor.fetchall()
+
+            lezioni_fatturate = [
+                {"id": row["id"], "data": row["data"], "ora_inizio": row["ora_inizio"], "ora_fine": row["ora_fine"]}
+                for row in lezioni_fatturate_rows
+            ]
 
-        cursor.execute(f"""
-            SELECT COUNT(*) as non_fatturate FROM lezioni WHERE id_corso = {placeholder} AND fatturato = 0
-        """, (corso_scelto,))
-        lezioni_non_fatturate = cursor.fetchone()["non_fatturate"]
+            cursor.execute(f"""
+                SELECT COUNT(*) as totale FROM lezioni WHERE id_corso = {placeholder}
+            """, (corso_scelto,))
+            totale_lezioni = cursor.fetchone()["totale"]
 
-        cursor.execute(f"""
-            SELECT f.id_fattura, f.data_fattura, f.importo, f.tipo_fatturazione, COUNT(fl.id_lezione) as num_lezioni
-            FROM fatture f
-            LEFT JOIN fatture_lezioni fl ON f.id_fattura = fl.id_fattura
-            WHERE f.id_corso = {placeholder}
-            GROUP BY f.id_fattura
-            ORDER BY f.data_fattura DESC
-        """, (corso_scelto,))
-        fatture_corso = cursor.fetchall()
+            cursor.execute(f"""
+                SELECT COUNT(*) as non_fatturate FROM lezioni WHERE id_corso = {placeholder} AND fatturato = 0
+            """, (corso_scelto,))
+            lezioni_non_fatturate = cursor.fetchone()["non_fatturate"]
 
-        if lezioni_non_fatturate == 0 and totale_lezioni > 0:
-            corso_status = "✅ Corso completamente fatturato"
-        elif lezioni_non_fatturate > 0:
-            corso_status = f"⚠️ Mancano {lezioni_non_fatturate} lezioni da fatturare su un totale di {totale_lezioni}"
-        else:
-            corso_status = "❌ Nessuna lezione presente per questo corso"
+            cursor.execute(f"""
+                SELECT f.id_fattura, f.data_fattura, f.importo, f.tipo_fatturazione, COUNT(fl.id_lezione) as num_lezioni
+                FROM fatture f
+                LEFT JOIN fatture_lezioni fl ON f.id_fattura = fl.id_fattura
+                WHERE f.id_corso = {placeholder}
+                GROUP BY f.id_fattura
+                ORDER BY f.data_fattura DESC
+            """, (corso_scelto,))
+            fatture_corso = cursor.fetchall()
+
+            if lezioni_non_fatturate == 0 and totale_lezioni > 0:
+                corso_status = "✅ Corso completamente fatturato"
+            elif lezioni_non_fatturate > 0:
+                corso_status = f"⚠️ Mancano {lezioni_non_fatturate} lezioni da fatturare su un totale di {totale_lezioni}"
+            else:
+                corso_status = "❌ Nessuna lezione presente per questo corso"
 
-        ore_totali_corso = totale_lezioni
-        conn.close()
+            ore_totali_corso = totale_lezioni
 
         for lezione in lezioni_fatturate:
             inizio = datetime.strptime(lezione["ora_inizio"], "%H:%M")
@@ -224,44 +212,44 @@ def fattura_corso():
         flash("Seleziona un corso valido.", "danger")
         return redirect(url_for("fatture.index"))
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     if request.method == "POST":
         fattura_tutto = sanitize_input(request.form.get("fattura_tutto"))
         lezioni_selezionate = request.form.getlist("lezioni")
         mese_corrente = datetime.now().strftime("%Y-%m")
 
-        if fattura_tutto:
-            placeholder = get_placeholder()
-            cursor.execute(f"""
-                UPDATE lezioni
-                SET fatturato = 1, mese_fatturato = {placeholder}
-                WHERE id_corso = {placeholder} AND fatturato = 0
-            """, (mese_corrente, corso_scelto))
-        else:
-            for id_lezione in lezioni_selezionate:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            if fattura_tutto:
                 placeholder = get_placeholder()
                 cursor.execute(f"""
                     UPDATE lezioni
                     SET fatturato = 1, mese_fatturato = {placeholder}
-                    WHERE id = {placeholder}
-                """, (mese_corrente, id_lezione))
-
-        conn.commit()
-        conn.close()
+                    WHERE id_corso = {placeholder} AND fatturato = 0
+                """, (mese_corrente, corso_scelto))
+            else:
+                for id_lezione in lezioni_selezionate:
+                    placeholder = get_placeholder()
+                    cursor.execute(f"""
+                        UPDATE lezioni
+                        SET fatturato = 1, mese_fatturato = {placeholder}
+                        WHERE id = {placeholder}
+                    """, (mese_corrente, id_lezione))
+
+            aggiorna_riepilogo(cursor, {corso_scelto} | corsi_delle_lezioni(cursor, lezioni_selezionate))
+            conn.commit()
         flash("Lezione/i fatturata/e con successo!", "success")
         return redirect(url_for("fatture.index", corso_scelto=corso_scelto))
 
-    placeholder = get_placeholder()
-    cursor.execute(f"""
-        SELECT id, data, ora_inizio, ora_fine
-        FROM lezioni
-        WHERE id_corso = {placeholder} AND fatturato = 0
-        ORDER BY data
-    """, (corso_scelto,))
-    lezioni_non_fatturate_rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        placeholder = get_placeholder()
+        cursor.execute(f"""
+            SELECT id, data, ora_inizio, ora_fine
+            FROM lezioni
+            WHERE id_corso = {placeholder} AND fatturato = 0
+            ORDER BY data
+        """, (corso_scelto,))
+        lezioni_non_fatturate_rows = cursor.fetchall()
 
     lezioni_non_fatturate = [
         {"id": row["id"], "data": row["data"], "ora_inizio": row["ora_inizio"], "ora_fine": row["ora_fine"]}
@@ -277,195 +265,177 @@ def fattura_corso():
 @login_required
 def aggiungi_fattura():
     """Pagina per aggiungere una nuova fattura con tutti i dettagli"""
-    conn_read = None
-    conn_write = None
-
     corso_preselezionato = sanitize_input(request.args.get("corso", default="", type=str))
 
     try:
-        conn_read = get_db_connection()
-        cursor_read = conn_read.cursor()
-
-        cursor_read.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
-        corsi = [row[0] for row in cursor_read.fetchall()]
-
-        cursor_read.execute("""
-            SELECT DISTINCT c.cliente
-            FROM corsi c
-            WHERE c.cliente IS NOT NULL AND c.cliente != ''
-            ORDER BY c.cliente
-        """)
-        clienti = [row[0] for row in cursor_read.fetchall()]
-
-        cursor_read.execute("""
-            SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
-                   COALESCE(c.cliente, 'Sconosciuto') as cliente
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            WHERE l.fatturato = 0
-            ORDER BY l.id_corso, l.data
-        """)
-        lezioni_non_fatturate = cursor_read.fetchall()
+        with db_connection() as conn_read:
+            cursor_read = conn_read.cursor()
+
+            cursor_read.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
+            corsi = [row[0] for row in cursor_read.fetchall()]
+
+            cursor_read.execute("""
+                SELECT DISTINCT c.cliente
+                FROM corsi c
+                WHERE c.cliente IS NOT NULL AND c.cliente != ''
+                ORDER BY c.cliente
+            """)
+            clienti = [row[0] for row in cursor_read.fetchall()]
+
+            cursor_read.execute("""
+                SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
+                       COALESCE(c.cliente, 'Sconosciuto') as cliente
+                FROM lezioni l
+                LEFT JOIN corsi c ON l.id_corso = c.id_corso
+                WHERE l.fatturato = 0
+                ORDER BY l.id_corso, l.data
+            """)
+            lezioni_non_fatturate = cursor_read.fetchall()
 
     except Exception as e:
         flash(f"❌ Errore durante il caricamento dei dati: {str(e)}", "danger")
         return render_template("aggiungi_fattura.html", corsi=[], lezioni=[], clienti=[], now=get_local_now(), corso_preselezionato="")
-    finally:
-        if conn_read:
-            conn_read.close()
 
     if request.method == "POST":
         try:
-            conn_write = get_db_connection()
-            cursor_write = conn_write.cursor()
-
-            numero_fattura = sanitize_input(request.form.get("numero_fattura"))
-            data_fattura = request.form.get("data_fattura")
-            importo = float(request.form.get("importo"))
-            tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
-            if tipo_fatturazione not in ['parziale', 'totale']:
-                tipo_fatturazione = 'totale'
-            print(f"DEBUG: tipo_fatturazione = {tipo_fatturazione}")
-            note = sanitize_input(request.form.get("note", ""))
-            lezioni_selezionate = request.form.getlist("lezioni")
-
-            if not lezioni_selezionate:
-                flash("❌ Devi selezionare almeno una lezione per creare una fattura.", "danger")
-                return render_template("aggiungi_fattura.html", corsi=corsi, lezioni=lezioni_non_fatturate,
-                                       clienti=clienti, now=get_local_now(), corso_preselezionato=corso_preselezionato)
-
-            anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
-            placeholder = get_placeholder()
-            cursor_write.execute(f"SELECT numero_fattura, data_fattura FROM fatture WHERE numero_fattura = {placeholder}", (numero_fattura,))
-            fatture_esistenti = cursor_write.fetchall()
-
-            for fattura_esistente in fatture_esistenti:
-                anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
-                if anno_esistente == anno_fattura:
-                    flash(f"❌ Esiste già una fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}. Scegli un numero diverso.", "danger")
+            with db_connection() as conn_write:
+                cursor_write = conn_write.cursor()
+
+                numero_fattura = sanitize_input(request.form.get("numero_fattura"))
+                data_fattura = request.form.get("data_fattura")
+                importo = float(request.form.get("importo"))
+                tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
+                if tipo_fatturazione not in ['parziale', 'totale']:
+                    tipo_fatturazione = 'totale'
+                print(f"DEBUG: tipo_fatturazione = {tipo_fatturazione}")
+                note = sanitize_input(request.form.get("note", ""))
+                lezioni_selezionate = request.form.getlist("lezioni")
+
+                if not lezioni_selezionate:
+                    flash("❌ Devi selezionare almeno una lezione per creare una fattura.", "danger")
                     return render_template("aggiungi_fattura.html", corsi=corsi, lezioni=lezioni_non_fatturate,
                                            clienti=clienti, now=get_local_now(), corso_preselezionato=corso_preselezionato)
 
-            file_pdf = ""
-            if 'file_pdf' in request.files:
-                file = request.files['file_pdf']
-                if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    timestamp = format_datetime_for_db().replace('-', '').replace(' ', '').replace(':', '')
-                    filename = f"{timestamp}_{filename}"
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(file_path)
-                    file_pdf = filename
-
-            id_corso_principale = ""
-            if lezioni_selezionate:
+                anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
                 placeholder = get_placeholder()
-                cursor_write.execute(f"SELECT id_corso FROM lezioni WHERE id = {placeholder} LIMIT 1", (lezioni_selezionate[0],))
-                corso_result = cursor_write.fetchone()
-                if corso_result:
-                    id_corso_principale = corso_result['id_corso']
-
-            placeholder = get_placeholder()
-            cursor_write.execute(f"""
-                INSERT INTO fatture (numero_fattura, id_corso, data_fattura, importo, tipo_fatturazione, note, file_pdf)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-                RETURNING id_fattura
-            """, (str(numero_fattura), id_corso_principale, data_fattura, importo, str(tipo_fatturazione), note, file_pdf))
+                cursor_write.execute(f"SELECT numero_fattura, data_fattura FROM fatture WHERE numero_fattura = {placeholder}", (numero_fattura,))
+                fatture_esistenti = cursor_write.fetchall()
+
+                for fattura_esistente in fatture_esistenti:
+                    anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
+                    if anno_esistente == anno_fattura:
+                        flash(f"❌ Esiste già una fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}. Scegli un numero diverso.", "danger")
+                        return render_template("aggiungi_fattura.html", corsi=corsi, lezioni=lezioni_non_fatturate,
+                                               clienti=clienti, now=get_local_now(), corso_preselezionato=corso_preselezionato)
+
+                file_pdf = salva_pdf_fattura(request.files.get('file_pdf')) or ""
+
+                id_corso_principale = ""
+                if lezioni_selezionate:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"SELECT id_corso FROM lezioni WHERE id = {placeholder} LIMIT 1", (lezioni_selezionate[0],))
+                    corso_result = cursor_write.fetchone()
+                    if corso_result:
+                        id_corso_principale = corso_result['id_corso']
 
-            id_fattura = cursor_write.fetchone()[0]
-            mese_fatturato = datetime.strptime(data_fattura, "%Y-%m-%d").strftime("%Y-%m")
-            tipo_fatturazione_val = 1
-
-            for id_lezione in lezioni_selezionate:
                 placeholder = get_placeholder()
                 cursor_write.execute(f"""
-                    UPDATE lezioni
-                    SET fatturato = {placeholder}, mese_fatturato = {placeholder}
-                    WHERE id = {placeholder}
-                """, (tipo_fatturazione_val, mese_fatturato, id_lezione))
+                    INSERT INTO fatture (numero_fattura, id_corso, data_fattura, importo, tipo_fatturazione, note, file_pdf)
+                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                    RETURNING id_fattura
+                """, (str(numero_fattura), id_corso_principale, data_fattura, importo, str(tipo_fatturazione), note, file_pdf))
+
+                id_fattura = cursor_write.fetchone()[0]
+                mese_fatturato = datetime.strptime(data_fattura, "%Y-%m-%d").strftime("%Y-%m")
+                tipo_fatturazione_val = 1
+
+                for id_lezione in lezioni_selezionate:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        UPDATE lezioni
+                        SET fatturato = {placeholder}, mese_fatturato = {placeholder}
+                        WHERE id = {placeholder}
+                    """, (tipo_fatturazione_val, mese_fatturato, id_lezione))
+
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        INSERT INTO fatture_lezioni (id_fattura, id_lezione)
+                        VALUES ({placeholder}, {placeholder})
+                    """, (id_fattura, id_lezione))
+
+                if lezioni_selezionate:
+                    placeholder = get_placeholder()
+                    placeholders = ','.join([placeholder] * len(lezioni_selezionate))
+                    cursor_write.execute(f"""
+                        SELECT DISTINCT id_corso FROM lezioni
+                        WHERE id IN ({placeholders})
+                    """, lezioni_selezionate)
+                    corsi_selezionati = [row['id_corso'] for row in cursor_write.fetchall()]
+                else:
+                    corsi_selezionati = []
+
+                for id_corso in corsi_selezionati:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        SELECT COUNT(*) as totale,
+                               SUM(CASE WHEN fatturato > 0 THEN 1 ELSE 0 END) as fatturate
+                        FROM lezioni
+                        WHERE id_corso = {placeholder}
+                    """, (id_corso,))
+
+                    result = cursor_write.fetchone()
+                    if result and result['totale'] > 0 and result['totale'] == result['fatturate']:
+                        safe_id = sanitize_sql_identifier(id_corso)
+                        savepoint_name = f"archive_corso_{safe_id}"
+                        cursor_write.execute(f"SAVEPOINT {savepoint_name}")
+
+                        try:
+                            placeholder = get_placeholder()
+                            cursor_write.execute(f"SELECT * FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
+                            lezioni = cursor_write.fetchall()
+
+                            for lezione in lezioni:
+                                placeholder = get_placeholder()
+                                cursor_write.execute(f"""
+                                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, durata_minuti, importo)
+                                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                                """, (
+                                    lezione["id_corso"], lezione["materia"], lezione["data"],
+                                    lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
+                                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"],
+                                    *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
+                                ))
 
-                placeholder = get_placeholder()
-                cursor_write.execute(f"""
-                    INSERT INTO fatture_lezioni (id_fattura, id_lezione)
-                    VALUES ({placeholder}, {placeholder})
-                """, (id_fattura, id_lezione))
+                            placeholder = get_placeholder()
+                            cursor_write.execute(f"SELECT * FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
+                            corso = cursor_write.fetchone()
 
-            if lezioni_selezionate:
-                placeholder = get_placeholder()
-                placeholders = ','.join([placeholder] * len(lezioni_selezionate))
-                cursor_write.execute(f"""
-                    SELECT DISTINCT id_corso FROM lezioni
-                    WHERE id IN ({placeholders})
-                """, lezioni_selezionate)
-                corsi_selezionati = [row['id_corso'] for row in cursor_write.fetchall()]
-            else:
-                corsi_selezionati = []
+                            if corso:
+                                data_archiviazione = format_datetime_for_db()
+                                placeholder = get_placeholder()
+                                cursor_write.execute(f"""
+                                    INSERT INTO corsi_archiviati (id_corso, nome, cliente, data_archiviazione)
+                                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+                                """, (corso["id_corso"], corso["nome"], dict(corso).get("cliente", ""), data_archiviazione))
 
-            for id_corso in corsi_selezionati:
-                placeholder = get_placeholder()
-                cursor_write.execute(f"""
-                    SELECT COUNT(*) as totale,
-                           SUM(CASE WHEN fatturato > 0 THEN 1 ELSE 0 END) as fatturate
-                    FROM lezioni
-                    WHERE id_corso = {placeholder}
-                """, (id_corso,))
-
-                result = cursor_write.fetchone()
-                if result and result['totale'] > 0 and result['totale'] == result['fatturate']:
-                    safe_id = sanitize_sql_identifier(id_corso)
-                    savepoint_name = f"archive_corso_{safe_id}"
-                    cursor_write.execute(f"SAVEPOINT {savepoint_name}")
-
-                    try:
-                        placeholder = get_placeholder()
-                        cursor_write.execute(f"SELECT * FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
-                        lezioni = cursor_write.fetchall()
-
-                        for lezione in lezioni:
                             placeholder = get_placeholder()
-                            cursor_write.execute(f"""
-                                INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato)
-                                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-                            """, (
-                                lezione["id_corso"], lezione["materia"], lezione["data"],
-                                lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
-                                lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"]
-                            ))
-
-                        placeholder = get_placeholder()
-                        cursor_write.execute(f"SELECT * FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
-                        corso = cursor_write.fetchone()
-
-                        if corso:
-                            data_archiviazione = format_datetime_for_db()
+                            cursor_write.execute(f"DELETE FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
                             placeholder = get_placeholder()
-                            cursor_write.execute(f"""
-                                INSERT INTO corsi_archiviati (id_corso, nome, cliente, data_archiviazione)
-                                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
-                            """, (corso["id_corso"], corso["nome"], corso.get("cliente", ""), data_archiviazione))
-
-                        placeholder = get_placeholder()
-                        cursor_write.execute(f"DELETE FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
-                        placeholder = get_placeholder()
-                        cursor_write.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
-
-                        cursor_write.execute(f"RELEASE SAVEPOINT {savepoint_name}")
-                        flash(f"✅ Corso '{id_corso}' completamente fatturato e archiviato automaticamente!", "success")
-                    except Exception as e:
-                        cursor_write.execute(f"ROLLBACK TO SAVEPOINT {savepoint_name}")
-                        print(f"Errore durante l'archiviazione automatica del corso: {e}")
-
-            conn_write.commit()
-            flash("✅ Fattura aggiunta con successo!", "success")
-            return redirect(url_for("fatture.index"))
+                            cursor_write.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
+
+                            cursor_write.execute(f"RELEASE SAVEPOINT {savepoint_name}")
+                            flash(f"✅ Corso '{id_corso}' completamente fatturato e archiviato automaticamente!", "success")
+                        except Exception as e:
+                            cursor_write.execute(f"ROLLBACK TO SAVEPOINT {savepoint_name}")
+                            print(f"Errore durante l'archiviazione automatica del corso: {e}")
+
+                aggiorna_riepilogo(cursor_write, corsi_selezionati)
+                conn_write.commit()
+                flash("✅ Fattura aggiunta con successo!", "success")
+                return redirect(url_for("fatture.index"))
 
         except Exception as e:
-            if conn_write:
-                conn_write.rollback()
             flash(f"❌ Errore durante l'aggiunta della fattura: {str(e)}", "danger")
-        finally:
-            if conn_write:
-                conn_write.close()
 
     return render_template("aggiungi_fattura.html", corsi=corsi, lezioni=lezioni_non_fatturate,
                            clienti=clienti, now=get_local_now(), corso_preselezionato=corso_preselezionato)
@@ -481,90 +451,75 @@ def aggiungi_fattura_progetto():
     clienti = []
     progetti = []
     try:
-        conn_read = get_db_connection()
-        cursor_read = conn_read.cursor()
-        cursor_read.execute("""
-            SELECT DISTINCT cliente FROM corsi WHERE cliente IS NOT NULL AND cliente != ''
-            UNION
-            SELECT DISTINCT cliente FROM fatture WHERE cliente IS NOT NULL AND cliente != ''
-            ORDER BY cliente
-        """)
-        clienti = [row[0] for row in cursor_read.fetchall()]
-        cursor_read.execute("""
-            SELECT DISTINCT progetto FROM fatture
-            WHERE progetto IS NOT NULL AND progetto != ''
-            ORDER BY progetto
-        """)
-        progetti = [row[0] for row in cursor_read.fetchall()]
-        conn_read.close()
+        with db_connection() as conn_read:
+            cursor_read = conn_read.cursor()
+            cursor_read.execute("""
+                SELECT DISTINCT cliente FROM corsi WHERE cliente IS NOT NULL AND cliente != ''
+                UNION
+                SELECT DISTINCT cliente FROM fatture WHERE cliente IS NOT NULL AND cliente != ''
+                ORDER BY cliente
+            """)
+            clienti = [row[0] for row in cursor_read.fetchall()]
+            cursor_read.execute("""
+                SELECT DISTINCT progetto FROM fatture
+                WHERE progetto IS NOT NULL AND progetto != ''
+                ORDER BY progetto
+            """)
+            progetti = [row[0] for row in cursor_read.fetchall()]
     except Exception as e:
         flash(f"❌ Errore durante il caricamento dei dati: {str(e)}", "danger")
 
     if request.method == "POST":
-        conn_write = None
         try:
-            conn_write = get_db_connection()
-            cursor_write = conn_write.cursor()
-            placeholder = get_placeholder()
+            with db_connection() as conn_write:
+                cursor_write = conn_write.cursor()
+                placeholder = get_placeholder()
 
-            numero_fattura = sanitize_input(request.form.get("numero_fattura"))
-            data_fattura = request.form.get("data_fattura")
-            importo = float(request.form.get("importo"))
-            cliente = sanitize_input(request.form.get("cliente", ""))
-            progetto = sanitize_input(request.form.get("progetto", ""))
-            tranche = sanitize_input(request.form.get("tranche", ""))
-            tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
-            if tipo_fatturazione not in ['parziale', 'totale']:
-                tipo_fatturazione = 'totale'
-            note = sanitize_input(request.form.get("note", ""))
-
-            if not numero_fattura or not data_fattura or not cliente:
-                flash("❌ Numero fattura, data e cliente sono obbligatori.", "danger")
-                return render_template("aggiungi_fattura_progetto.html",
-                                       clienti=clienti, progetti=progetti, now=get_local_now())
-
-            # Controllo duplicato numero per anno (la numerazione si azzera ogni anno)
-            anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
-            cursor_write.execute(
-                f"SELECT data_fattura FROM fatture WHERE numero_fattura = {placeholder}",
-                (numero_fattura,))
-            for fattura_esistente in cursor_write.fetchall():
-                anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
-                if anno_esistente == anno_fattura:
-                    flash(f"❌ Esiste già una fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}.", "danger")
+                numero_fattura = sanitize_input(request.form.get("numero_fattura"))
+                data_fattura = request.form.get("data_fattura")
+                importo = float(request.form.get("importo"))
+                cliente = sanitize_input(request.form.get("cliente", ""))
+                progetto = sanitize_input(request.form.get("progetto", ""))
+                tranche = sanitize_input(request.form.get("tranche", ""))
+                tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
+                if tipo_fatturazione not in ['parziale', 'totale']:
+                    tipo_fatturazione = 'totale'
+                note = sanitize_input(request.form.get("note", ""))
+
+                if not numero_fattura or not data_fattura or not cliente:
+                    flash("❌ Numero fattura, data e cliente sono obbligatori.", "danger")
                     return render_template("aggiungi_fattura_progetto.html",
                                            clienti=clienti, progetti=progetti, now=get_local_now())
 
-            # File PDF opzionale
-            file_pdf = ""
-            if 'file_pdf' in request.files:
-                file = request.files['file_pdf']
-                if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    timestamp = format_datetime_for_db().replace('-', '').replace(' ', '').replace(':', '')
-                    filename = f"{timestamp}_{filename}"
-                    file.save(os.path.join(UPLOAD_FOLDER, filename))
-                    file_pdf = filename
-
-            cursor_write.execute(f"""
-                INSERT INTO fatture (numero_fattura, id_corso, data_fattura, importo, tipo_fatturazione,
-                                     note, file_pdf, cliente, progetto, tranche)
-                VALUES ({placeholder}, NULL, {placeholder}, {placeholder}, {placeholder},
-                        {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-            """, (str(numero_fattura), data_fattura, importo, str(tipo_fatturazione),
-                  note, file_pdf, cliente, progetto or None, tranche or None))
-
-            conn_write.commit()
-            flash("✅ Fattura di progetto aggiunta con successo!", "success")
-            return redirect(url_for("fatture.index"))
+                # Controllo duplicato numero per anno (la numerazione si azzera ogni anno)
+                anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
+                cursor_write.execute(
+                    f"SELECT data_fattura FROM fatture WHERE numero_fattura = {placeholder}",
+                    (numero_fattura,))
+                for fattura_esistente in cursor_write.fetchall():
+                    anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
+                    if anno_esistente == anno_fattura:
+                        flash(f"❌ Esiste già una fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}.", "danger")
+                        return render_template("aggiungi_fattura_progetto.html",
+                                               clienti=clienti, progetti=progetti, now=get_local_now())
+
+                # File PDF opzionale
+                file_pdf = salva_pdf_fattura(request.files.get('file_pdf')) or ""
+
+                cursor_write.execute(f"""
+                    INSERT INTO fatture (numero_fattura, id_corso, data_fattura, importo, tipo_fatturazione,
+                                         note, file_pdf, cliente, progetto, tranche)
+                    VALUES ({placeholder}, NULL, {placeholder}, {placeholder}, {placeholder},
+                            {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                """, (str(numero_fattura), data_fattura, importo, str(tipo_fatturazione),
+                      note, file_pdf, cliente, progetto or None, tranche or None))
+
+                conn_write.commit()
+                flash("✅ Fattura di progetto aggiunta con successo!", "success")
+                return redirect(url_for("fatture.index"))
 
         except Exception as e:
-            if conn_write:
-                conn_write.rollback()
             flash(f"❌ Errore durante l'aggiunta della fattura: {str(e)}", "danger")
-        finally:
-            if conn_write:
-                conn_write.close()
 
     return render_template("aggiungi_fattura_progetto.html",
                            clienti=clienti, progetti=progetti, now=get_local_now())
@@ -576,160 +531,145 @@ def aggiungi_fattura_progetto():
 @login_required
 def modifica_fattura(id_fattura):
     """Pagina per modificare una fattura esistente"""
-    conn_read = None
-    conn_write = None
-
     try:
-        conn_read = get_db_connection()
-        cursor_read = conn_read.cursor()
-
-        placeholder = get_placeholder()
-        cursor_read.execute(f"SELECT * FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
-        fattura = cursor_read.fetchone()
-
-        if not fattura:
-            flash("❌ Fattura non trovata.", "danger")
-            return redirect(url_for("fatture.index"))
+        with db_connection() as conn_read:
+            cursor_read = conn_read.cursor()
 
-        cursor_read.execute(f"SELECT id_lezione FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
-        lezioni_associate = [row['id_lezione'] for row in cursor_read.fetchall()]
+            placeholder = get_placeholder()
+            cursor_read.execute(f"SELECT * FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
+            fattura = cursor_read.fetchone()
+
+            if not fattura:
+                flash("❌ Fattura non trovata.", "danger")
+                return redirect(url_for("fatture.index"))
+
+            cursor_read.execute(f"SELECT id_lezione FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
+            lezioni_associate = [row['id_lezione'] for row in cursor_read.fetchall()]
+
+            if lezioni_associate:
+                placeholders = ','.join([get_placeholder()] * len(lezioni_associate))
+                cursor_read.execute(f"""
+                    SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
+                           COALESCE(c.cliente, 'Sconosciuto') as cliente
+                    FROM lezioni l
+                    LEFT JOIN corsi c ON l.id_corso = c.id_corso
+                    WHERE l.fatturato = 0 OR l.id IN ({placeholders})
+                    ORDER BY l.id_corso, l.data
+                """, lezioni_associate)
+            else:
+                cursor_read.execute("""
+                    SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
+                           COALESCE(c.cliente, 'Sconosciuto') as cliente
+                    FROM lezioni l
+                    LEFT JOIN corsi c ON l.id_corso = c.id_corso
+                    WHERE l.fatturato = 0
+                    ORDER BY l.id_corso, l.data
+                """)
+            lezioni_disponibili = cursor_read.fetchall()
+
+            cursor_read.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
+            corsi = [row[0] for row in cursor_read.fetchall()]
 
-        if lezioni_associate:
-            placeholders = ','.join([get_placeholder()] * len(lezioni_associate))
-            cursor_read.execute(f"""
-                SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
-                       COALESCE(c.cliente, 'Sconosciuto') as cliente
-                FROM lezioni l
-                LEFT JOIN corsi c ON l.id_corso = c.id_corso
-                WHERE l.fatturato = 0 OR l.id IN ({placeholders})
-                ORDER BY l.id_corso, l.data
-            """, lezioni_associate)
-        else:
             cursor_read.execute("""
-                SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, l.compenso_orario,
-                       COALESCE(c.cliente, 'Sconosciuto') as cliente
-                FROM lezioni l
-                LEFT JOIN corsi c ON l.id_corso = c.id_corso
-                WHERE l.fatturato = 0
-                ORDER BY l.id_corso, l.data
+                SELECT DISTINCT c.cliente
+                FROM corsi c
+                WHERE c.cliente IS NOT NULL AND c.cliente != ''
+                ORDER BY c.cliente
             """)
-        lezioni_disponibili = cursor_read.fetchall()
-
-        cursor_read.execute("SELECT DISTINCT id_corso FROM lezioni ORDER BY id_corso")
-        corsi = [row[0] for row in cursor_read.fetchall()]
-
-        cursor_read.execute("""
-            SELECT DISTINCT c.cliente
-            FROM corsi c
-            WHERE c.cliente IS NOT NULL AND c.cliente != ''
-            ORDER BY c.cliente
-        """)
-        clienti = [row[0] for row in cursor_read.fetchall()]
+            clienti = [row[0] for row in cursor_read.fetchall()]
 
     except Exception as e:
         flash(f"❌ Errore durante il caricamento dei dati: {str(e)}", "danger")
         return redirect(url_for("fatture.index"))
-    finally:
-        if conn_read:
-            conn_read.close()
 
     if request.method == "POST":
         try:
-            conn_write = get_db_connection()
-            cursor_write = conn_write.cursor()
-
-            numero_fattura = sanitize_input(request.form.get("numero_fattura"))
-            data_fattura = request.form.get("data_fattura")
-            importo = float(request.form.get("importo"))
-            tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
-            if tipo_fatturazione not in ['parziale', 'totale']:
-                tipo_fatturazione = 'totale'
-            note = sanitize_input(request.form.get("note", ""))
-            lezioni_selezionate = request.form.getlist("lezioni")
-
-            if not lezioni_selezionate:
-                flash("❌ Devi selezionare almeno una lezione per la fattura.", "danger")
-                return render_template("modifica_fattura.html", fattura=fattura, corsi=corsi,
-                                       lezioni=lezioni_disponibili, clienti=clienti,
-                                       lezioni_associate=lezioni_associate, now=get_local_now())
-
-            anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
-            placeholder = get_placeholder()
-            cursor_write.execute(f"""
-                SELECT numero_fattura, data_fattura, id_fattura
-                FROM fatture
-                WHERE numero_fattura = {placeholder} AND id_fattura != {placeholder}
-            """, (numero_fattura, id_fattura))
-            fatture_esistenti = cursor_write.fetchall()
-
-            for fattura_esistente in fatture_esistenti:
-                anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
-                if anno_esistente == anno_fattura:
-                    flash(f"❌ Esiste già un'altra fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}.", "danger")
+            with db_connection() as conn_write:
+                cursor_write = conn_write.cursor()
+
+                numero_fattura = sanitize_input(request.form.get("numero_fattura"))
+                data_fattura = request.form.get("data_fattura")
+                importo = float(request.form.get("importo"))
+                tipo_fatturazione = sanitize_input(request.form.get("tipo_fatturazione", "totale"))
+                if tipo_fatturazione not in ['parziale', 'totale']:
+                    tipo_fatturazione = 'totale'
+                note = sanitize_input(request.form.get("note", ""))
+                lezioni_selezionate = request.form.getlist("lezioni")
+
+                if not lezioni_selezionate:
+                    flash("❌ Devi selezionare almeno una lezione per la fattura.", "danger")
                     return render_template("modifica_fattura.html", fattura=fattura, corsi=corsi,
                                            lezioni=lezioni_disponibili, clienti=clienti,
                                            lezioni_associate=lezioni_associate, now=get_local_now())
 
-            file_pdf = fattura['file_pdf']
-            if 'file_pdf' in request.files:
-                file = request.files['file_pdf']
-                if file and file.filename and allowed_file(file.filename):
+                anno_fattura = datetime.strptime(data_fattura, "%Y-%m-%d").year
+                placeholder = get_placeholder()
+                cursor_write.execute(f"""
+                    SELECT numero_fattura, data_fattura, id_fattura
+                    FROM fatture
+                    WHERE numero_fattura = {placeholder} AND id_fattura != {placeholder}
+                """, (numero_fattura, id_fattura))
+                fatture_esistenti = cursor_write.fetchall()
+
+                for fattura_esistente in fatture_esistenti:
+                    anno_esistente = datetime.strptime(fattura_esistente['data_fattura'], "%Y-%m-%d").year
+                    if anno_esistente == anno_fattura:
+                        flash(f"❌ Esiste già un'altra fattura con il numero '{numero_fattura}' per l'anno {anno_fattura}.", "danger")
+                        return render_template("modifica_fattura.html", fattura=fattura, corsi=corsi,
+                                               lezioni=lezioni_disponibili, clienti=clienti,
+                                               lezioni_associate=lezioni_associate, now=get_local_now())
+
+                file_pdf = fattura['file_pdf']
+                nuovo_pdf = salva_pdf_fattura(request.files.get('file_pdf'))
+                if nuovo_pdf:
                     if fattura['file_pdf']:
                         old_file_path = os.path.join(UPLOAD_FOLDER, fattura['file_pdf'])
-                        if os.path.exists(old_file_path):
+                        if os.path.exists(old_file_path) and fattura['file_pdf'] != nuovo_pdf:
+                            invalida_file(old_file_path)
                             os.remove(old_file_path)
-                    filename = secure_filename(file.filename)
-                    timestamp = format_datetime_for_db().replace('-', '').replace(' ', '').replace(':', '')
-                    filename = f"{timestamp}_{filename}"
-                    file_path = os.path.join(UPLOAD_FOLDER, filename)
-                    file.save(file_path)
-                    file_pdf = filename
+                    file_pdf = nuovo_pdf
 
-            placeholder = get_placeholder()
-            cursor_write.execute(f"""
-                UPDATE fatture
-                SET numero_fattura = {placeholder}, data_fattura = {placeholder}, importo = {placeholder},
-                    tipo_fatturazione = {placeholder}, note = {placeholder}, file_pdf = {placeholder}
-                WHERE id_fattura = {placeholder}
-            """, (str(numero_fattura), data_fattura, importo, str(tipo_fatturazione), note, file_pdf, id_fattura))
-
-            lezioni_selezionate_int = [int(l) for l in lezioni_selezionate]
-            lezioni_da_rimuovere = set(lezioni_associate) - set(lezioni_selezionate_int)
-            lezioni_da_aggiungere = set(lezioni_selezionate_int) - set(lezioni_associate)
-            mese_fatturato = datetime.strptime(data_fattura, "%Y-%m-%d").strftime("%Y-%m")
-
-            for id_lezione in lezioni_da_rimuovere:
                 placeholder = get_placeholder()
                 cursor_write.execute(f"""
-                    UPDATE lezioni SET fatturato = 0, mese_fatturato = NULL WHERE id = {placeholder}
-                """, (id_lezione,))
+                    UPDATE fatture
+                    SET numero_fattura = {placeholder}, data_fattura = {placeholder}, importo = {placeholder},
+                        tipo_fatturazione = {placeholder}, note = {placeholder}, file_pdf = {placeholder}
+                    WHERE id_fattura = {placeholder}
+                """, (str(numero_fattura), data_fattura, importo, str(tipo_fatturazione), note, file_pdf, id_fattura))
+
+                lezioni_selezionate_int = [int(l) for l in lezioni_selezionate]
+                lezioni_da_rimuovere = set(lezioni_associate) - set(lezioni_selezionate_int)
+                lezioni_da_aggiungere = set(lezioni_selezionate_int) - set(lezioni_associate)
+                mese_fatturato = datetime.strptime(data_fattura, "%Y-%m-%d").strftime("%Y-%m")
+
+                for id_lezione in lezioni_da_rimuovere:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        UPDATE lezioni SET fatturato = 0, mese_fatturato = NULL WHERE id = {placeholder}
+                    """, (id_lezione,))
+
+                for id_lezione in lezioni_da_aggiungere:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        UPDATE lezioni SET fatturato = 1, mese_fatturato = {placeholder} WHERE id = {placeholder}
+                    """, (mese_fatturato, id_lezione))
 
-            for id_lezione in lezioni_da_aggiungere:
                 placeholder = get_placeholder()
-                cursor_write.execute(f"""
-                    UPDATE lezioni SET fatturato = 1, mese_fatturato = {placeholder} WHERE id = {placeholder}
-                """, (mese_fatturato, id_lezione))
+                cursor_write.execute(f"DELETE FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
 
-            placeholder = get_placeholder()
-            cursor_write.execute(f"DELETE FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
+                for id_lezione in lezioni_selezionate_int:
+                    placeholder = get_placeholder()
+                    cursor_write.execute(f"""
+                        INSERT INTO fatture_lezioni (id_fattura, id_lezione) VALUES ({placeholder}, {placeholder})
+                    """, (id_fattura, id_lezione))
 
-            for id_lezione in lezioni_selezionate_int:
-                placeholder = get_placeholder()
-                cursor_write.execute(f"""
-                    INSERT INTO fatture_lezioni (id_fattura, id_lezione) VALUES ({placeholder}, {placeholder})
-                """, (id_fattura, id_lezione))
-
-            conn_write.commit()
-            flash("✅ Fattura modificata con successo!", "success")
-            return redirect(url_for("fatture.index"))
+                aggiorna_riepilogo(cursor_write, corsi_delle_lezioni(cursor_write, lezioni_da_rimuovere | lezioni_da_aggiungere))
+                conn_write.commit()
+                flash("✅ Fattura modificata con successo!", "success")
+                return redirect(url_for("fatture.index"))
 
         except Exception as e:
-            if conn_write:
-                conn_write.rollback()
             flash(f"❌ Errore durante la modifica della fattura: {str(e)}", "danger")
-        finally:
-            if conn_write:
-                conn_write.close()
 
     return render_template("modifica_fattura.html", fattura=fattura, corsi=corsi, lezioni=lezioni_disponibili,
                            clienti=clienti, lezioni_associate=lezioni_associate, now=get_local_now())
@@ -751,48 +691,284 @@ def download_file(filename):
 @login_required
 def elimina_fattura(id_fattura):
     """Elimina una fattura e ripristina lo stato delle lezioni associate"""
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        placeholder = get_placeholder()
-        cursor.execute(f"SELECT file_pdf FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
-        fattura = cursor.fetchone()
+        with db_connection() as conn:
+            cursor = conn.cursor()
 
-        placeholder = get_placeholder()
-        cursor.execute(f"SELECT id_lezione FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
-        lezioni = [row["id_lezione"] for row in cursor.fetchall()]
+            placeholder = get_placeholder()
+            cursor.execute(f"SELECT file_pdf FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
+            fattura = cursor.fetchone()
 
-        for id_lezione in lezioni:
             placeholder = get_placeholder()
-            cursor.execute(f"""
-                UPDATE lezioni SET fatturato = 0, mese_fatturato = NULL WHERE id = {placeholder}
-            """, (id_lezione,))
+            cursor.execute(f"SELECT id_lezione FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
+            lezioni = [row["id_lezione"] for row in cursor.fetchall()]
 
-        placeholder = get_placeholder()
-        cursor.execute(f"DELETE FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
-        placeholder = get_placeholder()
-        cursor.execute(f"DELETE FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
+            for id_lezione in lezioni:
+                placeholder = get_placeholder()
+                cursor.execute(f"""
+                    UPDATE lezioni SET fatturato = 0, mese_fatturato = NULL WHERE id = {placeholder}
+                """, (id_lezione,))
 
-        if fattura and fattura["file_pdf"]:
-            file_path = os.path.join(UPLOAD_FOLDER, fattura["file_pdf"])
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            placeholder = get_placeholder()
+            cursor.execute(f"DELETE FROM fatture_lezioni WHERE id_fattura = {placeholder}", (id_fattura,))
+            placeholder = get_placeholder()
+            cursor.execute(f"DELETE FROM fatture WHERE id_fattura = {placeholder}", (id_fattura,))
+            aggiorna_riepilogo(cursor, corsi_delle_lezioni(cursor, lezioni))
 
-        conn.commit()
-        flash("✅ Fattura eliminata con successo!", "success")
+            if fattura and fattura["file_pdf"]:
+                file_path = os.path.join(UPLOAD_FOLDER, fattura["file_pdf"])
+                if os.path.exists(file_path):
+                    invalida_file(file_path)
+                    os.remove(file_path)
+
+            conn.commit()
+            flash("✅ Fattura eliminata con successo!", "success")
     except Exception as e:
-        if conn:
-            conn.rollback()
         flash(f"❌ Errore durante l'eliminazione della fattura: {str(e)}", "danger")
-    finally:
-        if conn:
-            conn.close()
 
     return redirect(url_for("fatture.index"))
 
 
+# ─── Verifica fattura con AI: analisi PDF (worker) e confronto con il DB ──────
+
+def _leggi_ultima_verifica(cursor, id_fattura):
+    """Restituisce (dati_ai, data_verifica) dell'ultima verifica salvata, o (None, None)"""
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        SELECT dati_ai, data_verifica FROM verifiche_fatture
+        WHERE id_fattura = {placeholder}
+        ORDER BY id DESC
+        LIMIT 1
+    """, (id_fattura,))
+    row = cursor.fetchone()
+    if not row:
+        return None, None
+    return json.loads(row['dati_ai']), row['data_verifica']
+
+
+def _analizza_pdf_fattura(pdf_path, client=None, progresso=None, annulla=None, riferimento=None):
+    """Legge il PDF della fattura con Claude Vision e restituisce i dati estratti (dict).
+
+    `client` permette di passare un client Anthropic già pronto (o finto nei test),
+    `annulla` interrompe la conversione del PDF se il lavoro viene annullato.
+    """
+    client, error = crea_client(client)
+    if error:
+        raise RuntimeError(error)
+
+    images = _pdf_to_base64_images_fattura(pdf_path, annulla=annulla)
+    if not images:
+        raise RuntimeError("Impossibile convertire il PDF in immagini.")
+
+    if progresso:
+        progresso(40, "Lettura della fattura con Claude AI")
+    content = [{"type": "text", "text": _PROMPT_ANALISI_FATTURA}]
+    for img_b64 in images:
+        content.append({
+            "type": "image",
+            "source": {"type": "base64", "media_type": "image/jpeg", "data": img_b64}
+        })
+
+    risposta_raw = invia_messaggio(client, [{"role": "user", "content": content}], max_tokens=2000,
+                                   operazione="verifica_fattura", riferimento=riferimento).strip()
+
+    # Pulisci eventuale blocco markdown ```json```
+    if risposta_raw.startswith("```"):
+        parts = risposta_raw.split("```")
+        risposta_raw = parts[1] if len(parts) > 1 else risposta_raw
+        if risposta_raw.startswith("json"):
+            risposta_raw = risposta_raw[4:]
+    risposta_raw = risposta_raw.strip()
+
+    try:
+        return json.loads(risposta_raw)
+    except json.JSONDecodeError:
+        raise ValueError(f"Claude ha risposto ma non in formato JSON valido: {risposta_raw[:300]}") from None
+
+
+@registra_job('verifica_fattura')
+def _job_verifica_fattura(payload, client, progresso):
+    """Eseguito dal worker: analizza il PDF e salva i dati in verifiche_fatture"""
+    pdf_path = payload['pdf_path']
+    try:
+        progresso(10, "Conversione PDF in immagini")
+        dati_ai = _analizza_pdf_fattura(pdf_path, client=client, progresso=progresso,
+                                        annulla=lambda: annullamento_richiesto(payload['id_job']),
+                                        riferimento=payload['id_fattura'])
+    finally:
+        if payload.get('is_temp'):
+            try:
+                os.unlink(pdf_path)
+            except Exception:
+                pass
+
+    progresso(90, "Salvataggio verifica")
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO verifiche_fatture (id_fattura, id_job, dati_ai, data_verifica)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+        """, (payload['id_fattura'], payload.get('id_job'), json.dumps(dati_ai),
+              datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+
+    return {"id_fattura": payload['id_fattura'], "dati_ai": dati_ai}
+
+
+def _controlli_fattura(fattura, dati_ai, ore_db, importo_atteso, corsi_in_fattura,
+                       monte_ore_contratto, ore_totali_corso_fatturate):
+    """Confronta i dati letti dall'AI con quelli del DB e restituisce la lista dei controlli"""
+    checks = []
+
+    # 1. Numero fattura
+    num_ai = dati_ai.get('numero_fattura')
+    num_db = fattura['numero_fattura']
+    if num_ai:
+        uguali = str(num_ai).strip() == str(num_db).strip()
+        checks.append({
+            'label': 'Numero fattura',
+            'stato': 'ok' if uguali else 'warn',
+            'ai': num_ai, 'db': num_db,
+            'messaggio': 'Numero fattura conforme' if uguali else f'PDF: "{num_ai}" · DB: "{num_db}"'
+        })
+
+    # 2. Corso (gestisce sia mono-corso che multi-corso)
+    corsi_ai = dati_ai.get('corsi')  # array opzionale per fatture multi-corso
+    codice_ai = dati_ai.get('codice_corso') or dati_ai.get('nome_corso') or ''
+    id_corso_db = fattura['id_corso'] or ''
+    nome_corso_db = fattura['nome_corso'] or ''
+
+    if corsi_ai and isinstance(corsi_ai, list) and len(corsi_ai) > 1:
+        # Fattura multi-corso: mostra riepilogo info
+        ore_totale_corsi = sum(float(c.get('ore') or 0) for c in corsi_ai)
+        # Riepilogo: mostra le ore solo se disponibili nel PDF
+        riepilogo_corsi = ' · '.join(
+            f"{c.get('codice','?')} ({c.get('ore')}h)" if c.get('ore') else f"{c.get('codice','?')}"
+            for c in corsi_ai
+        )
+        # Ore totali nel messaggio: solo se disponibili
+        if ore_totale_corsi > 0:
+            ore_info = f', {ore_totale_corsi:.0f}h totali'
+        else:
+            ore_info = ' (ore non specificate nel PDF)'
+        # Mostra tutti i corsi del DB, non solo id_corso principale
+        db_corsi_str = ' · '.join(corsi_in_fattura) if corsi_in_fattura else id_corso_db
+        checks.append({
+            'label': 'Corso',
+            'stato': 'info',
+            'ai': f"{len(corsi_ai)} corsi",
+            'db': db_corsi_str,
+            'messaggio': f'Fattura multi-corso ({len(corsi_ai)} corsi{ore_info}): {riepilogo_corsi}'
+        })
+    elif codice_ai:
+        ca = codice_ai.lower()
+        ic = id_corso_db.lower()
+        nc = nome_corso_db.lower()
+        match_corso = ca in ic or ic in ca or (nc and (ca in nc or nc in ca))
+        checks.append({
+            'label': 'Corso',
+            'stato': 'ok' if match_corso else 'warn',
+            'ai': codice_ai,
+            'db': f"{id_corso_db} ({nome_corso_db})" if nome_corso_db else id_corso_db,
+            'messaggio': 'Corso conforme' if match_corso else f'Corso PDF: "{codice_ai}" · DB: "{id_corso_db}"'
+        })
+
+    # 3. Monte ore
+    ore_ai = dati_ai.get('monte_ore')
+    if ore_ai is not None:
+        try:
+            ore_ai_f = float(ore_ai)
+            diff_ore = abs(ore_ai_f - ore_db)
+            if diff_ore < 0.5:
+                checks.append({'label': 'Monte ore', 'stato': 'ok',
+                               'ai': f'{ore_ai_f}h', 'db': f'{ore_db}h',
+                               'messaggio': f'Ore conformi: {ore_ai_f}h (PDF) = {ore_db}h (DB)'})
+            else:
+                checks.append({'label': 'Monte ore', 'stato': 'err',
+                               'ai': f'{ore_ai_f}h', 'db': f'{ore_db}h',
+                               'messaggio': f'Divergenza: PDF indica {ore_ai_f}h, DB registra {ore_db}h'})
+        except Exception:
+            pass
+    elif ore_db > 0:
+        checks.append({'label': 'Monte ore', 'stato': 'info',
+                       'ai': '(non trovato nel PDF)', 'db': f'{ore_db}h',
+                       'messaggio': f'DB registra {ore_db}h per questa fattura'})
+
+    # 4. Importo (gestisce lordo/netto con ritenuta d'acconto)
+    importo_lordo_ai = dati_ai.get('importo_lordo')
+    importo_netto_ai = dati_ai.get('importo_netto')
+    ritenuta_ai = dati_ai.get('ritenuta_acconto')
+    # Retrocompatibilità col vecchio campo importo_totale
+    if importo_lordo_ai is None:
+        importo_lordo_ai = dati_ai.get('importo_totale')
+    importo_db_f = float(fattura['importo'])
+
+    if importo_lordo_ai is not None:
+        try:
+            lordo_f = float(importo_lordo_ai)
+            diff_lordo = abs(lordo_f - importo_db_f)
+
+            # Controlla se c'è ritenuta d'acconto
+            ha_ritenuta = ritenuta_ai is not None and float(ritenuta_ai) > 0
+            netto_f = float(importo_netto_ai) if importo_netto_ai is not None else None
+
+            if diff_lordo < 1.0:
+                # Il lordo nel PDF corrisponde al DB
+                if ha_ritenuta:
+                    msg_imp = f'Compenso lordo conforme: €{lordo_f:.2f} · Ritenuta d\'acconto: €{float(ritenuta_ai):.2f} · Netto da percepire: €{netto_f:.2f}'
+                else:
+                    msg_imp = f'Importo conforme: €{lordo_f:.2f}'
+                stato_imp = 'ok'
+                label_ai = f'€{lordo_f:.2f} lordo'
+                if ha_ritenuta and netto_f:
+                    label_ai += f' (netto €{netto_f:.2f})'
+            else:
+                # Il lordo non corrisponde — controlla se il netto corrisponde (caso anomalo)
+                if netto_f is not None and abs(netto_f - importo_db_f) < 1.0:
+                    msg_imp = f'⚠️ Il DB ha il netto (€{netto_f:.2f}) ma dovrebbe avere il lordo (€{lordo_f:.2f})'
+                    stato_imp = 'warn'
+                else:
+                    msg_imp = f'Divergenza: PDF lordo €{lordo_f:.2f} · DB €{importo_db_f:.2f}'
+                    if importo_atteso:
+                        msg_imp += f' · Atteso da ore×tariffa: €{importo_atteso:.2f}'
+                    stato_imp = 'err'
+                label_ai = f'€{lordo_f:.2f}'
+
+            checks.append({'label': 'Importo', 'stato': stato_imp,
+                           'ai': label_ai, 'db': f'€{importo_db_f:.2f}',
+                           'messaggio': msg_imp})
+
+            # Check aggiuntivo: mostra riepilogo ritenuta se presente
+            if ha_ritenuta and netto_f is not None:
+                perc_rit = round((float(ritenuta_ai) / lordo_f) * 100) if lordo_f > 0 else 0
+                checks.append({'label': 'Ritenuta d\'acconto',
+                               'stato': 'info',
+                               'ai': f'{perc_rit}% = €{float(ritenuta_ai):.2f}',
+                               'db': f'Netto da percepire: €{netto_f:.2f}',
+                               'messaggio': f'Ritenuta d\'acconto {perc_rit}%: lordo €{lordo_f:.2f} − €{float(ritenuta_ai):.2f} = netto €{netto_f:.2f}'})
+        except Exception:
+            pass
+
+    # 5. Contratto - monte ore residuo
+    if monte_ore_contratto and ore_totali_corso_fatturate > 0:
+        residuo = round(monte_ore_contratto - ore_totali_corso_fatturate, 2)
+        perc = round((ore_totali_corso_fatturate / monte_ore_contratto) * 100, 1)
+        if residuo > 0:
+            stato_contr = 'ok'
+            msg_contr = f'Fatturate {ore_totali_corso_fatturate}h / {monte_ore_contratto}h ({perc}%) · Residuo: {residuo}h'
+        elif residuo == 0:
+            stato_contr = 'warn'
+            msg_contr = f'Corso completamente fatturato: {ore_totali_corso_fatturate}h / {monte_ore_contratto}h (100%)'
+        else:
+            stato_contr = 'err'
+            msg_contr = f'⚠️ Superamento monte ore! Fatturate {ore_totali_corso_fatturate}h su {monte_ore_contratto}h previste'
+        checks.append({'label': 'Contratto', 'stato': stato_contr,
+                       'ai': '', 'db': msg_contr, 'messaggio': msg_contr})
+
+    return checks
+
+
 # ─── Route: Verifica conformità fattura con AI ────────────────────────────────
 
 @fatture_bp.route("/<int:id_fattura>/verifica", methods=["GET", "POST"])
@@ -907,8 +1083,20 @@ def verifica_fattura_ai(id_fattura):
                 from routes.contratti import estrai_ore_da_contratto
                 monte_ore_contratto = estrai_ore_da_contratto(row_contratto['contenuto_estratto'])
 
-    # ─── GET: mostra form upload ────────────────────────────────────────────────
+        # Ultima verifica salvata dal worker (se presente)
+        dati_ai, data_verifica = _leggi_ultima_verifica(cursor, id_fattura)
+
+    # ─── GET: mostra ultima verifica (o form upload) e l'eventuale lavoro in corso ─
     if request.method == "GET":
+        risultato = None
+        if dati_ai is not None:
+            risultato = {
+                'dati_ai': dati_ai,
+                'checks': _controlli_fattura(fattura, dati_ai, ore_db, importo_atteso, corsi_in_fattura,
+                                             monte_ore_contratto, ore_totali_corso_fatturate),
+                'data_verifica': data_verifica,
+            }
+
         return render_template("verifica_fattura_ai.html",
                                fattura=fattura,
                                ore_db=ore_db,
@@ -919,29 +1107,27 @@ def verifica_fattura_ai(id_fattura):
                                lezioni_db=lezioni_db,
                                corsi_in_fattura=corsi_in_fattura,
                                is_multi_corso=is_multi_corso,
-                               risultato=None,
+                               risultato=risultato,
+                               job_id=request.args.get('job', type=int),
                                current_tab='altro')
 
-    # ─── POST: analisi PDF con Claude + confronto ───────────────────────────────
-    risposta_raw = ""
+    # ─── POST: accoda l'analisi PDF con Claude (eseguita dal worker) ─────────────
     try:
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
+        if not os.environ.get('ANTHROPIC_API_KEY'):
             flash("❌ Chiave API Anthropic non configurata", "danger")
             return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
 
-        # Ottieni percorso PDF
+        # Ottieni percorso PDF (il file temporaneo viene eliminato dal worker)
         pdf_path_temp = None
         is_temp = False
 
         if 'file_pdf' in request.files and request.files['file_pdf'].filename:
-            file = request.files['file_pdf']
-            if allowed_file(file.filename):
-                tf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-                file.save(tf.name)
-                pdf_path_temp = tf.name
-                tf.close()
+            try:
+                pdf_path_temp = salva_upload_temporaneo(request.files['file_pdf'], ALLOWED_EXTENSIONS)
                 is_temp = True
+            except UploadNonValido as e:
+                flash(f"❌ {e}", "danger")
+                return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
         elif fattura['file_pdf']:
             saved_path = os.path.join(UPLOAD_FOLDER, fattura['file_pdf'])
             if os.path.exists(saved_path):
@@ -951,215 +1137,15 @@ def verifica_fattura_ai(id_fattura):
             flash("⚠️ Nessun PDF disponibile. Carica il PDF della fattura per l'analisi.", "warning")
             return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
 
-        images = _pdf_to_base64_images_fattura(pdf_path_temp)
-
-        if is_temp:
-            try:
-                os.unlink(pdf_path_temp)
-            except Exception:
-                pass
-
-        if not images:
-            flash("❌ Impossibile convertire il PDF in immagini.", "danger")
-            return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
-
-        # Chiama Claude Vision
-        from anthropic import Anthropic
-        client = Anthropic(api_key=api_key)
-
-        content = [{"type": "text", "text": _PROMPT_ANALISI_FATTURA}]
-        for img_b64 in images:
-            content.append({
-                "type": "image",
-                "source": {"type": "base64", "media_type": "image/jpeg", "data": img_b64}
-            })
-
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            messages=[{"role": "user", "content": content}]
-        )
-        risposta_raw = message.content[0].text.strip()
-
-        # Pulisci eventuale blocco markdown ```json```
-        if risposta_raw.startswith("```"):
-            parts = risposta_raw.split("```")
-            risposta_raw = parts[1] if len(parts) > 1 else risposta_raw
-            if risposta_raw.startswith("json"):
-                risposta_raw = risposta_raw[4:]
-        risposta_raw = risposta_raw.strip()
-
-        dati_ai = json.loads(risposta_raw)
-
-        # ─── Confronto AI vs DB ─────────────────────────────────────────────────
-        checks = []
-
-        # 1. Numero fattura
-        num_ai = dati_ai.get('numero_fattura')
-        num_db = fattura['numero_fattura']
-        if num_ai:
-            uguali = str(num_ai).strip() == str(num_db).strip()
-            checks.append({
-                'label': 'Numero fattura',
-                'stato': 'ok' if uguali else 'warn',
-                'ai': num_ai, 'db': num_db,
-                'messaggio': 'Numero fattura conforme' if uguali else f'PDF: "{num_ai}" · DB: "{num_db}"'
-            })
-
-        # 2. Corso (gestisce sia mono-corso che multi-corso)
-        corsi_ai = dati_ai.get('corsi')  # array opzionale per fatture multi-corso
-        codice_ai = dati_ai.get('codice_corso') or dati_ai.get('nome_corso') or ''
-        id_corso_db = fattura['id_corso'] or ''
-        nome_corso_db = fattura.get('nome_corso') or ''
-
-        if corsi_ai and isinstance(corsi_ai, list) and len(corsi_ai) > 1:
-            # Fattura multi-corso: mostra riepilogo info
-            ore_totale_corsi = sum(float(c.get('ore') or 0) for c in corsi_ai)
-            # Riepilogo: mostra le ore solo se disponibili nel PDF
-            riepilogo_corsi = ' · '.join(
-                f"{c.get('codice','?')} ({c.get('ore')}h)" if c.get('ore') else f"{c.get('codice','?')}"
-                for c in corsi_ai
-            )
-            # Ore totali nel messaggio: solo se disponibili
-            if ore_totale_corsi > 0:
-                ore_info = f', {ore_totale_corsi:.0f}h totali'
-            else:
-                ore_info = ' (ore non specificate nel PDF)'
-            # Mostra tutti i corsi del DB, non solo id_corso principale
-            db_corsi_str = ' · '.join(corsi_in_fattura) if corsi_in_fattura else id_corso_db
-            checks.append({
-                'label': 'Corso',
-                'stato': 'info',
-                'ai': f"{len(corsi_ai)} corsi",
-                'db': db_corsi_str,
-                'messaggio': f'Fattura multi-corso ({len(corsi_ai)} corsi{ore_info}): {riepilogo_corsi}'
-            })
-        elif codice_ai:
-            ca = codice_ai.lower()
-            ic = id_corso_db.lower()
-            nc = nome_corso_db.lower()
-            match_corso = ca in ic or ic in ca or (nc and (ca in nc or nc in ca))
-            checks.append({
-                'label': 'Corso',
-                'stato': 'ok' if match_corso else 'warn',
-                'ai': codice_ai,
-                'db': f"{id_corso_db} ({nome_corso_db})" if nome_corso_db else id_corso_db,
-                'messaggio': 'Corso conforme' if match_corso else f'Corso PDF: "{codice_ai}" · DB: "{id_corso_db}"'
-            })
-
-        # 3. Monte ore
-        ore_ai = dati_ai.get('monte_ore')
-        if ore_ai is not None:
-            try:
-                ore_ai_f = float(ore_ai)
-                diff_ore = abs(ore_ai_f - ore_db)
-                if diff_ore < 0.5:
-                    checks.append({'label': 'Monte ore', 'stato': 'ok',
-                                   'ai': f'{ore_ai_f}h', 'db': f'{ore_db}h',
-                                   'messaggio': f'Ore conformi: {ore_ai_f}h (PDF) = {ore_db}h (DB)'})
-                else:
-                    checks.append({'label': 'Monte ore', 'stato': 'err',
-                                   'ai': f'{ore_ai_f}h', 'db': f'{ore_db}h',
-                                   'messaggio': f'Divergenza: PDF indica {ore_ai_f}h, DB registra {ore_db}h'})
-            except Exception:
-                pass
-        elif ore_db > 0:
-            checks.append({'label': 'Monte ore', 'stato': 'info',
-                           'ai': '(non trovato nel PDF)', 'db': f'{ore_db}h',
-                           'messaggio': f'DB registra {ore_db}h per questa fattura'})
-
-        # 4. Importo (gestisce lordo/netto con ritenuta d'acconto)
-        importo_lordo_ai = dati_ai.get('importo_lordo')
-        importo_netto_ai = dati_ai.get('importo_netto')
-        ritenuta_ai = dati_ai.get('ritenuta_acconto')
-        # Retrocompatibilità col vecchio campo importo_totale
-        if importo_lordo_ai is None:
-            importo_lordo_ai = dati_ai.get('importo_totale')
-        importo_db_f = float(fattura['importo'])
-
-        if importo_lordo_ai is not None:
-            try:
-                lordo_f = float(importo_lordo_ai)
-                diff_lordo = abs(lordo_f - importo_db_f)
-
-                # Controlla se c'è ritenuta d'acconto
-                ha_ritenuta = ritenuta_ai is not None and float(ritenuta_ai) > 0
-                netto_f = float(importo_netto_ai) if importo_netto_ai is not None else None
-
-                if diff_lordo < 1.0:
-                    # Il lordo nel PDF corrisponde al DB
-                    if ha_ritenuta:
-                        msg_imp = f'Compenso lordo conforme: €{lordo_f:.2f} · Ritenuta d\'acconto: €{float(ritenuta_ai):.2f} · Netto da percepire: €{netto_f:.2f}'
-                    else:
-                        msg_imp = f'Importo conforme: €{lordo_f:.2f}'
-                    stato_imp = 'ok'
-                    label_ai = f'€{lordo_f:.2f} lordo'
-                    if ha_ritenuta and netto_f:
-                        label_ai += f' (netto €{netto_f:.2f})'
-                else:
-                    # Il lordo non corrisponde — controlla se il netto corrisponde (caso anomalo)
-                    if netto_f is not None and abs(netto_f - importo_db_f) < 1.0:
-                        msg_imp = f'⚠️ Il DB ha il netto (€{netto_f:.2f}) ma dovrebbe avere il lordo (€{lordo_f:.2f})'
-                        stato_imp = 'warn'
-                    else:
-                        msg_imp = f'Divergenza: PDF lordo €{lordo_f:.2f} · DB €{importo_db_f:.2f}'
-                        if importo_atteso:
-                            msg_imp += f' · Atteso da ore×tariffa: €{importo_atteso:.2f}'
-                        stato_imp = 'err'
-                    label_ai = f'€{lordo_f:.2f}'
-
-                checks.append({'label': 'Importo', 'stato': stato_imp,
-                               'ai': label_ai, 'db': f'€{importo_db_f:.2f}',
-                               'messaggio': msg_imp})
-
-                # Check aggiuntivo: mostra riepilogo ritenuta se presente
-                if ha_ritenuta and netto_f is not None:
-                    perc_rit = round((float(ritenuta_ai) / lordo_f) * 100) if lordo_f > 0 else 0
-                    checks.append({'label': 'Ritenuta d\'acconto',
-                                   'stato': 'info',
-                                   'ai': f'{perc_rit}% = €{float(ritenuta_ai):.2f}',
-                                   'db': f'Netto da percepire: €{netto_f:.2f}',
-                                   'messaggio': f'Ritenuta d\'acconto {perc_rit}%: lordo €{lordo_f:.2f} − €{float(ritenuta_ai):.2f} = netto €{netto_f:.2f}'})
-            except Exception:
-                pass
-
-        # 5. Contratto - monte ore residuo
-        if monte_ore_contratto and ore_totali_corso_fatturate > 0:
-            residuo = round(monte_ore_contratto - ore_totali_corso_fatturate, 2)
-            perc = round((ore_totali_corso_fatturate / monte_ore_contratto) * 100, 1)
-            if residuo > 0:
-                stato_contr = 'ok'
-                msg_contr = f'Fatturate {ore_totali_corso_fatturate}h / {monte_ore_contratto}h ({perc}%) · Residuo: {residuo}h'
-            elif residuo == 0:
-                stato_contr = 'warn'
-                msg_contr = f'Corso completamente fatturato: {ore_totali_corso_fatturate}h / {monte_ore_contratto}h (100%)'
-            else:
-                stato_contr = 'err'
-                msg_contr = f'⚠️ Superamento monte ore! Fatturate {ore_totali_corso_fatturate}h su {monte_ore_contratto}h previste'
-            checks.append({'label': 'Contratto', 'stato': stato_contr,
-                           'ai': '', 'db': msg_contr, 'messaggio': msg_contr})
-
-        risultato = {
-            'dati_ai': dati_ai,
-            'checks': checks,
-        }
+        job_id = accoda_job('verifica_fattura', {
+            'id_fattura': id_fattura,
+            'pdf_path': os.path.abspath(pdf_path_temp),
+            'is_temp': is_temp,
+        })
 
-        return render_template("verifica_fattura_ai.html",
-                               fattura=fattura,
-                               ore_db=ore_db,
-                               compenso_orario_db=compenso_orario_db,
-                               importo_atteso=importo_atteso,
-                               ore_totali_corso_fatturate=ore_totali_corso_fatturate,
-                               monte_ore_contratto=monte_ore_contratto,
-                               lezioni_db=lezioni_db,
-                               corsi_in_fattura=corsi_in_fattura,
-                               is_multi_corso=is_multi_corso,
-                               risultato=risultato,
-                               current_tab='altro')
+        flash("⏳ Verifica avviata: Claude sta leggendo il PDF della fattura...", "info")
+        return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura, job=job_id))
 
-    except json.JSONDecodeError:
-        flash(f"⚠️ Claude ha risposto ma non in formato JSON valido: {risposta_raw[:300]}", "warning")
-        return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
     except Exception as e:
         flash(f"❌ Errore durante la verifica: {str(e)}", "danger")
         return redirect(url_for("fatture.verifica_fattura_ai", id_fattura=id_fattura))
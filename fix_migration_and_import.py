@@ -8,6 +8,9 @@ from psycopg2.extras import DictCursor
 from datetime import datetime
 from dotenv import load_dotenv
 
+from utils.riepilogo_corsi import aggiorna_riepilogo
+from utils.time_utils import data_iso, durata_e_importo
+
 load_dotenv()
 
 SQLITE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lezioni.db")
@@ -50,17 +53,6 @@ def calcola_ore(ora_inizio, ora_fine):
         print(f"Errore nel calcolo delle ore: {e}")
         return 0.0
 
-def converti_data_formato(data_str, formato_input, formato_output):
-    """Converte una data da un formato all'altro"""
-    try:
-        if not data_str:
-            return None
-        data = datetime.strptime(data_str, formato_input)
-        return data.strftime(formato_output)
-    except Exception as e:
-        print(f"Errore nella conversione della data '{data_str}': {e}")
-        return None
-
 def verifica_integrità_database():
     """Verifica l'integrità tra i database SQLite e PostgreSQL"""
     print("\n=== Verifica integrità database ===")
@@ -174,22 +166,25 @@ def migra_corsi_mancanti():
                     ore_fatturate = 0
                     if lezione['fatturato'] == 1:
                         ore_fatturate = calcola_ore(lezione['ora_inizio'], lezione['ora_fine'])
+                    durata_minuti, importo = durata_e_importo(lezione['ora_inizio'], lezione['ora_fine'],
+                                                              lezione['compenso_orario'])
                     
                     pg_cursor.execute("""
                         INSERT INTO lezioni (
                             id_corso, materia, data, ora_inizio, ora_fine, 
                             luogo, compenso_orario, stato, fatturato, 
-                            mese_fatturato, ore_fatturate
+                            mese_fatturato, ore_fatturate, durata_minuti, importo
                         ) VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
                         )
                     """, (
-                        lezione['id_corso'], lezione['materia'], lezione['data'],
+                        lezione['id_corso'], lezione['materia'], data_iso(lezione['data']) or lezione['data'],
                         lezione['ora_inizio'], lezione['ora_fine'], lezione['luogo'],
                         lezione['compenso_orario'], lezione['stato'], lezione['fatturato'],
-                        lezione['mese_fatturato'], ore_fatturate
+                        lezione['mese_fatturato'], ore_fatturate, durata_minuti, importo
                     ))
                 
+                aggiorna_riepilogo(pg_cursor, [id_corso])
                 pg_conn.commit()
                 print(f"✅ Corso {id_corso} migrato con successo")
                 
@@ -252,6 +247,7 @@ def importa_csv(file_path, delimiter=';'):
             righe_importate = 0
             righe_saltate = 0
             corsi_creati = 0
+            corsi_importati = set()
             
             for row in reader:
                 righe_totali += 1
@@ -279,11 +275,7 @@ def importa_csv(file_path, delimiter=';'):
                         righe_saltate += 1
                         continue
                     
-                    if '/' in data_str:
-                        data = converti_data_formato(data_str, "%d/%m/%Y", "%Y-%m-%d")
-                    else:
-                        data = data_str
-                    
+                    data = data_iso(data_str)
                     if not data:
                         print(f"⚠️ Riga {righe_totali}: Formato data non valido '{data_str}', saltata")
                         righe_saltate += 1
@@ -320,28 +312,32 @@ def importa_csv(file_path, delimiter=';'):
                             pg_conn.rollback()
                             continue
                     
+                    durata_minuti, importo = durata_e_importo(ora_inizio, ora_fine, compenso_orario)
+                    
                     pg_cursor.execute("""
                         INSERT INTO lezioni (
                             id_corso, materia, data, ora_inizio, ora_fine, 
                             luogo, compenso_orario, stato, fatturato, 
-                            mese_fatturato, ore_fatturate
+                            mese_fatturato, ore_fatturate, durata_minuti, importo
                         ) VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
                         )
                     """, (
                         id_corso, materia, data,
                         ora_inizio, ora_fine, luogo,
                         compenso_orario, stato, fatturato,
-                        mese_fatturato, ore_fatturate
+                        mese_fatturato, ore_fatturate, durata_minuti, importo
                     ))
                     
                     righe_importate += 1
+                    corsi_importati.add(id_corso)
                     
                 except Exception as e:
                     print(f"❌ Errore durante l'importazione della riga {righe_totali}: {e}")
                     righe_saltate += 1
                     continue
             
+            aggiorna_riepilogo(pg_cursor, corsi_importati)
             pg_conn.commit()
             print(f"\n✅ Importazione completata:")
             print(f"  - Righe totali: {righe_totali}")
@@ -1,9 +1,13 @@
 """
 Configurazione Gunicorn per Render (Standard: 2 GB RAM, 1 CPU)
 """
+import os
+import subprocess
+import sys
 
-# Timeout aumentato per gestire PDF scansionati con visione Claude
-timeout = 360  # 6 minuti per PDF complessi
+# Timeout ampio per sicurezza: le analisi PDF con Claude Vision girano nel
+# worker dei lavori in background (worker.py), non più nelle richieste web
+timeout = 360
 
 # 2 workers su piano Standard (2 GB RAM)
 workers = 2
@@ -19,3 +23,25 @@ bind = "0.0.0.0:10000"
 loglevel = "info"
 accesslog = "-"
 errorlog = "-"
+
+# Worker dei lavori in background (analisi PDF con Claude Vision).
+# Gira nello stesso container perché il disco degli upload su Render non è
+# condiviso tra servizi. Disattivabile con AVVIA_WORKER_JOB=false.
+_worker_job = None
+
+
+def when_ready(server):
+    global _worker_job
+    if os.environ.get('AVVIA_WORKER_JOB', 'true').lower() != 'true':
+        return
+    _worker_job = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'worker.py')])
+    server.log.info(f"Worker lavori in background avviato (pid {_worker_job.pid})")
+
+
+def on_exit(server):
+    if _worker_job and _worker_job.poll() is None:
+        _worker_job.terminate()
+        try:
+            _worker_job.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _worker_job.kill()
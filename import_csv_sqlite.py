@@ -6,12 +6,19 @@ import csv
 import sqlite3
 from datetime import datetime
 
+from database import FUNZIONI_SQL
+from utils.riepilogo_corsi import aggiorna_riepilogo, ricostruisci_riepilogo
+from utils.time_utils import durata_e_importo, data_iso
+
 SQLITE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lezioni.db")
 
 def get_sqlite_connection():
     """Crea una connessione al database SQLite"""
     conn = sqlite3.connect(SQLITE_DB_PATH)
     conn.row_factory = sqlite3.Row
+    # calcola_ore, extract_year_month, ... usate dal riepilogo_corsi
+    for nome, n_argomenti, funzione in FUNZIONI_SQL:
+        conn.create_function(nome, n_argomenti, funzione, deterministic=True)
     return conn
 
 def calcola_ore(ora_inizio, ora_fine):
@@ -34,17 +41,6 @@ def calcola_ore(ora_inizio, ora_fine):
         print(f"Errore nel calcolo delle ore: {e}")
         return 0.0
 
-def converti_data_formato(data_str, formato_input, formato_output):
-    """Converte una data da un formato all'altro"""
-    try:
-        if not data_str:
-            return None
-        data = datetime.strptime(data_str, formato_input)
-        return data.strftime(formato_output)
-    except Exception as e:
-        print(f"Errore nella conversione della data '{data_str}': {e}")
-        return None
-
 def importa_csv(file_path, delimiter=';'):
     """Importa dati da un file CSV nel database SQLite"""
     print(f"\n=== Importazione CSV: {file_path} ===")
@@ -119,6 +115,7 @@ def importa_csv(file_path, delimiter=';'):
             print(f"Importazione di {total_rows} righe...")
             
             corsi_creati = set()
+            corsi_importati = set()
             
             imported_rows = 0
             skipped_rows = 0
@@ -142,14 +139,11 @@ def importa_csv(file_path, delimiter=';'):
                         continue
                     
                     data = values.get('data')
-                    if data and '/' in data:
-                        try:
-                            values['data'] = converti_data_formato(data, "%d/%m/%Y", "%Y-%m-%d")
-                        except Exception:
-                            try:
-                                values['data'] = converti_data_formato(data, "%d-%m-%Y", "%Y-%m-%d")
-                            except Exception:
-                                pass
+                    values['data'] = data_iso(data)
+                    if not values['data']:
+                        print(f"⚠️ Riga {i+2}: Data non valida '{data}', riga saltata")
+                        skipped_rows += 1
+                        continue
                     
                     if 'stato' not in values or not values['stato']:
                         if values.get('data'):
@@ -202,12 +196,18 @@ def importa_csv(file_path, delimiter=';'):
                             corsi_creati.add(id_corso)
                             print(f"✅ Creato nuovo corso: {id_corso}")
                     
+                    try:
+                        compenso = float(str(values.get('compenso_orario') or 0).replace(',', '.'))
+                    except ValueError:
+                        compenso = 0.0
+                    durata_minuti, importo = durata_e_importo(values.get('ora_inizio'), values.get('ora_fine'), compenso)
+                    
                     cursor.execute("""
                         INSERT INTO lezioni (
                             id_corso, materia, data, ora_inizio, ora_fine, 
                             luogo, compenso_orario, stato, fatturato, 
-                            mese_fatturato, ore_fatturate
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            mese_fatturato, ore_fatturate, durata_minuti, importo
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """, (
                         values.get('id_corso'),
                         values.get('materia'),
@@ -219,10 +219,13 @@ def importa_csv(file_path, delimiter=';'):
                         values.get('stato'),
                         values.get('fatturato', 0),
                         values.get('mese_fatturato'),
-                        values.get('ore_fatturate', 0)
+                        values.get('ore_fatturate', 0),
+                        durata_minuti,
+                        importo
                     ))
                     
                     imported_rows += 1
+                    corsi_importati.add(values.get('id_corso'))
                     
                     if (i+1) % 50 == 0 or i+1 == total_rows:
                         print(f"Importate {i+1}/{total_rows} righe...")
@@ -232,6 +235,7 @@ def importa_csv(file_path, delimiter=';'):
                     skipped_rows += 1
                     continue
             
+            aggiorna_riepilogo(cursor, corsi_importati)
             conn.commit()
             print(f"\n✅ Importazione completata:")
             print(f"  - Righe totali: {total_rows}")
@@ -263,6 +267,7 @@ def correggi_stato_lezioni():
         """)
         
         rows_updated = cursor.rowcount
+        ricostruisci_riepilogo(cursor)
         conn.commit()
         
         print(f"✅ Stato aggiornato per {rows_updated} lezioni con data passata")
@@ -0,0 +1,482 @@
+"""
+Migrazioni versionate dello schema (SQLite e PostgreSQL).
+
+Sostituisce gli script ad-hoc (add_cliente_column.py, add_missing_tables.py,
+add_google_calendar_column.py, create_contratti_table.py,
+fix_fatture_unique_constraint.py, remove_unique_constraint.py/.sql).
+Ogni migrazione ha un numero di versione crescente e viene applicata una sola
+volta, nella stessa transazione in cui la versione viene registrata nella
+tabella `schema_versione`. Un lock (BEGIN IMMEDIATE su SQLite, advisory lock
+su PostgreSQL) evita che i worker di gunicorn le applichino in parallelo.
+
+Per aggiungere una modifica allo schema: scrivere una funzione
+`_mNNNN_descrizione(cursor, postgres)` e aggiungerla in fondo a MIGRAZIONI.
+
+Uso: python migrazioni.py [--stato]
+"""
+import argparse
+from datetime import datetime
+
+from db_utils import db_connection, USE_POSTGRES
+from utils.date_lezioni import canonicalizza_date, crea_tabella_report
+from utils.riepilogo_corsi import crea_tabella, ricostruisci_riepilogo
+from utils.time_utils import correggi_orario, durata_e_importo
+from utils.versioni_tabelle import crea_contatori
+
+# Chiave dell'advisory lock PostgreSQL riservata alle migrazioni
+_LOCK_MIGRAZIONI = 72_410_001
+
+
+def _colonne(cursor, tabella, postgres):
+    if postgres:
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+        """, (tabella,))
+        return {row[0] for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({tabella})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def _aggiungi_colonna(cursor, postgres, tabella, colonna, definizione):
+    if colonna not in _colonne(cursor, tabella, postgres):
+        cursor.execute(f"ALTER TABLE {tabella} ADD COLUMN {colonna} {definizione}")
+        print(f"✅ Colonna '{colonna}' aggiunta alla tabella '{tabella}'")
+
+
+def _colonna_id(postgres, nome="id"):
+    return f"{nome} SERIAL PRIMARY KEY" if postgres else f"{nome} INTEGER PRIMARY KEY AUTOINCREMENT"
+
+
+def _m0001_colonna_cliente(cursor, postgres):
+    """Colonna cliente su corsi e corsi_archiviati (ex add_cliente_column.py)"""
+    _aggiungi_colonna(cursor, postgres, "corsi", "cliente", "TEXT DEFAULT NULL")
+    _aggiungi_colonna(cursor, postgres, "corsi_archiviati", "cliente", "TEXT DEFAULT NULL")
+
+
+def _m0002_tabelle_mancanti(cursor, postgres):
+    """Tabelle fatture, fatture_lezioni, corsi, corsi_archiviati (ex add_missing_tables.py)"""
+    id_fattura = "id_fattura SERIAL PRIMARY KEY" if postgres else "id_fattura INTEGER PRIMARY KEY AUTOINCREMENT"
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS fatture (
+            {id_fattura},
+            numero_fattura TEXT NOT NULL,
+            id_corso TEXT,
+            data_fattura TEXT NOT NULL,
+            importo REAL NOT NULL,
+            tipo_fatturazione TEXT CHECK(tipo_fatturazione IN ('parziale', 'totale')) NOT NULL,
+            file_pdf TEXT NOT NULL,
+            note TEXT,
+            cliente TEXT,
+            progetto TEXT,
+            tranche TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fatture_lezioni (
+            id_fattura INTEGER,
+            id_lezione INTEGER,
+            FOREIGN KEY (id_fattura) REFERENCES fatture (id_fattura),
+            FOREIGN KEY (id_lezione) REFERENCES lezioni (id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS corsi (
+            id_corso TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            cliente TEXT DEFAULT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS corsi_archiviati (
+            id_corso TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            cliente TEXT DEFAULT NULL,
+            data_archiviazione TEXT NOT NULL
+        )
+    """)
+
+
+def _m0003_google_calendar(cursor, postgres):
+    """Colonna google_calendar_event_id su lezioni e archiviate (ex add_google_calendar_column.py)"""
+    for tabella in ("lezioni", "archiviate"):
+        _aggiungi_colonna(cursor, postgres, tabella, "google_calendar_event_id", "TEXT DEFAULT NULL")
+
+
+def _m0004_tabella_contratti(cursor, postgres):
+    """Tabella contratti (ex create_contratti_table.py)"""
+    id_col = "id SERIAL PRIMARY KEY" if postgres else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS contratti (
+            {id_col},
+            numero_contratto TEXT,
+            nome_file TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            data_upload TEXT NOT NULL,
+            cliente TEXT,
+            contenuto_estratto TEXT,
+            id_corso TEXT,
+            FOREIGN KEY (id_corso) REFERENCES corsi(id_corso)
+        )
+    """)
+
+
+def _m0005_numero_fattura_non_univoco(cursor, postgres):
+    """Stesso numero fattura in anni diversi (ex fix_fatture_unique_constraint.py e remove_unique_constraint.*)"""
+    if postgres:
+        cursor.execute("ALTER TABLE fatture DROP CONSTRAINT IF EXISTS fatture_numero_fattura_key")
+        cursor.execute("ALTER TABLE fatture DROP CONSTRAINT IF EXISTS numero_fattura_unique")
+        return
+
+    # SQLite non può rimuovere un vincolo UNIQUE: la tabella va ricreata
+    cursor.execute("PRAGMA index_list(fatture)")
+    vincoli = [row[1] for row in cursor.fetchall() if row[2] and row[3] == 'u']
+    univoco = False
+    for nome in vincoli:
+        cursor.execute(f"PRAGMA index_info({nome})")
+        if [row[2] for row in cursor.fetchall()] == ['numero_fattura']:
+            univoco = True
+    if not univoco:
+        return
+
+    colonne = _colonne(cursor, "fatture", postgres)
+    cursor.execute("""
+        CREATE TABLE fatture_nuova (
+            id_fattura INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_fattura TEXT NOT NULL,
+            id_corso TEXT,
+            data_fattura TEXT NOT NULL,
+            importo REAL NOT NULL,
+            tipo_fatturazione TEXT CHECK(tipo_fatturazione IN ('parziale', 'totale')) NOT NULL,
+            file_pdf TEXT NOT NULL,
+            note TEXT,
+            cliente TEXT,
+            progetto TEXT,
+            tranche TEXT
+        )
+    """)
+    comuni = ", ".join(c for c in ("id_fattura", "numero_fattura", "id_corso", "data_fattura", "importo",
+                                   "tipo_fatturazione", "file_pdf", "note", "cliente", "progetto", "tranche")
+                       if c in colonne)
+    cursor.execute(f"INSERT INTO fatture_nuova ({comuni}) SELECT {comuni} FROM fatture")
+    cursor.execute("DROP TABLE fatture")
+    cursor.execute("ALTER TABLE fatture_nuova RENAME TO fatture")
+    print("✅ Vincolo UNIQUE rimosso da fatture.numero_fattura")
+
+
+def _m0006_indici(cursor, postgres):
+    """Indici sulle colonne usate da filtri e join delle pagine principali"""
+    indici = (
+        ("idx_lezioni_corso_data", "lezioni", "id_corso, data"),
+        ("idx_lezioni_data", "lezioni", "data, ora_inizio"),
+        ("idx_lezioni_stato_fatturato", "lezioni", "stato, fatturato"),
+        ("idx_archiviate_corso_data", "archiviate", "id_corso, data"),
+        ("idx_fatture_lezioni_fattura", "fatture_lezioni", "id_fattura, id_lezione"),
+        ("idx_fatture_lezioni_lezione", "fatture_lezioni", "id_lezione"),
+        ("idx_fatture_corso", "fatture", "id_corso, data_fattura"),
+        ("idx_contratti_corso", "contratti", "id_corso"),
+    )
+    for nome, tabella, colonne in indici:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabella} ({colonne})")
+    # Statistiche aggiornate per il pianificatore delle query
+    cursor.execute("ANALYZE")
+
+
+def _m0007_durata_importo_lezioni(cursor, postgres):
+    """Colonne durata_minuti e importo su lezioni e archiviate, calcolate per le righe esistenti"""
+    placeholder = "%s" if postgres else "?"
+    for tabella in ("lezioni", "archiviate"):
+        _aggiungi_colonna(cursor, postgres, tabella, "durata_minuti", "INTEGER DEFAULT NULL")
+        _aggiungi_colonna(cursor, postgres, tabella, "importo",
+                          "DOUBLE PRECISION DEFAULT NULL" if postgres else "REAL DEFAULT NULL")
+        cursor.execute(f"SELECT id, ora_inizio, ora_fine, compenso_orario FROM {tabella}")
+        valori = [(*durata_e_importo(row[1], row[2], row[3]), row[0]) for row in cursor.fetchall()]
+        cursor.executemany(f"UPDATE {tabella} SET durata_minuti = {placeholder}, importo = {placeholder} WHERE id = {placeholder}",
+                           valori)
+        print(f"✅ Durata e importo calcolati per {len(valori)} righe di '{tabella}'")
+
+
+def _m0008_riepilogo_corsi(cursor, postgres):
+    """Tabella riepilogo_corsi (metriche per corso e mese), popolata dalle lezioni esistenti"""
+    crea_tabella(cursor, postgres)
+    print(f"✅ Tabella 'riepilogo_corsi' popolata con {ricostruisci_riepilogo(cursor)} righe")
+
+
+
+def _m0009_indice_paginazione(cursor, postgres):
+    """Indice (data, ora_inizio, id) per la paginazione keyset della dashboard, al posto di idx_lezioni_data"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lezioni_data_ora_id ON lezioni (data, ora_inizio, id)")
+    cursor.execute("DROP INDEX IF EXISTS idx_lezioni_data")
+    cursor.execute("ANALYZE lezioni")
+
+
+
+def _m0010_versioni_tabelle(cursor, postgres):
+    """Tabella versioni_tabelle e trigger: contatori di modifica di lezioni e corsi (ETag di /api/eventi)"""
+    crea_contatori(cursor, postgres)
+
+
+
+def _m0011_date_iso(cursor, postgres):
+    """Date di lezioni e archiviate riscritte in YYYY-MM-DD (elenco in date_riscritte), riepilogo ricalcolato"""
+    crea_tabella_report(cursor, postgres)
+    esito = canonicalizza_date(cursor, postgres, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    for tabella, (riscritte, non_valide) in esito.items():
+        print(f"✅ {riscritte} date riscritte in '{tabella}'")
+        for id_lezione, data in non_valide:
+            print(f"⚠️ {tabella} id={id_lezione}: data non interpretabile {data!r}, lasciata invariata")
+    # I mesi del riepilogo dipendono dalla data
+    if any(riscritte for riscritte, _ in esito.values()):
+        ricostruisci_riepilogo(cursor)
+
+
+def _m0012_lezioni_dopo_mezzanotte(cursor, postgres):
+    """Lezioni che passano la mezzanotte: durata positiva (23:00-01:00 = 120 minuti) come in calcola_ore"""
+    if postgres:
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION calcola_ore(ora_inizio TEXT, ora_fine TEXT)
+            RETURNS REAL AS $$
+            BEGIN
+                RETURN MOD(EXTRACT(EPOCH FROM (
+                    TO_TIMESTAMP('2000-01-01 ' || ora_fine, 'YYYY-MM-DD HH24:MI') -
+                    TO_TIMESTAMP('2000-01-01 ' || ora_inizio, 'YYYY-MM-DD HH24:MI')
+                )) + 86400, 86400) / 3600.0;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+    placeholder = "%s" if postgres else "?"
+    corrette = 0
+    for tabella in ("lezioni", "archiviate"):
+        cursor.execute(f"SELECT id, ora_inizio, ora_fine, compenso_orario FROM {tabella} WHERE durata_minuti < 0")
+        valori = [(*durata_e_importo(row[1], row[2], row[3]), row[0]) for row in cursor.fetchall()]
+        cursor.executemany(f"UPDATE {tabella} SET durata_minuti = {placeholder}, importo = {placeholder} WHERE id = {placeholder}",
+                           valori)
+        # ore_fatturate calcolate in passato con calcola_ore senza riporto
+        cursor.execute(f"UPDATE {tabella} SET ore_fatturate = ore_fatturate + 24 WHERE ore_fatturate < 0")
+        corrette += len(valori)
+        print(f"✅ Durata corretta per {len(valori)} lezioni di '{tabella}' dopo la mezzanotte")
+    if corrette:
+        ricostruisci_riepilogo(cursor)
+
+
+def _m0013_tabelle_lavori(cursor, postgres):
+    """Tabelle jobs (coda dei lavori), verifiche_fatture, contratti_analisi e lezioni_rinunciate,
+    prima create dalle route a ogni chiamata"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            {_colonna_id(postgres)},
+            tipo TEXT NOT NULL,
+            chiave TEXT,
+            stato TEXT NOT NULL,
+            progresso INTEGER DEFAULT 0,
+            messaggio TEXT,
+            payload TEXT,
+            risultato TEXT,
+            errore TEXT,
+            creato_il TEXT NOT NULL,
+            aggiornato_il TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stato ON jobs (stato, id)")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS verifiche_fatture (
+            {_colonna_id(postgres)},
+            id_fattura INTEGER NOT NULL,
+            id_job INTEGER,
+            dati_ai TEXT NOT NULL,
+            data_verifica TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contratti_analisi (
+            id_contratto INTEGER PRIMARY KEY,
+            hash_pdf TEXT,
+            versione_prompt TEXT NOT NULL,
+            analisi TEXT NOT NULL,
+            data_analisi TEXT NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS lezioni_rinunciate (
+            {_colonna_id(postgres)},
+            id_contratto INTEGER NOT NULL,
+            data VARCHAR(10) NOT NULL,
+            ora_inizio VARCHAR(5) NOT NULL,
+            ora_fine VARCHAR(5) NOT NULL,
+            data_rinuncia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(id_contratto, data, ora_inizio, ora_fine)
+        )
+    """)
+
+
+def _m0014_tabelle_chat_claude(cursor, postgres):
+    """Tabelle chat_contratti (storico della chat) e utilizzo_claude (token per chiamata),
+    prima create a ogni chiamata"""
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS chat_contratti (
+            {_colonna_id(postgres)},
+            id_contratto INTEGER NOT NULL,
+            ruolo TEXT NOT NULL,
+            contenuto TEXT NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS utilizzo_claude (
+            {_colonna_id(postgres)},
+            data TEXT NOT NULL,
+            operazione TEXT NOT NULL,
+            riferimento TEXT,
+            modello TEXT,
+            input_tokens INTEGER DEFAULT 0,
+            output_tokens INTEGER DEFAULT 0,
+            cache_creation_tokens INTEGER DEFAULT 0,
+            cache_read_tokens INTEGER DEFAULT 0,
+            durata_ms INTEGER DEFAULT 0
+        )
+    """)
+
+
+def _m0015_cache_risposte(cursor, postgres):
+    """Tabelle della cache delle risposte della chat e dei contatori hit/miss,
+    prima create a ogni chiamata"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_risposte_contratti (
+            chiave TEXT PRIMARY KEY,
+            domanda TEXT NOT NULL,
+            risposta TEXT NOT NULL,
+            creato_il TEXT NOT NULL,
+            ultimo_uso TEXT NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS contatori_cache (
+            nome TEXT PRIMARY KEY,
+            valore INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def _m0016_orari_hh_mm(cursor, postgres):
+    """Orari di lezioni e archiviate riscritti in HH:MM ('9:00' → '09:00', '9.30' → '09:30'),
+    come li salvano le route e l'import CSV"""
+    placeholder = "%s" if postgres else "?"
+    for tabella in ("lezioni", "archiviate"):
+        cursor.execute(f"SELECT id, ora_inizio, ora_fine FROM {tabella}")
+        valori = []
+        for id_lezione, ora_inizio, ora_fine in cursor.fetchall():
+            nuova_inizio = correggi_orario(ora_inizio or "") or ora_inizio
+            nuova_fine = correggi_orario(ora_fine or "") or ora_fine
+            if (nuova_inizio, nuova_fine) != (ora_inizio, ora_fine):
+                valori.append((nuova_inizio, nuova_fine, id_lezione))
+        cursor.executemany(f"UPDATE {tabella} SET ora_inizio = {placeholder}, ora_fine = {placeholder} WHERE id = {placeholder}",
+                           valori)
+        print(f"✅ {len(valori)} orari riscritti in '{tabella}'")
+
+
+MIGRAZIONI = [
+    (1, "colonna_cliente", _m0001_colonna_cliente),
+    (2, "tabelle_mancanti", _m0002_tabelle_mancanti),
+    (3, "google_calendar", _m0003_google_calendar),
+    (4, "tabella_contratti", _m0004_tabella_contratti),
+    (5, "numero_fattura_non_univoco", _m0005_numero_fattura_non_univoco),
+    (6, "indici", _m0006_indici),
+    (7, "durata_importo_lezioni", _m0007_durata_importo_lezioni),
+    (8, "riepilogo_corsi", _m0008_riepilogo_corsi),
+    (9, "indice_paginazione", _m0009_indice_paginazione),
+    (10, "versioni_tabelle", _m0010_versioni_tabelle),
+    (11, "date_iso", _m0011_date_iso),
+    (12, "lezioni_dopo_mezzanotte", _m0012_lezioni_dopo_mezzanotte),
+    (13, "tabelle_lavori", _m0013_tabelle_lavori),
+    (14, "tabelle_chat_claude", _m0014_tabelle_chat_claude),
+    (15, "cache_risposte", _m0015_cache_risposte),
+    (16, "orari_hh_mm", _m0016_orari_hh_mm),
+]
+
+
+def _ensure_schema_versione_table(cursor):
+    """Crea la tabella schema_versione se non esiste (compatibile SQLite e PostgreSQL)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_versione (
+            versione INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            applicata_il TEXT NOT NULL
+        )
+    """)
+
+
+def _blocca(cursor):
+    """Apre la transazione della migrazione con un lock esclusivo"""
+    if USE_POSTGRES:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_MIGRAZIONI,))
+    else:
+        cursor.execute("BEGIN IMMEDIATE")
+
+
+def versioni_applicate(cursor):
+    _ensure_schema_versione_table(cursor)
+    cursor.execute("SELECT versione FROM schema_versione")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def versione_corrente():
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        versioni = versioni_applicate(cursor)
+        conn.commit()
+    return max(versioni, default=0)
+
+
+def applica_migrazioni(fino_a=None):
+    """Applica in ordine le migrazioni mancanti; restituisce le versioni applicate"""
+    placeholder = "%s" if USE_POSTGRES else "?"
+    applicate = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        _ensure_schema_versione_table(cursor)
+        conn.commit()
+
+        for versione, nome, migrazione in MIGRAZIONI:
+            if fino_a is not None and versione > fino_a:
+                break
+            try:
+                _blocca(cursor)
+                if versione in versioni_applicate(cursor):
+                    conn.commit()
+                    continue
+                print(f"⏳ Migrazione {versione:04d} {nome}...")
+                migrazione(cursor, USE_POSTGRES)
+                cursor.execute(f"""
+                    INSERT INTO schema_versione (versione, nome, applicata_il)
+                    VALUES ({placeholder}, {placeholder}, {placeholder})
+                """, (versione, nome, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                conn.commit()
+                applicate.append(versione)
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Migrazione {versione:04d} {nome} fallita: {e}")
+                raise
+
+    if applicate:
+        print(f"✅ Schema aggiornato alla versione {applicate[-1]}")
+    return applicate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrazioni versionate dello schema")
+    parser.add_argument('--stato', action='store_true', help="mostra le migrazioni senza applicarle")
+    args = parser.parse_args()
+
+    if not args.stato:
+        applica_migrazioni()
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        versioni = versioni_applicate(cursor)
+        conn.commit()
+    for versione, nome, _ in MIGRAZIONI:
+        print(f"{'✅' if versione in versioni else '⏳'} {versione:04d} {nome}")
+
+
+if __name__ == "__main__":
+    main()
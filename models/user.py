@@ -1,22 +1,71 @@
 # models/user.py
 
+import os
+import threading
+import time
+
 from flask_login import UserMixin
 from db_utils import db_connection, get_placeholder
 
+# Cache in memoria (per processo) degli utenti caricati da load_user_from_db:
+# evita la query su users a ogni richiesta autenticata, comprese le chiamate AJAX.
+# USER_CACHE_TTL_SECONDI=0 la disattiva.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL_SECONDI', '300'))
+
+_cache_utenti = {}  # id utente -> (scadenza, User)
+_lock_cache = threading.Lock()
+
 class User(UserMixin):
     def __init__(self, id):
         self.id = id
 
+def invalida_utente(user_id=None):
+    """Rimuove un utente dalla cache (tutti se user_id è None)"""
+    with _lock_cache:
+        if user_id is None:
+            _cache_utenti.clear()
+        else:
+            try:
+                _cache_utenti.pop(int(user_id), None)
+            except (TypeError, ValueError):
+                pass
+
+def _utente_in_cache(user_id):
+    with _lock_cache:
+        voce = _cache_utenti.get(user_id)
+        if voce is None:
+            return None
+        scadenza, user = voce
+        if scadenza < time.monotonic():
+            del _cache_utenti[user_id]
+            return None
+        return user
+
+def _metti_in_cache(user):
+    adesso = time.monotonic()
+    with _lock_cache:
+        # Le voci scadute vengono eliminate qui, così la cache non cresce senza limite
+        for user_id in [k for k, (scadenza, _) in _cache_utenti.items() if scadenza < adesso]:
+            del _cache_utenti[user_id]
+        _cache_utenti[user.id] = (adesso + USER_CACHE_TTL, user)
+
 def load_user_from_db(user_id):
     try:
         user_id_int = int(user_id)
+        if USER_CACHE_TTL > 0:
+            user = _utente_in_cache(user_id_int)
+            if user is not None:
+                return user
         placeholder = get_placeholder()
         with db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(f"SELECT * FROM users WHERE id = {placeholder}", (user_id_int,))
             user = cursor.fetchone()
             if user:
-                return User(id=user['id'])
+                user = User(id=user['id'])
+                if USER_CACHE_TTL > 0:
+                    _metti_in_cache(user)
+                return user
     except Exception as e:
         print(f"Errore in load_user_from_db: {e}")
     return None
@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, request, flash,
 from flask_login import login_required
 from db_utils import db_connection, get_placeholder
 from datetime import datetime
-from utils.time_utils import format_datetime_for_db
+from utils.time_utils import format_datetime_for_db, durata_e_importo
+from utils.riepilogo_corsi import aggiorna_riepilogo, corsi_delle_lezioni
 
 archivio_bp = Blueprint('archivio', __name__)
 
@@ -35,12 +36,13 @@ def archivia_corso():
 
             for lezione in lezioni:
                 cursor.execute("""
-                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, durata_minuti, importo)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """, (
                     lezione["id_corso"], lezione["materia"], lezione["data"],
                     lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
-                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"]
+                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"],
+                    *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
                 ))
 
             cursor.execute("SELECT * FROM corsi WHERE id_corso = %s", (id_corso,))
@@ -55,6 +57,7 @@ def archivia_corso():
             
             cursor.execute("DELETE FROM lezioni WHERE id_corso = %s", (id_corso,))
             cursor.execute("DELETE FROM corsi WHERE id_corso = %s", (id_corso,))
+            aggiorna_riepilogo(cursor, [id_corso])
             conn.commit()
 
         flash(f"✅ Corso '{id_corso}' e relative lezioni archiviate con successo!", "success")
@@ -100,16 +103,18 @@ def ripristina_lezioni():
 
             for lezione in lezioni:
                 cursor.execute("""
-                    INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, durata_minuti, importo)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                 """, (
                     lezione["id_corso"], lezione["materia"], lezione["data"],
                     lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
-                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"]
+                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"],
+                    *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
                 ))
 
             query_delete = f"DELETE FROM archiviate WHERE id IN ({','.join(['%s'] * len(lezioni_da_ripristinare))})"
             cursor.execute(query_delete, lezioni_da_ripristinare)
+            aggiorna_riepilogo(cursor, [lezione["id_corso"] for lezione in lezioni])
             conn.commit()
 
         flash(f"✅ {len(lezioni_da_ripristinare)} lezione/i ripristinata/e con successo.", "success")
@@ -140,6 +145,7 @@ def elimina_corso_archiviato(id_corso):
             cursor.execute("DELETE FROM archiviate WHERE id_corso = %s", (id_corso,))
             
             cursor.execute("DELETE FROM corsi_archiviati WHERE id_corso = %s", (id_corso,))
+            aggiorna_riepilogo(cursor, [id_corso])
             conn.commit()
             
         flash(f"✅ Corso archiviato '{id_corso}' e relative lezioni eliminate con successo!", "success")
@@ -163,8 +169,10 @@ def elimina_lezioni_archiviate():
         with db_connection() as conn:
             cursor = conn.cursor()
             
+            corsi = corsi_delle_lezioni(cursor, lezioni_da_eliminare, tabella="archiviate")
             query_delete = f"DELETE FROM archiviate WHERE id IN ({','.join(['%s'] * len(lezioni_da_eliminare))})"
             cursor.execute(query_delete, lezioni_da_eliminare)
+            aggiorna_riepilogo(cursor, corsi)
             conn.commit()
             
         flash(f"✅ {len(lezioni_da_eliminare)} lezione/i eliminata/e definitivamente.", "success")
@@ -188,8 +196,10 @@ def elimina_lezioni_archiviate_ajax():
         with db_connection() as conn:
             cursor = conn.cursor()
             
+            corsi = corsi_delle_lezioni(cursor, lezioni_da_eliminare, tabella="archiviate")
             query_delete = f"DELETE FROM archiviate WHERE id IN ({','.join(['%s'] * len(lezioni_da_eliminare))})"
             cursor.execute(query_delete, lezioni_da_eliminare)
+            aggiorna_riepilogo(cursor, corsi)
             conn.commit()
             
         return jsonify({
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from forms import LoginForm
-from models.user import User, load_user_from_db
+from models.user import User, load_user_from_db, invalida_utente
 from db_utils import db_connection, get_placeholder
 from utils.security import sanitize_input
 from utils.password_utils import hybrid_check_password_hash, rehash_password_if_needed
@@ -39,6 +39,7 @@ def login():
 @auth_bp.route("/logout")
 @login_required
 def logout():
+    invalida_utente(current_user.get_id())
     logout_user()
     flash("Logout effettuato!", "info")
     return redirect(url_for("auth.login"))
@@ -1,38 +1,64 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify, make_response
 from flask_login import login_required
+from werkzeug.http import is_resource_modified
 from db_utils import db_connection, get_placeholder
-from datetime import datetime
+from datetime import date, datetime
+from utils.versioni_tabelle import versioni
 
 calendario_bp = Blueprint('calendario', __name__)
 
-def normalizza_data(data_str):
-    '''Converte qualsiasi formato di data in YYYY-MM-DD'''
-    if not data_str:
-        return None
-        
-    if data_str.count('-') == 2 and len(data_str.split('-')[0]) == 4:
-        return data_str
-        
-    try:
-        if '/' in data_str:
-            giorno, mese, anno = data_str.split('/')
-            return f"{anno}-{mese.zfill(2)}-{giorno.zfill(2)}"
-        else:
-            return data_str
-    except Exception:
-        return data_str
+def _giorno(valore):
+    """Data YYYY-MM-DD dai parametri start/end di FullCalendar (es. 2025-03-31T00:00:00+02:00)"""
+    return date.fromisoformat(str(valore)[:10]).isoformat()
+
+
+def _validabile(risposta, etag, modificata_il):
+    """ETag e Last-Modified sulla risposta; il browser la conserva ma la rivalida sempre"""
+    if modificata_il:
+        risposta.set_etag(etag)
+        risposta.last_modified = modificata_il
+    risposta.headers["Cache-Control"] = "private, no-cache"
+    return risposta
+
 
 @calendario_bp.route("/calendario")
 @login_required
 def calendario():
+    # Gli eventi arrivano da /api/eventi per l'intervallo visibile
+    return render_template("calendario.html")
+
+
+@calendario_bp.route("/api/eventi")
+@login_required
+def api_eventi():
+    """Lezioni con data in [start, end) nel formato eventi di FullCalendar.
+
+    ETag e Last-Modified vengono dai contatori di modifica di lezioni e corsi:
+    se nulla è cambiato dall'ultima richiesta del browser la risposta è 304
+    e la query sulle lezioni non viene eseguita.
+    """
+    try:
+        inizio = _giorno(request.args["start"])
+        fine = _giorno(request.args["end"])
+    except (KeyError, ValueError):
+        return jsonify({"success": False, "message": "Parametri start e end (YYYY-MM-DD) obbligatori"}), 400
+
+    placeholder = get_placeholder()
     with db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT lezioni.id, lezioni.id_corso, COALESCE(corsi.nome, lezioni.id_corso) as nome, 
+        (versione_lezioni, versione_corsi), modificata_il = versioni(cursor, ("lezioni", "corsi"))
+        etag = f"eventi-{versione_lezioni}-{versione_corsi}"
+        if modificata_il and not is_resource_modified(request.environ, etag=etag, last_modified=modificata_il):
+            return _validabile(make_response("", 304), etag, modificata_il)
+
+        cursor.execute(f"""
+            SELECT lezioni.id, lezioni.id_corso, COALESCE(corsi.nome, lezioni.id_corso) as nome,
                    materia, data, ora_inizio, ora_fine, stato
             FROM lezioni
             LEFT JOIN corsi ON lezioni.id_corso = corsi.id_corso
-        """)
+            WHERE lezioni.data >= {placeholder} AND lezioni.data < {placeholder}
+            ORDER BY lezioni.data, lezioni.ora_inizio
+        """, (inizio, fine))
         lezioni = cursor.fetchall()
 
     eventi = []
@@ -41,11 +67,11 @@ def calendario():
         eventi.append({
             "id": lezione["id"],
             "title": f"{lezione['nome']} - {lezione['materia']}",
-            "start": f"{normalizza_data(lezione['data'])}T{lezione['ora_inizio']}",
-            "end": f"{normalizza_data(lezione['data'])}T{lezione['ora_fine']}",
+            "start": f"{lezione['data']}T{lezione['ora_inizio']}",
+            "end": f"{lezione['data']}T{lezione['ora_fine']}",
             "backgroundColor": colore,
             "borderColor": colore,
             "extendedProps": {"stato": lezione["stato"]}
         })
 
-    return render_template("calendario.html", eventi=eventi)
+    return _validabile(jsonify(eventi), etag, modificata_il)
@@ -1,18 +1,22 @@
+import logging
 import os
-import base64
-from io import BytesIO
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 from datetime import datetime
-from werkzeug.utils import secure_filename
 import PyPDF2
-from pdf2image import convert_from_path
-from PIL import Image
-from anthropic import Anthropic
 from db_utils import db_connection, get_placeholder
 from utils.security import sanitize_input
+from utils.time_utils import data_iso
+from utils.upload import UploadNonValido, salva_upload
+from utils.job_queue import (registra_job, accoda_job, annullamento_richiesto, ultimo_job,
+                              STATO_IN_CODA, STATO_IN_CORSO, STATO_COMPLETATO)
+from utils.pdf_images import LATO_MAX_PX, ConversioneAnnullata
+from utils.pdf_cache import hash_file, testo_pdf, pagine_jpeg_con_cache, invalida_file
+from utils.claude_client import crea_client, invia_messaggio, blocco_cacheabile, tronca_storico
+from utils import cache_risposte
 
 contratti_bp = Blueprint('contratti', __name__)
+logger = logging.getLogger(__name__)
 
 # Configurazione upload
 UPLOAD_FOLDER = 'uploads/contratti'
@@ -22,59 +26,34 @@ MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 # Crea la cartella upload se non esiste
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def _estrai_testo_pypdf2(file_path):
+    text = ""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+    return text.strip()
 
 def extract_text_from_pdf(file_path):
-    """Estrae il testo da un PDF"""
+    """Estrae il testo da un PDF (dalla cache se lo stesso file è già stato letto)"""
     try:
-        text = ""
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+        return testo_pdf(file_path, _estrai_testo_pypdf2)
     except Exception as e:
         print(f"Errore nell'estrazione del testo PDF: {e}")
         return ""
 
-def pdf_to_base64_images(file_path, max_pages=20):
+def pdf_to_base64_images(file_path, max_pages=20, annulla=None):
     """Converte PDF in immagini base64 per Claude Vision.
-    Usa 300 DPI per OCR preciso e JPEG (qualità 92) per ridurre RAM e payload.
+    Renderizza una pagina alla volta a ~1568px di lato lungo, JPEG qualità 92
+    (in parallelo se PDF_PROCESSI > 1), riusando le pagine in cache per lo
+    stesso file. `annulla` interrompe la conversione.
     """
-    import gc
     try:
-        images = convert_from_path(file_path, first_page=1, last_page=max_pages, dpi=300)
-
-        base64_images = []
-        for img in images:
-            # Ridimensiona se troppo grande (1568px è il limite consigliato da Anthropic)
-            max_size = 1568
-            if img.width > max_size or img.height > max_size:
-                ratio = min(max_size / img.width, max_size / img.height)
-                new_size = (int(img.width * ratio), int(img.height * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-            # Converti in JPEG (60-70% meno RAM rispetto a PNG, qualità ottima per OCR)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            buffered = BytesIO()
-            img.save(buffered, format="JPEG", quality=92, optimize=True)
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            base64_images.append(img_str)
-
-            # Libera subito la memoria dell'immagine
-            img.close()
-            buffered.close()
-
-        # Pulizia esplicita della lista immagini originali
-        del images
-        gc.collect()
-
-        return base64_images
+        return pagine_jpeg_con_cache(file_path, max_pagine=max_pages, annulla=annulla)
+    except ConversioneAnnullata:
+        raise
     except Exception as e:
         print(f"Errore nella conversione PDF in immagini: {e}")
-        gc.collect()
         return None
 
 # ----- Prompt unificato per l'analisi dei contratti -----
@@ -120,6 +99,11 @@ REGOLE IMPORTANTI:
 
 Rispondi in italiano in modo strutturato e completo."""
 
+# Versione del prompt di analisi: va incrementata ad ogni modifica di
+# _PROMPT_ANALISI_CONTRATTO, così le analisi salvate con il prompt precedente
+# vengono considerate scadute e rigenerate alla prima visualizzazione.
+PROMPT_ANALISI_VERSIONE = "1"
+
 
 def _testo_contiene_date(text):
     """Verifica se il testo PyPDF2 contiene almeno 2 date italiane ben formate.
@@ -133,34 +117,38 @@ def _testo_contiene_date(text):
     return len(matches) >= 2
 
 
-def analyze_contract_with_claude(text, pdf_path=None, force_vision=False):
+def analyze_contract_with_claude(text, pdf_path=None, force_vision=False, client=None, annulla=None,
+                                 riferimento=None):
     """Analizza il contratto con Claude AI.
 
     Strategia:
     - Se pdf_path disponibile E (force_vision OPPURE testo non contiene date):
-        → usa Vision (immagini PDF a 300 DPI) + eventuale testo come contesto
+        → usa Vision (pagine PDF renderizzate con lato lungo al massimo LATO_MAX_PX,
+          JPEG) + eventuale testo come contesto
     - Altrimenti:
         → usa solo testo con prompt unificato e max_tokens=4096
 
+    `client` permette di passare un client Anthropic già pronto (o finto nei test),
+    `annulla` interrompe la conversione del PDF se il lavoro viene annullato,
+    `riferimento` (id contratto) viene registrato con i token consumati.
+
     Returns:
         tuple: (analysis, extracted_text, error)
     """
     try:
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            return None, None, "Chiave API Anthropic non configurata"
-
-        client = Anthropic(api_key=api_key)
+        client, error = crea_client(client)
+        if error:
+            return None, None, error
 
         # Decide se usare Vision
         usar_vision = pdf_path and (force_vision or not _testo_contiene_date(text))
 
         if usar_vision:
-            print("📸 Uso Vision Claude (300 DPI) per OCR potenziato...")
-            images = pdf_to_base64_images(pdf_path)
+            logger.info("Analisi contratto con Vision (pagine fino a %d px di lato lungo)", LATO_MAX_PX)
+            images = pdf_to_base64_images(pdf_path, annulla=annulla)
 
             if not images:
-                print("⚠️ Conversione PDF→immagini fallita, fallback al testo")
+                logger.warning("Conversione PDF in immagini fallita, analisi sul testo")
                 usar_vision = False
             else:
                 prompt_text = _PROMPT_ANALISI_CONTRATTO
@@ -184,73 +172,173 @@ def analyze_contract_with_claude(text, pdf_path=None, force_vision=False):
                         }
                     })
 
-                message = client.messages.create(
-                    model="claude-sonnet-4-5-20250929",
-                    max_tokens=6000,
-                    messages=[{"role": "user", "content": content}]
-                )
-                response = message.content[0].text
+                response = invia_messaggio(client, [{"role": "user", "content": content}], max_tokens=6000,
+                                           operazione="analisi_contratto_vision", riferimento=riferimento)
                 return response, response, None
 
         # Percorso testuale (PDF nativo con testo leggibile)
         if not text:
             return None, None, "Nessun testo disponibile e nessun PDF fornito"
 
-        print("📝 Analisi testuale con Claude...")
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=4096,
-            messages=[{
-                "role": "user",
-                "content": f"{_PROMPT_ANALISI_CONTRATTO}\n\nTESTO DEL CONTRATTO:\n\n{text}"
-            }]
-        )
-        return message.content[0].text, text, None
+        logger.info("Analisi testuale del contratto con Claude")
+        response = invia_messaggio(client, [{
+            "role": "user",
+            "content": f"{_PROMPT_ANALISI_CONTRATTO}\n\nTESTO DEL CONTRATTO:\n\n{text}"
+        }], max_tokens=4096, operazione="analisi_contratto", riferimento=riferimento)
+        return response, text, None
 
     except Exception as e:
         return None, None, f"Errore nell'analisi con Claude: {str(e)}"
 
-def chat_with_contract(contract_text, user_question, conversation_history=None):
-    """Chat interattiva con il contratto usando Claude"""
-    try:
-        api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not api_key:
-            return None, "Chiave API Anthropic non configurata"
-        
-        client = Anthropic(api_key=api_key)
-        
-        # Costruisci i messaggi per la conversazione
-        messages = []
-        
-        # Aggiungi la storia della conversazione se presente
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        # Aggiungi la domanda dell'utente
-        messages.append({
-            "role": "user",
-            "content": f"""Sei un assistente che aiuta a rispondere a domande su un contratto.
-            
-Ecco il testo completo del contratto:
+def _leggi_analisi_salvata(cursor, contratto_id, hash_pdf):
+    """Restituisce l'analisi salvata se è ancora valida, altrimenti None.
 
-{contract_text}
+    L'analisi è valida se è stata prodotta con la versione corrente del prompt
+    e sullo stesso PDF (stesso hash). Se il PDF non è più sul disco si usa
+    comunque l'ultima analisi disponibile.
+    """
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        SELECT hash_pdf, versione_prompt, analisi
+        FROM contratti_analisi
+        WHERE id_contratto = {placeholder}
+    """, (contratto_id,))
+    row = cursor.fetchone()
+    if not row or row['versione_prompt'] != PROMPT_ANALISI_VERSIONE:
+        return None
+    if hash_pdf is not None and row['hash_pdf'] != hash_pdf:
+        return None
+    return row['analisi']
 
-Domanda dell'utente: {user_question}
 
+def _salva_analisi(cursor, contratto_id, hash_pdf, analysis):
+    """Salva (o sostituisce) l'analisi del contratto nella tabella contratti_analisi"""
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        INSERT INTO contratti_analisi (id_contratto, hash_pdf, versione_prompt, analisi, data_analisi)
+        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+        ON CONFLICT (id_contratto) DO UPDATE SET
+            hash_pdf = excluded.hash_pdf,
+            versione_prompt = excluded.versione_prompt,
+            analisi = excluded.analisi,
+            data_analisi = excluded.data_analisi
+    """, (contratto_id, hash_pdf, PROMPT_ANALISI_VERSIONE, analysis,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+
+def _chiave_analisi(contratto_id, force_vision=False):
+    """Chiave del lavoro di analisi: la ri-analisi Vision non riusa un'analisi normale già in coda"""
+    return f"contratto:{contratto_id}:vision" if force_vision else f"contratto:{contratto_id}"
+
+
+def _accoda_analisi(contratto_id, force_vision=False, sovrascrivi_testo=False):
+    """Accoda l'analisi del contratto per il worker (riusa un lavoro già attivo dello stesso tipo)"""
+    return accoda_job('analisi_contratto', {
+        'contratto_id': contratto_id,
+        'force_vision': force_vision,
+        'sovrascrivi_testo': sovrascrivi_testo,
+    }, chiave=_chiave_analisi(contratto_id, force_vision))
+
+
+@registra_job('analisi_contratto')
+def _job_analisi_contratto(payload, client, progresso):
+    """Eseguito dal worker: analisi con Claude e salvataggio di testo e analisi.
+
+    Con `sovrascrivi_testo` il testo estratto da Claude sostituisce sempre
+    contenuto_estratto (upload, ri-analisi OCR); altrimenti solo se il testo
+    nel DB è vuoto o troppo corto.
+    """
+    contratto_id = payload['contratto_id']
+    force_vision = payload.get('force_vision', False)
+    placeholder = get_placeholder()
+
+    progresso(5, "Lettura contratto")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT file_path, contenuto_estratto FROM contratti WHERE id = {placeholder}",
+                       (contratto_id,))
+        contratto = cursor.fetchone()
+    if not contratto:
+        raise ValueError("Contratto non trovato")
+
+    contenuto = contratto['contenuto_estratto'] or ""
+    progresso(20, "Analisi con Claude AI" + (f" (Vision, pagine fino a {LATO_MAX_PX} px)" if force_vision else ""))
+    analysis, extracted_text, error = analyze_contract_with_claude(
+        "" if force_vision else contenuto,
+        pdf_path=contratto['file_path'],
+        force_vision=force_vision,
+        client=client,
+        annulla=lambda: annullamento_richiesto(payload['id_job']),
+        riferimento=contratto_id
+    )
+    if error:
+        raise RuntimeError(error)
+
+    progresso(90, "Salvataggio risultati")
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if extracted_text and (payload.get('sovrascrivi_testo') or len(contenuto) < 50):
+            cursor.execute(f"""
+                UPDATE contratti
+                SET contenuto_estratto = {placeholder}
+                WHERE id = {placeholder}
+            """, (extracted_text, contratto_id))
+        _salva_analisi(cursor, contratto_id, hash_file(contratto['file_path']), analysis)
+        conn.commit()
+
+    return {"contratto_id": contratto_id, "analysis": analysis}
+
+
+_ISTRUZIONI_CHAT_CONTRATTO = """Sei un assistente che aiuta a rispondere a domande su un contratto.
 Rispondi in modo preciso basandoti esclusivamente sul contenuto del contratto. Se l'informazione non è presente nel contratto, dillo chiaramente. Rispondi in italiano."""
-        })
-        
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            messages=messages
-        )
-        
-        return message.content[0].text, None
+
+# Token massimi dello storico della chat inviato a Claude (il testo del contratto è a parte)
+CHAT_BUDGET_TOKEN = int(os.environ.get('CHAT_BUDGET_TOKEN', '6000'))
+
+
+def chat_with_contract(contract_text, user_question, conversation_history=None, client=None,
+                       riferimento=None):
+    """Chat interattiva con il contratto usando Claude.
+
+    Il testo del contratto va nel system come blocco cacheabile: le domande
+    successive sullo stesso contratto lo leggono dalla cache di Anthropic.
+    Anche lo storico fino all'ultima risposta è marcato come cacheabile.
+    """
+    try:
+        client, error = crea_client(client)
+        if error:
+            return None, error
+
+        system = [
+            {"type": "text", "text": _ISTRUZIONI_CHAT_CONTRATTO},
+            blocco_cacheabile(f"Ecco il testo completo del contratto:\n\n{contract_text}"),
+        ]
+
+        messages = [dict(m) for m in (conversation_history or [])]
+        if messages:
+            ultimo = messages[-1]
+            messages[-1] = {"role": ultimo['role'], "content": [blocco_cacheabile(ultimo['content'])]}
+        messages.append({"role": "user", "content": user_question})
+
+        answer = invia_messaggio(client, messages, max_tokens=2000, system=system,
+                                 operazione="chat_contratto", riferimento=riferimento)
+        return answer, None
     except Exception as e:
         return None, f"Errore nella chat con Claude: {str(e)}"
 
 
+def _leggi_storico_chat(cursor, contratto_id):
+    """Storico della chat del contratto nel formato messages, tagliato a CHAT_BUDGET_TOKEN"""
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        SELECT ruolo, contenuto FROM chat_contratti
+        WHERE id_contratto = {placeholder}
+        ORDER BY id
+    """, (contratto_id,))
+    storico = [{"role": r['ruolo'], "content": r['contenuto']} for r in cursor.fetchall()]
+    return tronca_storico(storico, CHAT_BUDGET_TOKEN)
+
+
 @contratti_bp.route("/contratti")
 @login_required
 def lista_contratti():
@@ -302,44 +390,18 @@ def nuovo_contratto():
 def upload_contratto():
     """Upload e analisi di un contratto PDF"""
     try:
-        # Validazione file
-        if 'file' not in request.files:
-            flash("❌ Nessun file selezionato", "danger")
-            return redirect(url_for('contratti.nuovo_contratto'))
-        
-        file = request.files['file']
-        
-        if file.filename == '':
-            flash("❌ Nessun file selezionato", "danger")
+        # Salva il file (validazione di nome, formato e dimensione)
+        file = request.files.get('file')
+        try:
+            file_path = salva_upload(file, UPLOAD_FOLDER, ALLOWED_EXTENSIONS,
+                                     prefisso=datetime.now().strftime("%Y%m%d_%H%M%S"), max_byte=MAX_FILE_SIZE)
+        except UploadNonValido as e:
+            flash(f"❌ {e}", "danger")
             return redirect(url_for('contratti.nuovo_contratto'))
         
-        if not allowed_file(file.filename):
-            flash("❌ Formato file non valido. Solo PDF permessi.", "danger")
-            return redirect(url_for('contratti.nuovo_contratto'))
-        
-        # Salva il file
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        
-        # Estrai il testo dal PDF
-        flash("⏳ Estrazione testo dal PDF...", "info")
+        # Estrai il testo dal PDF (veloce); l'analisi con Claude gira nel worker
         text = extract_text_from_pdf(file_path)
         
-        # Analizza con Claude (usa visione se testo vuoto o scansione)
-        flash("🤖 Analisi del contratto con Claude AI...", "info")
-        analysis, extracted_text, error = analyze_contract_with_claude(text, pdf_path=file_path)
-        
-        if error:
-            flash(f"⚠️ {error}", "warning")
-            analysis = "Analisi non disponibile"
-            extracted_text = text  # Fallback al testo originale
-        
-        # Usa il testo estratto da Claude se disponibile, altrimenti usa quello di PyPDF2
-        final_text = extracted_text if extracted_text else text
-        
         # Dati dal form
         numero_contratto = sanitize_input(request.form.get('numero_contratto', ''))
         cliente = sanitize_input(request.form.get('cliente', ''))
@@ -347,7 +409,7 @@ def upload_contratto():
         if id_corso == '':
             id_corso = None
         
-        # Salva nel database con il testo estratto da Claude
+        # Salva nel database con il testo estratto da PyPDF2
         with db_connection() as conn:
             cursor = conn.cursor()
             placeholder = get_placeholder()
@@ -356,7 +418,7 @@ def upload_contratto():
                 INSERT INTO contratti (numero_contratto, nome_file, file_path, data_upload, cliente, contenuto_estratto, id_corso)
                 VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
             """, (numero_contratto, file.filename, file_path, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 
-                  cliente, final_text, id_corso))
+                  cliente, text, id_corso))
             conn.commit()
             
             # Ottieni l'ID del contratto appena inserito
@@ -366,8 +428,10 @@ def upload_contratto():
                 cursor.execute("SELECT last_insert_rowid()")
             contratto_id = cursor.fetchone()[0]
         
-        flash("✅ Contratto caricato e analizzato con successo!", "success")
-        return redirect(url_for('contratti.dettaglio_contratto', contratto_id=contratto_id))
+        job_id = _accoda_analisi(contratto_id, sovrascrivi_testo=True)
+        
+        flash("✅ Contratto caricato! L'analisi con Claude AI è in corso in background.", "success")
+        return redirect(url_for('contratti.dettaglio_contratto', contratto_id=contratto_id, job=job_id))
     
     except Exception as e:
         flash(f"❌ Errore durante l'upload: {str(e)}", "danger")
@@ -394,23 +458,26 @@ def dettaglio_contratto(contratto_id):
             flash("❌ Contratto non trovato", "danger")
             return redirect(url_for('contratti.lista_contratti'))
         
-        # Ottieni analisi iniziale con Claude (usa visione se il contenuto è vuoto)
-        analysis, extracted_text, error = analyze_contract_with_claude(
-            contratto['contenuto_estratto'], 
-            pdf_path=contratto['file_path']
-        )
-        if error:
-            analysis = "Analisi non disponibile. Usa la chat per fare domande."
-        
-        # Se Claude ha estratto testo e il DB è vuoto, aggiorna il database
-        if extracted_text and (not contratto['contenuto_estratto'] or len(contratto['contenuto_estratto']) < 50):
-            cursor.execute(f"""
-                UPDATE contratti 
-                SET contenuto_estratto = {placeholder}
-                WHERE id = {placeholder}
-            """, (extracted_text, contratto_id))
-            conn.commit()
-            print(f"✅ Testo estratto salvato nel database per contratto {contratto_id}")
+        # Usa l'analisi salvata se il PDF e il prompt non sono cambiati:
+        # Claude viene interpellato solo alla prima visualizzazione o dopo una modifica
+        hash_pdf = hash_file(contratto['file_path'])
+        analysis = _leggi_analisi_salvata(cursor, contratto_id, hash_pdf)
+
+        job_id = None
+        errore_analisi = None
+        if analysis is None:
+            # Analisi assente o non più valida: la prepara il worker, la pagina resta in attesa.
+            # Un'analisi fallita o annullata non viene riaccodata a ogni visita: si mostra
+            # l'errore e l'utente può usare "Ri-analizza"
+            job_id = request.args.get('job', type=int)
+            if not job_id:
+                ultimo = ultimo_job(_chiave_analisi(contratto_id), _chiave_analisi(contratto_id, True))
+                if ultimo is None or ultimo['stato'] == STATO_COMPLETATO:
+                    job_id = _accoda_analisi(contratto_id)
+                elif ultimo['stato'] in (STATO_IN_CODA, STATO_IN_CORSO):
+                    job_id = ultimo['id']
+                else:
+                    errore_analisi = ultimo['errore'] or ultimo['messaggio']
         
         # Ottieni tutti i corsi per collegamento
         cursor.execute("SELECT * FROM corsi ORDER BY nome")
@@ -427,11 +494,16 @@ def dettaglio_contratto(contratto_id):
             """, (contratto['nome_corso'],))
             fatture_collegate = cursor.fetchall()
 
+        storico_chat = _leggi_storico_chat(cursor, contratto_id)
+
     return render_template("dettaglio_contratto.html",
                           contratto=contratto,
                           analysis=analysis,
+                          job_id=job_id,
+                          errore_analisi=errore_analisi,
                           corsi=corsi,
                           fatture_collegate=fatture_collegate,
+                          storico_chat=storico_chat,
                           current_tab='altro')
 
 
@@ -457,26 +529,68 @@ def chat_contratto(contratto_id):
                 WHERE id = {placeholder}
             """, (contratto_id,))
             contratto = cursor.fetchone()
+            
+            if not contratto:
+                return jsonify({"success": False, "error": "Contratto non trovato"}), 404
+            
+            storico = _leggi_storico_chat(cursor, contratto_id)
         
-        if not contratto:
-            return jsonify({"success": False, "error": "Contratto non trovato"}), 404
+        # Stessa domanda a inizio conversazione sullo stesso contratto: risposta dalla
+        # cache, senza chiamare Claude (a conversazione avviata la risposta dipende dallo storico)
+        answer = None if storico else cache_risposte.leggi_risposta(contratto['contenuto_estratto'], question)
+        cached = answer is not None
         
-        # Chat con Claude
-        answer, error = chat_with_contract(contratto['contenuto_estratto'], question)
+        if not cached:
+            # Chat con Claude (contratto in cache lato Anthropic + storico della conversazione)
+            answer, error = chat_with_contract(contratto['contenuto_estratto'], question,
+                                               conversation_history=storico, riferimento=contratto_id)
+            
+            if error:
+                return jsonify({"success": False, "error": error}), 500
+            
+            if not storico:
+                cache_risposte.salva_risposta(contratto['contenuto_estratto'], question, answer)
         
-        if error:
-            return jsonify({"success": False, "error": error}), 500
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            adesso = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for ruolo, contenuto in (("user", question), ("assistant", answer)):
+                cursor.execute(f"""
+                    INSERT INTO chat_contratti (id_contratto, ruolo, contenuto, data)
+                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
+                """, (contratto_id, ruolo, contenuto, adesso))
+            conn.commit()
         
         return jsonify({
             "success": True,
             "question": question,
-            "answer": answer
+            "answer": answer,
+            "cached": cached
         })
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@contratti_bp.route("/contratti/<int:contratto_id>/chat/nuova", methods=["POST"])
+@login_required
+def nuova_chat_contratto(contratto_id):
+    """Cancella lo storico della chat del contratto (nuova conversazione)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        placeholder = get_placeholder()
+        cursor.execute(f"DELETE FROM chat_contratti WHERE id_contratto = {placeholder}", (contratto_id,))
+        conn.commit()
+    return jsonify({"success": True})
+
+
+@contratti_bp.route("/contratti/chat/statistiche")
+@login_required
+def statistiche_chat_contratti():
+    """Contatori hit/miss della cache delle risposte della chat"""
+    return jsonify({"success": True, **cache_risposte.statistiche()})
+
+
 @contratti_bp.route("/contratti/<int:contratto_id>/download")
 @login_required
 def download_contratto(contratto_id):
@@ -522,9 +636,12 @@ def elimina_contratto(contratto_id):
             
             # Elimina il file fisico
             if os.path.exists(contratto['file_path']):
+                invalida_file(contratto['file_path'])
                 os.remove(contratto['file_path'])
             
             # Elimina dal database
+            cursor.execute(f"DELETE FROM contratti_analisi WHERE id_contratto = {placeholder}", (contratto_id,))
+            cursor.execute(f"DELETE FROM chat_contratti WHERE id_contratto = {placeholder}", (contratto_id,))
             cursor.execute(f"DELETE FROM contratti WHERE id = {placeholder}", (contratto_id,))
             conn.commit()
         
@@ -557,7 +674,10 @@ def elimina_contratti_multipli():
                     contratto = cursor.fetchone()
                     if contratto:
                         if contratto['file_path'] and os.path.exists(contratto['file_path']):
+                            invalida_file(contratto['file_path'])
                             os.remove(contratto['file_path'])
+                        cursor.execute(f"DELETE FROM contratti_analisi WHERE id_contratto = {placeholder}", (contratto_id_int,))
+                        cursor.execute(f"DELETE FROM chat_contratti WHERE id_contratto = {placeholder}", (contratto_id_int,))
                         cursor.execute(f"DELETE FROM contratti WHERE id = {placeholder}", (contratto_id_int,))
                         eliminati += 1
                 except Exception as e:
@@ -640,7 +760,6 @@ def verifica_conformita(contratto_id):
             risultato = confronta_lezioni(lezioni_contratto, lezioni_db)
 
             # --- Carica lezioni rinunciate per questo contratto ---
-            _ensure_lezioni_rinunciate_table(cursor)
             cursor.execute(f"""
                 SELECT data, ora_inizio, ora_fine FROM lezioni_rinunciate
                 WHERE id_contratto = {placeholder}
@@ -669,12 +788,12 @@ def verifica_conformita(contratto_id):
                 ore_contratto_estratte = estrai_ore_da_contratto(contratto['contenuto_estratto'])
 
                 cursor.execute(f"""
-                    SELECT SUM(calcola_ore(ora_inizio, ora_fine))
+                    SELECT SUM(durata_minuti)
                     FROM lezioni
                     WHERE id_corso = {placeholder}
                 """, (contratto['id_corso'],))
                 row = cursor.fetchone()
-                ore_db_totali = round(float(row[0]), 2) if row and row[0] is not None else 0.0
+                ore_db_totali = round(row[0] / 60, 2) if row and row[0] is not None else 0.0
 
             # Fatture collegate (via nome corso)
             fatture_collegate = []
@@ -700,34 +819,6 @@ def verifica_conformita(contratto_id):
         return redirect(url_for('contratti.dettaglio_contratto', contratto_id=contratto_id))
 
 
-def _ensure_lezioni_rinunciate_table(cursor):
-    """Crea la tabella lezioni_rinunciate se non esiste (compatibile SQLite e PostgreSQL)"""
-    if get_placeholder() == "%s":  # PostgreSQL
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lezioni_rinunciate (
-                id SERIAL PRIMARY KEY,
-                id_contratto INTEGER NOT NULL,
-                data VARCHAR(10) NOT NULL,
-                ora_inizio VARCHAR(5) NOT NULL,
-                ora_fine VARCHAR(5) NOT NULL,
-                data_rinuncia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(id_contratto, data, ora_inizio, ora_fine)
-            )
-        """)
-    else:  # SQLite
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lezioni_rinunciate (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_contratto INTEGER NOT NULL,
-                data VARCHAR(10) NOT NULL,
-                ora_inizio VARCHAR(5) NOT NULL,
-                ora_fine VARCHAR(5) NOT NULL,
-                data_rinuncia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(id_contratto, data, ora_inizio, ora_fine)
-            )
-        """)
-
-
 @contratti_bp.route("/contratti/<int:contratto_id>/segna-rinunciata", methods=["POST"])
 @login_required
 def segna_rinunciata(contratto_id):
@@ -744,7 +835,6 @@ def segna_rinunciata(contratto_id):
         with db_connection() as conn:
             cursor = conn.cursor()
             placeholder = get_placeholder()
-            _ensure_lezioni_rinunciate_table(cursor)
 
             try:
                 cursor.execute(f"""
@@ -778,7 +868,6 @@ def rimuovi_rinuncia(contratto_id):
         with db_connection() as conn:
             cursor = conn.cursor()
             placeholder = get_placeholder()
-            _ensure_lezioni_rinunciate_table(cursor)
 
             cursor.execute(f"""
                 DELETE FROM lezioni_rinunciate
@@ -798,8 +887,8 @@ def rimuovi_rinuncia(contratto_id):
 @contratti_bp.route("/contratti/<int:contratto_id>/rianalizza", methods=["POST"])
 @login_required
 def rianalizza_ocr(contratto_id):
-    """Forza ri-analisi OCR potenziata con Vision Claude a 300 DPI.
-    Aggiorna contenuto_estratto nel DB e restituisce il nuovo testo come JSON.
+    """Forza ri-analisi OCR potenziata con Vision Claude (pagine fino a LATO_MAX_PX di lato lungo).
+    Accoda il lavoro e restituisce subito il job_id: il client interroga /jobs/<id>.
     """
     try:
         with db_connection() as conn:
@@ -815,23 +904,10 @@ def rianalizza_ocr(contratto_id):
             if not contratto['file_path'] or not os.path.exists(contratto['file_path']):
                 return jsonify({"success": False, "error": "File PDF non trovato sul disco"}), 404
 
-            # Forza sempre Vision a 300 DPI
-            analysis, extracted_text, error = analyze_contract_with_claude(
-                "", pdf_path=contratto['file_path'], force_vision=True
-            )
-
-            if error:
-                return jsonify({"success": False, "error": error}), 500
-
-            # Aggiorna il DB con il nuovo testo estratto
-            cursor.execute(f"""
-                UPDATE contratti
-                SET contenuto_estratto = {placeholder}
-                WHERE id = {placeholder}
-            """, (extracted_text, contratto_id))
-            conn.commit()
+        # Forza sempre Vision (pagine limitate a LATO_MAX_PX): il lavoro gira nel worker
+        job_id = _accoda_analisi(contratto_id, force_vision=True, sovrascrivi_testo=True)
 
-        return jsonify({"success": True, "analysis": analysis})
+        return jsonify({"success": True, "job_id": job_id})
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -898,11 +974,9 @@ def _normalizza_data(data_str):
     import re
     data_str = data_str.strip()
 
-    # DD/MM/YYYY o DD-MM-YYYY
-    m = re.match(r'^(\d{1,2})[/\-](\d{1,2})[/\-](\d{4})$', data_str)
-    if m:
-        g, me, a = m.group(1), m.group(2), m.group(3)
-        return f"{a}-{me.zfill(2)}-{g.zfill(2)}"
+    # DD/MM/YYYY o DD-MM-YYYY (None se il giorno non esiste)
+    if re.match(r'^\d{1,2}[/\-]\d{1,2}[/\-]\d{4}$', data_str):
+        return data_iso(data_str)
 
     # "13 febbraio 2026" / "13 feb 2026"
     m = re.match(r'^(\d{1,2})\s+([a-zà-ü]+)\s+(\d{4})$', data_str.lower())
@@ -910,7 +984,7 @@ def _normalizza_data(data_str):
         g, nome_mese, a = m.group(1), m.group(2), m.group(3)
         mese_num = _MESI_IT.get(nome_mese)
         if mese_num:
-            return f"{a}-{mese_num}-{g.zfill(2)}"
+            return data_iso(f"{a}-{mese_num}-{g.zfill(2)}")
 
     return None
 
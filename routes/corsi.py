@@ -2,8 +2,10 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from db_utils import db_connection, get_placeholder
 from datetime import datetime
-from utils.time_utils import format_datetime_for_db
+from utils.time_utils import format_datetime_for_db, durata_e_importo
 from utils.security import sanitize_input, sanitize_form_data
+from utils.statistiche_corsi import stato_fatturazione_corsi, statistiche_corso
+from utils.riepilogo_corsi import aggiorna_riepilogo
 
 corsi_bp = Blueprint('corsi', __name__)
 
@@ -50,6 +52,7 @@ def elimina_corso(id_corso):
         if corso:
             cursor.execute(f"DELETE FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
             cursor.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
+            aggiorna_riepilogo(cursor, [id_corso])
             conn.commit()
             flash("🗑️ Corso e lezioni associate eliminati con successo!", "success")
         else:
@@ -77,66 +80,18 @@ def dettagli_corso(corso):
             return redirect(url_for("corsi.lista_corsi"))
             
         nome_corso = corso_info["nome"]
-        
-        cursor.execute(f"SELECT COUNT(*) FROM lezioni WHERE id_corso = {placeholder}", (corso,))
-        esiste = cursor.fetchone()[0]
-        ha_lezioni = esiste > 0
-
-        placeholder = get_placeholder()
-        def ore(sql):
-            cursor.execute(sql, (corso,))
-            return cursor.fetchone()[0] or 0
-
-        ore_totali = ore(f"""
-            SELECT SUM(calcola_ore(ora_inizio, ora_fine))
-            FROM lezioni WHERE id_corso = {placeholder}
-        """)
-
-        placeholder = get_placeholder()
-        ore_completate = ore(f"""
-            SELECT SUM(calcola_ore(ora_inizio, ora_fine))
-            FROM lezioni WHERE id_corso = {placeholder} AND stato = 'Completato'
-        """)
-
-        placeholder = get_placeholder()
-        ore_fatturate = ore(f"""
-            SELECT SUM(CASE WHEN fatturato = 1 THEN calcola_ore(ora_inizio, ora_fine) ELSE 0 END)
-            FROM lezioni WHERE id_corso = {placeholder}
-        """)
-
-        placeholder = get_placeholder()
-        cursor.execute(f"""
-            SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
-            FROM lezioni WHERE id_corso = {placeholder} AND fatturato = 1
-        """, (corso,))
-        totale_fatturato_lordo = cursor.fetchone()[0] or 0
-
-        # Ammontare totale del corso (tutte le ore × compenso)
-        placeholder = get_placeholder()
-        cursor.execute(f"""
-            SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
-            FROM lezioni WHERE id_corso = {placeholder}
-        """, (corso,))
-        ammontare_totale = cursor.fetchone()[0] or 0
-
-        # Ammontare completato (solo lezioni completate × compenso)
-        placeholder = get_placeholder()
-        cursor.execute(f"""
-            SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
-            FROM lezioni WHERE id_corso = {placeholder} AND stato = 'Completato'
-        """, (corso,))
-        ammontare_completato = cursor.fetchone()[0] or 0
+        stat = statistiche_corso(cursor, corso)
 
     return render_template("dettagli_corso.html",
                            corso=corso,
                            nome_corso=nome_corso,
-                           ore_totali=ore_totali,
-                           ore_completate=ore_completate,
-                           ore_fatturate=ore_fatturate,
-                           totale_fatturato_lordo=totale_fatturato_lordo,
-                           ammontare_totale=ammontare_totale,
-                           ammontare_completato=ammontare_completato,
-                           ha_lezioni=ha_lezioni)
+                           ore_totali=stat["ore_totali"],
+                           ore_completate=stat["ore_completate"],
+                           ore_fatturate=stat["ore_fatturate"],
+                           totale_fatturato_lordo=stat["importo_fatturato"],
+                           ammontare_totale=stat["importo_totale"],
+                           ammontare_completato=stat["importo_completato"],
+                           ha_lezioni=stat["totale_lezioni"] > 0)
 
 
 @corsi_bp.route("/lista_corsi")
@@ -144,40 +99,8 @@ def dettagli_corso(corso):
 def lista_corsi():
     with db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM corsi ORDER BY nome")
-        corsi_rows = cursor.fetchall()
-        
-        corsi = []
-        for corso_row in corsi_rows:
-            corso = dict(corso_row)
-            placeholder = get_placeholder()
-            cursor.execute(f"""
-                SELECT 
-                    COUNT(*) as totale,
-                    SUM(CASE WHEN fatturato = 1 THEN 1 ELSE 0 END) as completamente_fatturate,
-                    SUM(CASE WHEN fatturato = 2 THEN 1 ELSE 0 END) as parzialmente_fatturate,
-                    SUM(calcola_ore(ora_inizio, ora_fine)) as ore_totali,
-                    SUM(CASE WHEN fatturato = 1 THEN calcola_ore(ora_inizio, ora_fine) ELSE 0 END) as ore_fatturate
-                FROM lezioni 
-                WHERE id_corso = {placeholder}
-            """, (corso['id_corso'],))
-            
-            result = cursor.fetchone()
-            if result and result['totale'] > 0:
-                corso['completamente_fatturato'] = (result['totale'] == result['completamente_fatturate'])
-                corso['parzialmente_fatturato'] = (result['parzialmente_fatturate'] > 0)
-                corso['ore_totali'] = result['ore_totali'] or 0
-                corso['ore_fatturate'] = result['ore_fatturate'] or 0
-                corso['ore_rimanenti'] = corso['ore_totali'] - corso['ore_fatturate']
-            else:
-                corso['completamente_fatturato'] = False
-                corso['parzialmente_fatturato'] = False
-                corso['ore_totali'] = 0
-                corso['ore_fatturate'] = 0
-                corso['ore_rimanenti'] = 0
-            
-            corsi.append(corso)
-                
+        corsi = stato_fatturazione_corsi(cursor)
+
     return render_template("corsi.html", corsi=corsi, current_tab='corsi')
 
 
@@ -230,13 +153,14 @@ def archivia_corso(id_corso):
             for lezione in lezioni:
                 placeholder = get_placeholder()
                 cursor.execute(f"""
-                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, ore_fatturate)
-                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, ore_fatturate, durata_minuti, importo)
+                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
                 """, (
                     lezione["id_corso"], lezione["materia"], lezione["data"],
                     lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
                     lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], 
-                    lezione["mese_fatturato"], lezione.get("ore_fatturate", 0)
+                    lezione["mese_fatturato"], dict(lezione).get("ore_fatturate", 0),
+                    *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
                 ))
 
             placeholder = get_placeholder()
@@ -249,11 +173,12 @@ def archivia_corso(id_corso):
                 cursor.execute(f"""
                     INSERT INTO corsi_archiviati (id_corso, nome, cliente, data_archiviazione)
                     VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
-                """, (corso["id_corso"], corso["nome"], corso.get("cliente", ""), data_archiviazione))
+                """, (corso["id_corso"], corso["nome"], dict(corso).get("cliente", ""), data_archiviazione))
             
             placeholder = get_placeholder()
             cursor.execute(f"DELETE FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
             cursor.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
+            aggiorna_riepilogo(cursor, [id_corso])
             conn.commit()
 
         flash(f"✅ Corso '{id_corso}' e relative lezioni archiviate con successo!", "success")
@@ -288,6 +213,7 @@ def elimina_corsi_multipli():
                     cursor.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
                     corsi_eliminati += 1
             
+            aggiorna_riepilogo(cursor, corsi_selezionati)
             conn.commit()
             
             if corsi_eliminati > 0:
@@ -324,13 +250,14 @@ def archivia_corsi_multipli():
                     for lezione in lezioni:
                         placeholder = get_placeholder()
                         cursor.execute(f"""
-                            INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, ore_fatturate)
-                            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                            INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, ore_fatturate, durata_minuti, importo)
+                            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
                         """, (
                             lezione["id_corso"], lezione["materia"], lezione["data"],
                             lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
                             lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], 
-                            lezione["mese_fatturato"], lezione.get("ore_fatturate", 0)
+                            lezione["mese_fatturato"], dict(lezione).get("ore_fatturate", 0),
+                            *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
                         ))
                     
                     placeholder = get_placeholder()
@@ -343,13 +270,14 @@ def archivia_corsi_multipli():
                         cursor.execute(f"""
                             INSERT INTO corsi_archiviati (id_corso, nome, cliente, data_archiviazione)
                             VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder})
-                        """, (corso["id_corso"], corso["nome"], corso.get("cliente", ""), data_archiviazione))
+                        """, (corso["id_corso"], corso["nome"], dict(corso).get("cliente", ""), data_archiviazione))
                     
                     placeholder = get_placeholder()
                     cursor.execute(f"DELETE FROM lezioni WHERE id_corso = {placeholder}", (id_corso,))
                     cursor.execute(f"DELETE FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
                     corsi_archiviati += 1
             
+            aggiorna_riepilogo(cursor, corsi_selezionati)
             conn.commit()
             
             if corsi_archiviati > 0:
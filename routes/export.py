@@ -1,13 +1,20 @@
 import csv
 import io
+import os
 from flask import Blueprint, request, redirect, url_for, flash, Response, render_template, send_file
 from flask_login import login_required, current_user
-from dateutil.parser import parse
 from db_utils import db_connection, get_placeholder
-from utils.time_utils import correggi_orario
+from utils.riepilogo_corsi import aggiorna_riepilogo
+from utils.importa_lezioni import (COLONNE_LEZIONE, ErroreColonne, valida_csv, confronta_lezioni, importa_lezioni,
+                                   salva_csv, apri_csv, percorso_anteprima)
+from utils.csv_streaming import risposta_csv
+from utils.ore_libere import periodo, ore_libere, ORA_INIZIO_LAVORO, ORA_FINE_LAVORO, DURATA_FASCIA
 
 export_bp = Blueprint('export', __name__)
 
+# Lezioni modificate mostrate come esempio nell'anteprima dell'import
+ESEMPI_ANTEPRIMA = 20
+
 @export_bp.route("/esporta_csv", methods=["GET", "POST"])
 @login_required
 def esporta_csv():
@@ -22,251 +29,78 @@ def esporta_csv():
     
     
     tipo_export = request.form.get("tipo_export", "tutte")
-    
-    with db_connection() as conn:
-        cursor = conn.cursor()
-        lezioni = []
-        filename = "lezioni.csv"
-        
-        if tipo_export == "tutte":
-            query = "SELECT * FROM lezioni"
-            cursor.execute(query)
-            lezioni = cursor.fetchall()
-            filename = "tutte_lezioni.csv"
-            
-        elif tipo_export == "settimana":
-            data_settimana = request.form.get("data_settimana")
-            if not data_settimana:
-                flash("❌ Seleziona una data valida", "danger")
-                return redirect(url_for("export.esporta_csv"))
-                
-            placeholder = get_placeholder()
-            query = f"""
-                SELECT * FROM lezioni 
-                WHERE extract_year_week(data) = extract_year_week({placeholder})
-            """
-            cursor.execute(query, (data_settimana,))
-            lezioni = cursor.fetchall()
-            filename = f"lezioni_settimana_{data_settimana}.csv"
-            
-        elif tipo_export == "mese":
-            mese = request.form.get("mese")
-            if not mese:
-                flash("❌ Seleziona un mese valido", "danger")
-                return redirect(url_for("export.esporta_csv"))
-                
-            placeholder = get_placeholder()
-            query = f"""
-                SELECT * FROM lezioni 
-                WHERE extract_year_month(data) = {placeholder}
-            """
-            cursor.execute(query, (mese,))
-            lezioni = cursor.fetchall()
-            filename = f"lezioni_mese_{mese}.csv"
-            
-        elif tipo_export == "anno":
-            anno = request.form.get("anno")
-            if not anno:
-                flash("❌ Seleziona un anno valido", "danger")
-                return redirect(url_for("export.esporta_csv"))
-                
-            placeholder = get_placeholder()
-            query = f"""
-                SELECT * FROM lezioni 
-                WHERE extract_year(data) = {placeholder}
-            """
-            cursor.execute(query, (anno,))
-            lezioni = cursor.fetchall()
-            filename = f"lezioni_anno_{anno}.csv"
-            
-        elif tipo_export == "giorni_liberi":
-            tipo_periodo = request.form.get("tipo_periodo", "settimana")
-            
-            fasce_orarie = [f"{h:02d}:00" for h in range(8, 21)]
-            giorni = []
-            
-            if tipo_periodo == "settimana":
-                data_settimana = request.form.get("data_settimana_libera")
-                if not data_settimana:
-                    flash("❌ Seleziona una data valida", "danger")
-                    return redirect(url_for("export.esporta_csv"))
-                
-                placeholder = get_placeholder()
-                query_date = f"""
-                    WITH RECURSIVE dates(date) AS (
-                        SELECT (TO_DATE({placeholder}, 'YYYY-MM-DD') - INTERVAL '7 days' + 
-                               ((1 - EXTRACT(DOW FROM TO_DATE({placeholder}, 'YYYY-MM-DD')))::INTEGER % 7) * INTERVAL '1 day')::DATE
-                        UNION ALL
-                        SELECT (date + INTERVAL '1 day')::DATE
-                        FROM dates
-                        WHERE date < (TO_DATE({placeholder}, 'YYYY-MM-DD') - INTERVAL '7 days' + 
-                                     ((7 - EXTRACT(DOW FROM TO_DATE({placeholder}, 'YYYY-MM-DD')))::INTEGER % 7) * INTERVAL '1 day')::DATE
-                    )
-                    SELECT date::TEXT FROM dates
-                    WHERE extract_weekday(date::TEXT) NOT IN ('0', '6')  -- Esclude sabato e domenica
-                    ORDER BY date
-                """
-                cursor.execute(query_date, (data_settimana, data_settimana, data_settimana, data_settimana))
-                giorni = cursor.fetchall()
-                filename = f"ore_libere_settimana_{data_settimana}.csv"
-                
-            elif tipo_periodo == "mese":
-                mese = request.form.get("mese_libero")
-                if not mese:
-                    flash("❌ Seleziona un mese valido", "danger")
-                    return redirect(url_for("export.esporta_csv"))
-                
-                anno, mese_num = mese.split('-')
-                placeholder = get_placeholder()
-                query_date = f"""
-                    WITH RECURSIVE dates(date) AS (
-                        SELECT TO_DATE({placeholder}, 'YYYY-MM-DD')::DATE
-                        UNION ALL
-                        SELECT (date + INTERVAL '1 day')::DATE
-                        FROM dates
-                        WHERE extract_year_month(date::TEXT) = {placeholder}
-                    )
-                    SELECT date::TEXT FROM dates
-                    WHERE extract_weekday(date::TEXT) NOT IN ('0', '6')  -- Esclude sabato e domenica
-                    ORDER BY date
-                """
-                cursor.execute(query_date, (f"{mese}-01", mese))
-                giorni = cursor.fetchall()
-                filename = f"ore_libere_mese_{mese}.csv"
-                
-            elif tipo_periodo == "anno":
-                anno = request.form.get("anno_libero")
-                if not anno:
-                    flash("❌ Seleziona un anno valido", "danger")
-                    return redirect(url_for("export.esporta_csv"))
-                
-                placeholder = get_placeholder()
-                query_date = f"""
-                    WITH RECURSIVE dates(date) AS (
-                        SELECT TO_DATE({placeholder} || '-01-01', 'YYYY-MM-DD')::DATE
-                        UNION ALL
-                        SELECT (date + INTERVAL '1 day')::DATE
-                        FROM dates
-                        WHERE extract_year(date::TEXT) = {placeholder}
-                    )
-                    SELECT date::TEXT FROM dates
-                    WHERE extract_weekday(date::TEXT) NOT IN ('0', '6')  -- Esclude sabato e domenica
-                    ORDER BY date
-                """
-                cursor.execute(query_date, (anno, anno))
-                giorni = cursor.fetchall()
-                filename = f"ore_libere_anno_{anno}.csv"
-            else:
-                flash("❌ Tipo di periodo non valido", "danger")
-                return redirect(url_for("export.esporta_csv"))
-            
-            header = "data,giorno_settimana,ore_libere\n"
-            rows = []
-            
-            for giorno in giorni:
-                data = giorno["date"]
-                placeholder = get_placeholder()
-                giorno_settimana = ["Domenica", "Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato"][int(cursor.execute(f"SELECT extract_weekday({placeholder})", (data,)).fetchone()[0])]
-                
-                ore_libere = []
-                for ora in fasce_orarie:
-                    placeholder = get_placeholder()
-                    query_lezioni = f"""
-                        SELECT COUNT(*) FROM lezioni 
-                        WHERE data = {placeholder} 
-                        AND (
-                            (ora_inizio <= {placeholder} AND ora_fine > {placeholder}) OR
-                            (ora_inizio < {placeholder} AND ora_fine >= {placeholder}) OR
-                            (ora_inizio >= {placeholder} AND ora_fine <= {placeholder})
-                        )
-                    """
-                    cursor.execute(query_lezioni, (data, ora, ora, ora, ora, ora, ora))
-                    count = cursor.fetchone()[0]
-                    
-                    if count == 0:  # Solo le ore libere
-                        ore_libere.append(ora)
-                
-                if ore_libere:  # Solo se ci sono ore libere
-                    rows.append(f"{data},{giorno_settimana},{', '.join(ore_libere)}")
-            
-            output = header + "\n".join(rows)
-            
-            csv_buffer = io.StringIO()
-            csv_buffer.write(output)
-            csv_buffer.seek(0)
-            
-            return Response(
-                csv_buffer.getvalue(),
-                mimetype="text/csv",
-                headers={"Content-Disposition": f"attachment;filename={filename}"}
-            )
-        
-        elif tipo_export == "formato_ridotto":
-            cursor.execute("SELECT id_corso, data FROM lezioni ORDER BY data")
-            lezioni_ridotte = cursor.fetchall()
-            
-            corsi_dict = {}
-            cursor.execute("SELECT id_corso, nome, cliente FROM corsi")
-            for corso in cursor.fetchall():
-                try:
-                    cliente = corso["cliente"] if corso["cliente"] else ""
-                except (KeyError, IndexError):
-                    cliente = ""
-                    
-                corsi_dict[corso["id_corso"]] = {
-                    "nome": corso["nome"],
-                    "cliente": cliente
-                }
-            
-            header = "data,id_corso,nome_corso,cliente\n"
-            rows = []
-            for lezione in lezioni_ridotte:
-                id_corso = lezione["id_corso"]
-                corso_info = corsi_dict.get(id_corso, {"nome": id_corso, "cliente": ""})
-                rows.append(f'{lezione["data"]},{id_corso},{corso_info["nome"]},{corso_info["cliente"]}')
-            
-            output = header + "\n".join(rows)
-            
-            csv_buffer = io.StringIO()
-            csv_buffer.write(output)
-            csv_buffer.seek(0)
-            
-            return Response(
-                csv_buffer.getvalue(),
-                mimetype="text/csv",
-                headers={"Content-Disposition": f"attachment;filename=lezioni_formato_ridotto.csv"}
-            )
-        
-        corsi_clienti = {}
-        cursor.execute("SELECT id_corso, cliente FROM corsi")
-        for corso in cursor.fetchall():
-            try:
-                corsi_clienti[corso["id_corso"]] = corso["cliente"] if corso["cliente"] else ""
-            except (KeyError, IndexError):
-                corsi_clienti[corso["id_corso"]] = ""
-            
-        header = "id_corso,materia,data,ora_inizio,ora_fine,luogo,compenso_orario,stato,fatturato,mese_fatturato,ore_fatturate,cliente\n"
-        rows = []
-        for lezione in lezioni:
-            cliente = corsi_clienti[lezione["id_corso"]] if lezione["id_corso"] in corsi_clienti else ""
-            rows.append(
-                f'{lezione["id_corso"]},{lezione["materia"]},{lezione["data"]},{lezione["ora_inizio"]},'
-                f'{lezione["ora_fine"]},{lezione["luogo"]},{lezione["compenso_orario"]},'
-                f'{lezione["stato"]},{lezione["fatturato"]},{lezione["mese_fatturato"] or ""},'
-                f'{lezione.get("ore_fatturate", 0)},{cliente}'
-            )
-        output = header + "\n".join(rows)
-        
+
+    if tipo_export == "giorni_liberi":
+        tipo_periodo = request.form.get("tipo_periodo", "settimana")
+        campo_periodo = {"settimana": "data_settimana_libera", "mese": "mese_libero", "anno": "anno_libero"}
+        if tipo_periodo not in campo_periodo:
+            flash("❌ Tipo di periodo non valido", "danger")
+            return redirect(url_for("export.esporta_csv"))
+
+        valore = request.form.get(campo_periodo[tipo_periodo])
+        try:
+            inizio, fine = periodo(tipo_periodo, valore or "")
+            with db_connection() as conn:
+                giorni = ore_libere(
+                    conn.cursor(), inizio, fine,
+                    ora_inizio_lavoro=request.form.get("ora_inizio_lavoro") or ORA_INIZIO_LAVORO,
+                    ora_fine_lavoro=request.form.get("ora_fine_lavoro") or ORA_FINE_LAVORO,
+                    durata_fascia=int(request.form.get("durata_fascia") or DURATA_FASCIA),
+                )
+        except ValueError as e:
+            flash(f"❌ Periodo o orario non valido: {e}", "danger")
+            return redirect(url_for("export.esporta_csv"))
+        filename = f"ore_libere_{tipo_periodo}_{valore}.csv"
+
         csv_buffer = io.StringIO()
-        csv_buffer.write(output)
-        csv_buffer.seek(0)
-        
-        response = Response(
+        writer = csv.writer(csv_buffer, lineterminator="\n")
+        writer.writerow(["data", "giorno_settimana", "ore_libere"])
+        for data, giorno_settimana, fasce in giorni:
+            writer.writerow([data, giorno_settimana, ", ".join(fasce)])
+
+        return Response(
             csv_buffer.getvalue(),
             mimetype="text/csv",
             headers={"Content-Disposition": f"attachment;filename={filename}"}
         )
-        return response
+
+    if tipo_export == "formato_ridotto":
+        return risposta_csv("""
+            SELECT l.data, l.id_corso, COALESCE(c.nome, l.id_corso), COALESCE(c.cliente, '')
+            FROM lezioni l
+            LEFT JOIN corsi c ON l.id_corso = c.id_corso
+            ORDER BY l.data, l.ora_inizio, l.id
+        """, (), ["data", "id_corso", "nome_corso", "cliente"], "lezioni_formato_ridotto.csv")
+
+    # Lezioni di tutto l'archivio o di una settimana (lunedì-domenica), un mese, un anno
+    campo_periodo = {
+        "settimana": ("data_settimana", "❌ Seleziona una data valida"),
+        "mese": ("mese", "❌ Seleziona un mese valido"),
+        "anno": ("anno", "❌ Seleziona un anno valido"),
+    }
+    filtro, params, filename = "", (), "tutte_lezioni.csv"
+    if tipo_export in campo_periodo:
+        campo, messaggio = campo_periodo[tipo_export]
+        valore = request.form.get(campo)
+        try:
+            inizio, fine = periodo(tipo_export, valore or "")
+        except ValueError:
+            flash(messaggio, "danger")
+            return redirect(url_for("export.esporta_csv"))
+        placeholder = get_placeholder()
+        filtro = f"WHERE l.data >= {placeholder} AND l.data <= {placeholder}"
+        params = (inizio.isoformat(), fine.isoformat())
+        filename = f"lezioni_{tipo_export}_{valore}.csv"
+
+    colonne = ["id_corso", "materia", "data", "ora_inizio", "ora_fine", "luogo", "compenso_orario",
+               "stato", "fatturato", "mese_fatturato", "ore_fatturate"]
+    return risposta_csv(f"""
+        SELECT {', '.join(f'l.{colonna}' for colonna in colonne)}, COALESCE(c.cliente, '')
+        FROM lezioni l
+        LEFT JOIN corsi c ON l.id_corso = c.id_corso
+        {filtro}
+        ORDER BY l.data, l.ora_inizio, l.id
+    """, params, colonne + ["cliente"], filename)
 
 
 @export_bp.route("/importa_csv", methods=["GET", "POST"])
@@ -279,117 +113,69 @@ def importa_csv():
         return redirect(url_for('auth.login'))
         
     if request.method == "POST":
-        file = request.files.get("file")
-        if not file or file.filename == "":
-            flash("❌ Nessun file selezionato!", "danger")
-            filter_params = {k: v for k, v in request.args.items() if v}
-            return redirect(url_for("lezioni.dashboard", **filter_params))
+        filter_params = {k: v for k, v in request.args.items() if v}
+        codice = request.form.get("anteprima")
+        try:
+            if codice:
+                # Conferma di un'anteprima: il file è già stato salvato
+                percorso = percorso_anteprima(codice)
+            else:
+                codice, percorso = salva_csv(request.files.get("file"))
+        except (ValueError, FileNotFoundError) as e:
+            flash(f"❌ {e}", "danger")
+            return redirect(url_for("export.importa_csv"))
 
-        if not file.filename.endswith(".csv"):
-            flash("❌ Formato non supportato. Carica un file CSV.", "danger")
-            filter_params = {k: v for k, v in request.args.items() if v}
+        try:
+            with apri_csv(percorso) as f:
+                lezioni, clienti, errori, colonne_opzionali_mancanti = valida_csv(f)
+        except ErroreColonne as e:
+            os.remove(percorso)
+            flash(f"❌ {e}", "danger")
+            return redirect(url_for("lezioni.dashboard", **filter_params))
+        except Exception as e:
+            os.remove(percorso)
+            flash(f"❌ Errore durante la lettura del file: {str(e)}", "danger")
             return redirect(url_for("lezioni.dashboard", **filter_params))
 
-        try:
-            stream = file.stream.read().decode("utf-8").splitlines()
-            csv_reader = csv.DictReader(stream)
+        if colonne_opzionali_mancanti:
+            flash(f"ℹ️ Colonne opzionali mancanti (verranno usati valori predefiniti): {', '.join(colonne_opzionali_mancanti)}", "info")
 
-            colonne_minime = [
-                "id_corso", "materia", "data", "ora_inizio", "ora_fine"
-            ]
-            colonne_opzionali = [
-                "luogo", "compenso_orario", "stato", "fatturato", "mese_fatturato", "ore_fatturate"
-            ]
-            fieldnames = csv_reader.fieldnames or []
-            colonne_mancanti = [col for col in colonne_minime if col not in fieldnames]
-            if colonne_mancanti:
-                flash(f"❌ Colonne essenziali mancanti nel CSV: {', '.join(colonne_mancanti)}", "danger")
-                filter_params = {k: v for k, v in request.args.items() if v}
-                return redirect(url_for("lezioni.dashboard", **filter_params))
-                
-            colonne_opzionali_mancanti = [col for col in colonne_opzionali if col not in fieldnames]
-            if colonne_opzionali_mancanti:
-                flash(f"ℹ️ Colonne opzionali mancanti (verranno usati valori predefiniti): {', '.join(colonne_opzionali_mancanti)}", "info")
+        if request.form.get("azione") == "anteprima":
+            with db_connection() as conn:
+                confronto = confronta_lezioni(conn.cursor(), lezioni, clienti)
+            anteprima = {
+                "codice": codice,
+                "nuove": len(confronto["nuove"]),
+                "modificate": len(confronto["modificate"]),
+                "duplicate": confronto["duplicate"],
+                "corsi_nuovi": len(confronto["corsi_nuovi"]),
+                "esempi_modificate": [dict(zip(COLONNE_LEZIONE, lezione))
+                                      for _, lezione in confronto["modificate"][:ESEMPI_ANTEPRIMA]],
+            }
+            return render_template("importa_csv.html", anteprima=anteprima, errori=errori)
 
+        try:
             with db_connection() as conn:
                 cursor = conn.cursor()
-
-                for row in csv_reader:
-                    try:
-                        id_corso = row.get("id_corso", "").strip()
-                        materia = row.get("materia", "").strip()
-                        data_originale = row.get("data", "").strip()
-                        ora_inizio = correggi_orario(row.get("ora_inizio", "").strip())
-                        ora_fine = correggi_orario(row.get("ora_fine", "").strip())
-                        
-                        if not ora_inizio or not ora_fine:
-                            flash(f"❌ Orario non valido per la lezione '{materia}'", "danger")
-                            continue
-                            
-                        luogo = row.get("luogo", "").strip() if "luogo" in fieldnames else ""
-                        compenso_orario = row.get("compenso_orario", "0").strip() if "compenso_orario" in fieldnames else "0"
-                        stato = row.get("stato", "Pianificato").strip() if "stato" in fieldnames else "Pianificato"
-                        cliente = row.get("cliente", "").strip() if "cliente" in fieldnames else ""
-                        
-                        try:
-                            fatturato_val = int(row.get("fatturato", "0").strip()) if "fatturato" in fieldnames else 0
-                        except ValueError:
-                            fatturato_val = 0
-                            
-                        mese_fatturato = row.get("mese_fatturato", "").strip() if "mese_fatturato" in fieldnames else None
-                        if mese_fatturato == "":
-                            mese_fatturato = None
-                            
-                        placeholder = get_placeholder()
-                        cursor.execute(f"""
-                            SELECT calcola_ore({placeholder}, {placeholder}) as ore_totali
-                        """, (ora_inizio, ora_fine))
-                        ore_totali = cursor.fetchone()["ore_totali"]
-                        
-                        ore_fatturate = ore_totali if fatturato_val > 0 else 0.0
-                        
-                        data_convertita = parse(data_originale).strftime("%Y-%m-%d") if data_originale else None
-                        
-                        placeholder = get_placeholder()
-                        cursor.execute(f"SELECT COUNT(*) FROM corsi WHERE id_corso = {placeholder}", (id_corso,))
-                        if cursor.fetchone()[0] == 0:
-                            nome_corso = f"Corso {id_corso}"
-                            placeholder = get_placeholder()
-                            cursor.execute(f"INSERT INTO corsi (id_corso, nome, cliente) VALUES ({placeholder}, {placeholder}, {placeholder})", 
-                                          (id_corso, nome_corso, cliente))
-                            
-                        placeholder = get_placeholder()
-                        cursor.execute(f"""
-                            INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, ore_fatturate)
-                            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-                        """, (
-                            id_corso,
-                            materia,
-                            data_convertita,
-                            ora_inizio,
-                            ora_fine,
-                            luogo,
-                            float(compenso_orario.replace(',', '.')) if compenso_orario else 0.0,
-                            stato,
-                            fatturato_val,
-                            mese_fatturato,
-                            ore_fatturate
-                        ))
-                        
-                        print(f"✅ Lezione importata: {materia} - {data_convertita} ({ora_inizio}-{ora_fine})")
-
-                    except Exception as e:
-                        print(f"❌ Errore durante l'inserimento della riga: {row} → {str(e)}")
-                        flash("❌ Errore nell'importazione di una riga. Controlla il file CSV.", "danger")
-
+                confronto = confronta_lezioni(cursor, lezioni, clienti)
+                importa_lezioni(cursor, confronto)
                 conn.commit()
-
-            flash("✅ CSV importato con successo!", "success")
-
         except Exception as e:
-            flash(f"❌ Errore durante la lettura del file: {str(e)}", "danger")
-
-        filter_params = {k: v for k, v in request.args.items() if v}
+            print(f"❌ Errore durante l'importazione del CSV: {str(e)}")
+            flash(f"❌ Errore durante l'importazione, nessuna lezione salvata: {str(e)}", "danger")
+            return render_template("importa_csv.html", errori=errori)
+        finally:
+            os.remove(percorso)
+
+        esito = (f"{len(confronto['nuove'])} lezioni nuove, {len(confronto['modificate'])} aggiornate, "
+                 f"{confronto['duplicate']} già presenti")
+        print(f"✅ Import CSV: {esito}, {len(confronto['corsi_nuovi'])} corsi nuovi, {len(errori)} righe scartate")
+        if errori:
+            # Il report può essere lungo: mostrato nella pagina, non in un flash per riga
+            flash(f"⚠️ Import completato: {esito}; {len(errori)} righe scartate (dettaglio sotto)", "warning")
+            return render_template("importa_csv.html", errori=errori)
+
+        flash(f"✅ CSV importato con successo! {esito}", "success")
         return redirect(url_for("lezioni.dashboard", **filter_params))
 
     return render_template("importa_csv.html")
@@ -403,7 +189,7 @@ def segnala_fatturato():
 
     if not corso or not mese_fatturato:
         flash("Errore: Devi selezionare un corso e un mese!", "danger")
-        return redirect(url_for("compenso"))
+        return redirect(url_for("lezioni.compenso"))
 
     try:
         with db_connection() as conn:
@@ -414,9 +200,10 @@ def segnala_fatturato():
                 SET fatturato = 1, mese_fatturato = {placeholder}
                 WHERE id_corso = {placeholder} AND stato = 'Completato' AND fatturato = 0
             """, (mese_fatturato, corso))
+            aggiorna_riepilogo(cursor, [corso])
             conn.commit()
         flash("✅ Lezioni marcate come fatturate con successo!", "success")
     except Exception as e:
         flash(f"❌ Errore durante l'aggiornamento: {str(e)}", "danger")
 
-    return redirect(url_for("compenso", corso=corso))
+    return redirect(url_for("lezioni.compenso", corso=corso))
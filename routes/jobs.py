@@ -0,0 +1,37 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from utils.job_queue import leggi_job, annulla_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route("/jobs/<int:job_id>")
+@login_required
+def stato_job(job_id):
+    """Stato e avanzamento di un lavoro in background (interrogato dai template)"""
+    job = leggi_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Lavoro non trovato"}), 404
+
+    return jsonify({
+        "success": True,
+        "id": job['id'],
+        "tipo": job['tipo'],
+        "stato": job['stato'],
+        "progresso": job['progresso'],
+        "messaggio": job['messaggio'],
+        "risultato": job['risultato'],
+        "errore": job['errore'],
+        "aggiornato_il": job['aggiornato_il'],
+    })
+
+
+@jobs_bp.route("/jobs/<int:job_id>/annulla", methods=["POST"])
+@login_required
+def annulla(job_id):
+    """Annulla un lavoro in coda o in corso (il worker interrompe la conversione del PDF)"""
+    if not leggi_job(job_id):
+        return jsonify({"success": False, "error": "Lavoro non trovato"}), 404
+    if not annulla_job(job_id):
+        return jsonify({"success": False, "error": "Il lavoro è già concluso"}), 409
+    return jsonify({"success": True})
@@ -1,12 +1,88 @@
+import base64
+import json
+import os
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 from db_utils import db_connection, get_placeholder
-from utils.time_utils import correggi_orario, calcola_ore
+from utils.time_utils import correggi_orario, durata_e_importo, data_iso
 from utils.security import sanitize_input, sanitize_form_data
+from utils.statistiche_corsi import stato_fatturazione_corsi
+from utils.riepilogo_corsi import aggiorna_riepilogo, corsi_delle_lezioni, statistiche_da_riepilogo
+from utils.compensi import report_compensi
 
 lezioni_bp = Blueprint('lezioni', __name__)
 
+# Lezioni per pagina nella dashboard; ?per_pagina= la cambia fino a DASHBOARD_PAGINA_MAX
+DASHBOARD_PAGINA = int(os.environ.get('DASHBOARD_PAGINA', '50'))
+DASHBOARD_PAGINA_MAX = 500
+
+# Parametri GET della dashboard: colonna e confronto
+FILTRI_DASHBOARD = {
+    "materia": ("materia", "LIKE"),
+    "data": ("data", "="),
+    "stato": ("stato", "="),
+    "luogo": ("luogo", "LIKE"),
+    "corso": ("id_corso", "="),
+}
+
+
+def codifica_cursore(lezione):
+    """Cursore opaco della pagina successiva: (data, ora_inizio, id) dell'ultima lezione mostrata"""
+    valori = json.dumps([lezione['data'], lezione['ora_inizio'], lezione['id']])
+    return base64.urlsafe_b64encode(valori.encode()).decode().rstrip("=")
+
+
+def decodifica_cursore(cursore):
+    """(data, ora_inizio, id) dal cursore; ValueError se non è valido"""
+    try:
+        data, ora_inizio, id_lezione = json.loads(base64.urlsafe_b64decode(cursore + "=" * (-len(cursore) % 4)))
+        return str(data), str(ora_inizio), int(id_lezione)
+    except (ValueError, TypeError):
+        raise ValueError(f"Cursore non valido: {cursore!r}")
+
+
+def pagina_lezioni(cursor, args):
+    """Una pagina delle lezioni della dashboard ordinate per (data, ora_inizio, id).
+
+    Paginazione keyset: la pagina successiva parte dopo l'ultima lezione
+    mostrata (parametro "dopo"), senza OFFSET né COUNT, quindi il costo non
+    cresce con il numero di lezioni. Restituisce (lezioni, cursore della
+    pagina successiva o None).
+    """
+    placeholder = get_placeholder()
+    condizioni = ["id_corso IS NOT NULL"]
+    params = []
+    for parametro, (colonna, confronto) in FILTRI_DASHBOARD.items():
+        valore = str(args.get(parametro, "")).strip()
+        if valore:
+            condizioni.append(f"{colonna} {confronto} {placeholder}")
+            params.append(f"%{valore}%" if confronto == "LIKE" else valore)
+
+    cursore = str(args.get("dopo", "")).strip()
+    if cursore:
+        condizioni.append(f"(data, ora_inizio, id) > ({placeholder}, {placeholder}, {placeholder})")
+        params.extend(decodifica_cursore(cursore))
+
+    try:
+        per_pagina = int(args.get("per_pagina", DASHBOARD_PAGINA))
+    except (TypeError, ValueError):
+        per_pagina = DASHBOARD_PAGINA
+    per_pagina = max(1, min(per_pagina, DASHBOARD_PAGINA_MAX))
+
+    # Una riga in più dice se esiste una pagina successiva
+    cursor.execute(f"""
+        SELECT * FROM lezioni
+        WHERE {' AND '.join(condizioni)}
+        ORDER BY data, ora_inizio, id
+        LIMIT {per_pagina + 1}
+    """, params)
+    lezioni = cursor.fetchall()
+    if len(lezioni) > per_pagina:
+        return lezioni[:per_pagina], codifica_cursore(lezioni[per_pagina - 1])
+    return lezioni, None
+
 @lezioni_bp.route("/dashboard")
 @login_required
 def dashboard():
@@ -19,54 +95,24 @@ def dashboard():
         cursor.execute(f"SELECT username FROM users WHERE id = {placeholder}", (current_user.id,))
         user = cursor.fetchone()
 
-        # Filtro dai parametri GET
-        materia = request.args.get("materia", "").strip()
-        data = request.args.get("data", "").strip()
-        stato = request.args.get("stato", "").strip()
-        luogo = request.args.get("luogo", "").strip()
-        corso = request.args.get("corso", "").strip()
-
-        # Costruzione query con filtri dinamici
-        query = "SELECT * FROM lezioni WHERE id_corso IS NOT NULL"
-        params = []
-
-        if materia:
-            query += f" AND materia LIKE {placeholder}"
-            params.append(f"%{materia}%")
-        if data:
-            query += f" AND data = {placeholder}"
-            params.append(data)
-        if stato:
-            query += f" AND stato = {placeholder}"
-            params.append(stato)
-        if luogo:
-            query += f" AND luogo LIKE {placeholder}"
-            params.append(f"%{luogo}%")
-        if corso:
-            query += f" AND id_corso = {placeholder}"
-            params.append(corso)
-
-        # Esegui query lezioni filtrate
-        cursor.execute(query, params)
-        lezioni = cursor.fetchall()
+        # Una pagina di lezioni filtrate, dalla posizione indicata dal cursore "dopo"
+        try:
+            lezioni, cursore_successivo = pagina_lezioni(cursor, request.args)
+        except ValueError:
+            flash("⚠️ Posizione della pagina non valida: mostrate le prime lezioni.", "warning")
+            lezioni, cursore_successivo = pagina_lezioni(cursor, {k: v for k, v in request.args.items() if k != "dopo"})
 
         cursor.execute("SELECT * FROM corsi ORDER BY nome")
         corsi = cursor.fetchall()
         
-        if get_placeholder() == "%s":  # PostgreSQL
-            cursor.execute("""
-                SELECT TO_CHAR(data::date, 'YYYY-MM') as mese, COUNT(*) as numero_lezioni
-                FROM lezioni
-                GROUP BY mese
-                ORDER BY mese
-            """)
-        else:  # SQLite
-            cursor.execute("""
-                SELECT strftime('%Y-%m', data) as mese, COUNT(*) as numero_lezioni
-                FROM lezioni
-                GROUP BY mese
-                ORDER BY mese
-            """)
+        # Lezioni per mese dal riepilogo_corsi (costo per corso e mese, non per lezione)
+        cursor.execute("""
+            SELECT mese, SUM(totale_lezioni) as numero_lezioni
+            FROM riepilogo_corsi
+            WHERE archiviata = 0 AND mese != ''
+            GROUP BY mese
+            ORDER BY mese
+        """)
         dati_grafico = cursor.fetchall()
         
         mesi = []
@@ -74,44 +120,15 @@ def dashboard():
         for dato in dati_grafico:
             mesi.append(dato['mese'])
             conteggi.append(dato['numero_lezioni'])
-        
-        cursor.execute("SELECT * FROM corsi_archiviati ORDER BY data_archiviazione DESC")
-        corsi_archiviati = cursor.fetchall()
 
         # Alert "corsi conclusi da fatturare": corsi 100% completati e interamente da fatturare
-        if placeholder == "%s":  # PostgreSQL
-            cursor.execute("""
-                SELECT COALESCE(c.cliente, 'Senza Cliente') AS cliente, l.id_corso,
-                       COALESCE(c.nome, l.id_corso) AS nome,
-                       COUNT(*) AS totale,
-                       SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) AS completate,
-                       SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0
-                           THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) AS da_incassare,
-                       MAX(l.data) AS ultima_data
-                FROM lezioni l
-                LEFT JOIN corsi c ON l.id_corso = c.id_corso
-                GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
-            """)
-        else:  # SQLite
-            cursor.execute("""
-                SELECT COALESCE(c.cliente, 'Senza Cliente') AS cliente, l.id_corso,
-                       COALESCE(c.nome, l.id_corso) AS nome,
-                       COUNT(*) AS totale,
-                       SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) AS completate,
-                       SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0
-                           THEN ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario ELSE 0 END) AS da_incassare,
-                       MAX(l.data) AS ultima_data
-                FROM lezioni l
-                LEFT JOIN corsi c ON l.id_corso = c.id_corso
-                GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
-            """)
         arretrati = []
         totale_arretrati = 0.0
         oggi = datetime.now().date()
-        for row in cursor.fetchall():
-            totale = row['totale'] or 0
-            completate = row['completate'] or 0
-            da_incassare = float(row['da_incassare'] or 0)
+        for row in statistiche_da_riepilogo(cursor).values():
+            totale = row['totale_lezioni']
+            completate = row['lezioni_completate']
+            da_incassare = row['credito_maturato']
             # corso concluso al 100% e interamente ancora da fatturare
             if totale > 0 and completate == totale and da_incassare > 0:
                 ultima = row['ultima_data']
@@ -124,7 +141,7 @@ def dashboard():
                 arretrati.append({
                     'cliente': row['cliente'],
                     'id_corso': row['id_corso'],
-                    'nome': row['nome'],
+                    'nome': row['nome_corso'],
                     'da_incassare': da_incassare,
                     'ultima_data': ultima,
                     'giorni': giorni,
@@ -136,14 +153,32 @@ def dashboard():
     return render_template("dashboard.html",
                           username=user['username'],
                           lezioni=lezioni,
+                          cursore_successivo=cursore_successivo,
+                          filtri={k: v for k, v in request.args.items() if k in (*FILTRI_DASHBOARD, "per_pagina") and v},
                           corsi=corsi,
-                          corsi_archiviati=corsi_archiviati,
                           mesi=mesi,
                           conteggi=conteggi,
                           arretrati=arretrati,
                           totale_arretrati=totale_arretrati)
 
 
+@lezioni_bp.route("/api/lezioni")
+@login_required
+def api_lezioni():
+    """Pagine della lista lezioni in JSON (stessi filtri e cursore della dashboard), per lo scroll infinito"""
+    try:
+        with db_connection() as conn:
+            lezioni, cursore_successivo = pagina_lezioni(conn.cursor(), request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    return jsonify({
+        "success": True,
+        "lezioni": [dict(lezione) for lezione in lezioni],
+        "cursore_successivo": cursore_successivo,
+    })
+
+
 @lezioni_bp.route("/aggiungi_lezione", methods=["GET", "POST"])
 @login_required
 def aggiungi_lezione():
@@ -159,23 +194,31 @@ def aggiungi_lezione():
             compensi = request.form.getlist("compenso_orario[]")
             stati = request.form.getlist("stato[]")
 
+            # Date nel formato del database; nessun inserimento se una non è valida
+            date_iso = [data_iso(data) for data in date[:len(materie)]]
+            if len(date_iso) < len(materie) or None in date_iso:
+                flash("❌ Data non valida: usa il formato GG/MM/AAAA o AAAA-MM-GG.", "danger")
+                return redirect(url_for("lezioni.aggiungi_lezione"))
+
             with db_connection() as conn:
                 cursor = conn.cursor()
                 for i in range(len(materie)):
                     id_corso = id_corsi[i]
                     materia = materie[i]
-                    data = date[i]
+                    data = date_iso[i]
                     ora_inizio = correggi_orario(ora_inizi[i])
                     ora_fine = correggi_orario(ora_fini[i])
                     luogo = luoghi[i]
                     compenso_orario = float(compensi[i]) if compensi[i] else 0.0
                     stato = stati[i]
+                    durata_minuti, importo = durata_e_importo(ora_inizio, ora_fine, compenso_orario)
 
                     placeholder = get_placeholder()
                     cursor.execute(f"""
-                        INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato)
-                        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-                    """, (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato))
+                        INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, durata_minuti, importo)
+                        VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                    """, (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, durata_minuti, importo))
+                aggiorna_riepilogo(cursor, id_corsi[:len(materie)])
                 conn.commit()
 
             flash("✅ Lezioni aggiunte con successo!", "success")
@@ -189,27 +232,9 @@ def aggiungi_lezione():
     # GET request: mostra la pagina
     with db_connection() as conn:
         cursor = conn.cursor()
-        placeholder = get_placeholder()
-        
-        cursor.execute("SELECT * FROM corsi ORDER BY nome")
-        corsi_rows = cursor.fetchall()
-        
-        corsi_disponibili = []
-        for corso_row in corsi_rows:
-            corso = dict(corso_row)
-            
-            cursor.execute(f"""
-                SELECT 
-                    COUNT(*) as totale,
-                    SUM(CASE WHEN fatturato = 1 THEN 1 ELSE 0 END) as completamente_fatturate
-                FROM lezioni 
-                WHERE id_corso = {placeholder}
-            """, (corso['id_corso'],))
-            
-            result = cursor.fetchone()
-            
-            if not result or result['totale'] == 0 or result['totale'] != result['completamente_fatturate']:
-                corsi_disponibili.append(corso)
+        # Esclude i corsi con tutte le lezioni già fatturate
+        corsi_disponibili = [corso for corso in stato_fatturazione_corsi(cursor)
+                             if not corso['completamente_fatturato']]
 
     return render_template("aggiungi_lezione.html", corsi=corsi_disponibili)
 
@@ -222,25 +247,30 @@ def modifica_lezione(lezione_id):
 
         if request.method == "POST":
             nuova_materia = sanitize_input(request.form["materia"])
-            nuova_data = request.form["data"]
-            nuova_ora_inizio = request.form["ora_inizio"]
-            nuova_ora_fine = request.form["ora_fine"]
+            nuova_data = data_iso(request.form["data"])
+            if not nuova_data:
+                flash("❌ Data non valida: usa il formato GG/MM/AAAA o AAAA-MM-GG.", "danger")
+                return redirect(url_for("lezioni.modifica_lezione", lezione_id=lezione_id))
+            nuova_ora_inizio = correggi_orario(request.form["ora_inizio"])
+            nuova_ora_fine = correggi_orario(request.form["ora_fine"])
+            if not nuova_ora_inizio or not nuova_ora_fine:
+                flash("❌ Orario non valido: usa il formato HH:MM.", "danger")
+                return redirect(url_for("lezioni.modifica_lezione", lezione_id=lezione_id))
             nuovo_luogo = sanitize_input(request.form["luogo"])
             nuovo_compenso_orario = float(request.form["compenso_orario"])
             nuovo_stato = sanitize_input(request.form["stato"])
 
-            ore = calcola_ore(nuova_ora_inizio, nuova_ora_fine)
-            if ore is not None:
-                nuovo_compenso_totale = ore * nuovo_compenso_orario
-            else:
-                nuovo_compenso_totale = 0  # Valore predefinito se il calcolo ore fallisce
+            durata_minuti, importo = durata_e_importo(nuova_ora_inizio, nuova_ora_fine, nuovo_compenso_orario)
 
             placeholder = get_placeholder()
             cursor.execute(f"""
                 UPDATE lezioni
-                SET materia={placeholder}, data={placeholder}, ora_inizio={placeholder}, ora_fine={placeholder}, luogo={placeholder}, compenso_orario={placeholder}, stato={placeholder}
+                SET materia={placeholder}, data={placeholder}, ora_inizio={placeholder}, ora_fine={placeholder}, luogo={placeholder}, compenso_orario={placeholder}, stato={placeholder},
+                    durata_minuti={placeholder}, importo={placeholder}
                 WHERE id={placeholder}
-            """, (nuova_materia, nuova_data, nuova_ora_inizio, nuova_ora_fine, nuovo_luogo, nuovo_compenso_orario, nuovo_stato, lezione_id))
+            """, (nuova_materia, nuova_data, nuova_ora_inizio, nuova_ora_fine, nuovo_luogo, nuovo_compenso_orario, nuovo_stato,
+                  durata_minuti, importo, lezione_id))
+            aggiorna_riepilogo(cursor, corsi_delle_lezioni(cursor, [lezione_id]))
             conn.commit()
             flash("Lezione modificata con successo.", "success")
             
@@ -272,7 +302,9 @@ def elimina_lezione(id_lezione):
         with db_connection() as conn:
             cursor = conn.cursor()
             placeholder = get_placeholder()
+            corsi = corsi_delle_lezioni(cursor, [id_lezione])
             cursor.execute(f"DELETE FROM lezioni WHERE id = {placeholder}", (id_lezione,))
+            aggiorna_riepilogo(cursor, corsi)
             conn.commit()
 
         flash("✅ Lezione eliminata con successo!", "success")
@@ -292,6 +324,7 @@ def completa_lezione(id_lezione):
         cursor = conn.cursor()
         placeholder = get_placeholder()
         cursor.execute(f"UPDATE lezioni SET stato = 'Completato' WHERE id = {placeholder}", (id_lezione,))
+        aggiorna_riepilogo(cursor, corsi_delle_lezioni(cursor, [id_lezione]))
         conn.commit()
 
     flash("✅ Lezione segnata come completata!", "success")
@@ -320,179 +353,17 @@ def compenso():
         clienti = [row['cliente'] for row in cursor.fetchall()]
         
         cursor.execute("""
-            SELECT c.id_corso, c.nome, c.cliente 
-            FROM corsi c
+            SELECT id_corso FROM corsi
             UNION
-            SELECT ca.id_corso, ca.nome, ca.cliente 
-            FROM corsi_archiviati ca
+            SELECT id_corso FROM corsi_archiviati
+            ORDER BY id_corso
         """)
-        corsi_info = cursor.fetchall()
-        
-        corsi_dict = {}
-        for corso in corsi_info:
-            id_corso = corso["id_corso"]
-            nome = corso["nome"]
-            cliente = corso["cliente"] if corso["cliente"] is not None else ""
-            corsi_dict[id_corso] = {"id_corso": id_corso, "nome": nome, "cliente": cliente}
-        
-        corsi = sorted([c["id_corso"] for c in corsi_info])
-
-        query = """
-            SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, 
-                   l.luogo, l.compenso_orario, l.stato, l.fatturato, l.mese_fatturato,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
-            WHERE l.ora_inizio IS NOT NULL AND l.ora_fine IS NOT NULL
-        """
-        params = []
-        
-        placeholder = get_placeholder()
-        if cliente_filtro:
-            query += f" AND (c.cliente = {placeholder} OR ca.cliente = {placeholder})"
-            params.append(cliente_filtro)
-            params.append(cliente_filtro)
-            
-        params_archiviate = []
-            
-        if corso_filtro:
-            query += f" AND l.id_corso = {placeholder}"
-            params.append(corso_filtro)
-            
-        if periodo_filtro != "tutti":
-            oggi = datetime.now().strftime("%Y-%m-%d")
-            
-            if periodo_filtro == "giorno" and data_inizio:
-                query += f" AND l.data = {placeholder}"
-                params.append(data_inizio)
-            elif periodo_filtro == "settimana" and data_inizio:
-                query += f" AND extract_year_week(l.data) = extract_year_week({placeholder})"
-                params.append(data_inizio)
-            elif periodo_filtro == "mese" and data_inizio:
-                query += f" AND extract_year_month(l.data) = {placeholder}"
-                params.append(data_inizio)
-            elif periodo_filtro == "anno" and data_inizio:
-                query += f" AND extract_year(l.data) = {placeholder}"
-                params.append(data_inizio)
-            elif periodo_filtro == "intervallo" and data_inizio and data_fine:
-                query += f" AND l.data BETWEEN {placeholder} AND {placeholder}"
-                params.append(data_inizio)
-                params.append(data_fine)
-        
-        cursor.execute(query, params)
-        lezioni = cursor.fetchall()
-        
-        query_archiviate = """
-            SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine, 
-                   l.luogo, l.compenso_orario, l.stato, l.fatturato, l.mese_fatturato,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM archiviate l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
-            WHERE l.ora_inizio IS NOT NULL AND l.ora_fine IS NOT NULL
-        """
-        params_archiviate = []
-        
-        placeholder = get_placeholder()
-        if cliente_filtro:
-            query_archiviate += f" AND (c.cliente = {placeholder} OR ca.cliente = {placeholder})"
-            params_archiviate.append(cliente_filtro)
-            params_archiviate.append(cliente_filtro)
-            
-        if corso_filtro:
-            placeholder = get_placeholder()
-            query_archiviate += f" AND l.id_corso = {placeholder}"
-            params_archiviate.append(corso_filtro)
-            
-        if periodo_filtro != "tutti":
-            if periodo_filtro == "giorno" and data_inizio:
-                placeholder = get_placeholder()
-                query_archiviate += f" AND l.data = {placeholder}"
-                params_archiviate.append(data_inizio)
-            elif periodo_filtro == "settimana" and data_inizio:
-                placeholder = get_placeholder()
-                query_archiviate += f" AND extract_year_week(l.data) = extract_year_week({placeholder})"
-                params_archiviate.append(data_inizio)
-            elif periodo_filtro == "mese" and data_inizio:
-                placeholder = get_placeholder()
-                query_archiviate += f" AND extract_year_month(l.data) = {placeholder}"
-                params_archiviate.append(data_inizio)
-            elif periodo_filtro == "anno" and data_inizio:
-                placeholder = get_placeholder()
-                query_archiviate += f" AND extract_year(l.data) = {placeholder}"
-                params_archiviate.append(data_inizio)
-            elif periodo_filtro == "intervallo" and data_inizio and data_fine:
-                placeholder = get_placeholder()
-                query_archiviate += f" AND l.data BETWEEN {placeholder} AND {placeholder}"
-                params_archiviate.append(data_inizio)
-                params_archiviate.append(data_fine)
-        
-        cursor.execute(query_archiviate, params_archiviate)
-        lezioni_archiviate = cursor.fetchall()
-        
-        tutte_lezioni = lezioni + lezioni_archiviate
-
-    compensi = {
-        "completate": 0,
-        "fatturate": 0,
-        "da_fatturare": 0,
-        "pianificate": 0,
-        "cancellate": 0
-    }
-    
-    compensi_cliente = {}
-    
-    for lezione in tutte_lezioni:
-        ore = calcola_ore(lezione["ora_inizio"], lezione["ora_fine"])
-        if ore is None:
-            continue
-            
-        compenso = ore * lezione["compenso_orario"]
-        
-        if lezione["stato"] == "Completato":
-            if lezione["fatturato"] == 1:
-                compensi["fatturate"] += compenso
-            else:
-                compensi["da_fatturare"] += compenso
-            compensi["completate"] += compenso
-        elif lezione["stato"] == "Pianificato":
-            compensi["pianificate"] += compenso
-        elif lezione["stato"] == "Cancellato":
-            compensi["cancellate"] += compenso
-            
-        cliente = None
-        
-        if "cliente" in lezione and lezione["cliente"] and lezione["cliente"] != "Sconosciuto":
-            cliente = lezione["cliente"]
-        
-        if not cliente or cliente == "Sconosciuto":
-            corso_info = corsi_dict.get(lezione["id_corso"], None)
-            if corso_info and "cliente" in corso_info and corso_info["cliente"]:
-                cliente = corso_info["cliente"]
-        
-        if not cliente:
-            cliente = "Sconosciuto"
-        
-        if cliente not in compensi_cliente:
-            compensi_cliente[cliente] = {
-                "completate": 0,
-                "fatturate": 0,
-                "da_fatturare": 0,
-                "pianificate": 0,
-                "cancellate": 0
-            }
-            
-        if lezione["stato"] == "Completato":
-            if lezione["fatturato"] == 1:
-                compensi_cliente[cliente]["fatturate"] += compenso
-            else:
-                compensi_cliente[cliente]["da_fatturare"] += compenso
-            compensi_cliente[cliente]["completate"] += compenso
-        elif lezione["stato"] == "Pianificato":
-            compensi_cliente[cliente]["pianificate"] += compenso
-        elif lezione["stato"] == "Cancellato":
-            compensi_cliente[cliente]["cancellate"] += compenso
+        corsi = [row['id_corso'] for row in cursor.fetchall()]
+
+        compensi, compensi_cliente = report_compensi(
+            cursor, cliente=cliente_filtro, corso=corso_filtro, periodo=periodo_filtro,
+            data_inizio=data_inizio, data_fine=data_fine
+        )
 
     return render_template(
         "compenso.html", 
@@ -519,8 +390,10 @@ def elimina_lezioni():
             cursor = conn.cursor()
             placeholder = get_placeholder()
             placeholders = ','.join([placeholder] * len(ids))
+            corsi = corsi_delle_lezioni(cursor, ids)
             query = f"DELETE FROM lezioni WHERE id IN ({placeholders})"
             cursor.execute(query, ids)
+            aggiorna_riepilogo(cursor, corsi)
             conn.commit()
         return "", 200
     except Exception as e:
@@ -618,18 +491,20 @@ def archivia_lezioni():
             for lezione in lezioni:
                 placeholder = get_placeholder()
                 cursor.execute(f"""
-                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato)
-                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                    INSERT INTO archiviate (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato, fatturato, mese_fatturato, durata_minuti, importo)
+                    VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
                 """, (
                     lezione["id_corso"], lezione["materia"], lezione["data"],
                     lezione["ora_inizio"], lezione["ora_fine"], lezione["luogo"],
-                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"]
+                    lezione["compenso_orario"], lezione["stato"], lezione["fatturato"], lezione["mese_fatturato"],
+                    *durata_e_importo(lezione["ora_inizio"], lezione["ora_fine"], lezione["compenso_orario"])
                 ))
             
             placeholder = get_placeholder()
             placeholders = ','.join([placeholder] * len(ids))
             query_delete = f"DELETE FROM lezioni WHERE id IN ({placeholders})"
             cursor.execute(query_delete, ids)
+            aggiorna_riepilogo(cursor, [lezione["id_corso"] for lezione in lezioni])
             conn.commit()
             
         return "", 200
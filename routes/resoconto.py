@@ -3,7 +3,7 @@ from flask_login import login_required
 from db_utils import db_connection, get_placeholder
 import json
 from datetime import datetime
-from utils.time_utils import get_local_now, calcola_ore
+from utils.time_utils import get_local_now
 
 resoconto_bp = Blueprint('resoconto', __name__)
 
@@ -12,15 +12,15 @@ resoconto_bp = Blueprint('resoconto', __name__)
 def resoconto_annuale():
     anno_selezionato = request.args.get('anno', get_local_now().strftime('%Y'))
     
+    placeholder = get_placeholder()
     with db_connection() as conn:
         cursor = conn.cursor()
         
+        # Totali letti da riepilogo_corsi (per corso e mese), lezioni attive e archiviate
         cursor.execute("""
-            SELECT DISTINCT extract_year(data) as anno 
-            FROM lezioni 
-            UNION 
-            SELECT DISTINCT extract_year(data) as anno 
-            FROM archiviate
+            SELECT DISTINCT SUBSTR(mese, 1, 4) as anno
+            FROM riepilogo_corsi
+            WHERE mese != ''
             ORDER BY anno DESC
         """)
         anni_disponibili = [row['anno'] for row in cursor.fetchall()]
@@ -35,31 +35,22 @@ def resoconto_annuale():
         totale_pianificate = 0
         totale_cancellate = 0
         
-        cursor.execute("""
-            SELECT l.*, 
-                   EXTRACT(MONTH FROM TO_DATE(l.data, 'YYYY-MM-DD'))::TEXT as mese,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
-            WHERE extract_year(l.data) = %s
-        """, (anno_selezionato,))
-        
-        lezioni = cursor.fetchall()
-        
-        cursor.execute("""
-            SELECT a.*, 
-                   EXTRACT(MONTH FROM TO_DATE(a.data, 'YYYY-MM-DD'))::TEXT as mese,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM archiviate a
-            LEFT JOIN corsi c ON a.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON a.id_corso = ca.id_corso
-            WHERE extract_year(a.data) = %s
-        """, (anno_selezionato,))
-        
-        lezioni_archiviate = cursor.fetchall()
+        cursor.execute(f"""
+            SELECT SUBSTR(r.mese, 6, 2) as mese,
+                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente,
+                   SUM(r.credito_fatturato) as fatturate,
+                   SUM(r.importo_completato - r.credito_fatturato) as da_fatturare,
+                   SUM(r.importo_pianificato) as pianificate,
+                   SUM(r.importo_cancellato) as cancellate
+            FROM riepilogo_corsi r
+            LEFT JOIN corsi c ON r.id_corso = c.id_corso
+            LEFT JOIN corsi_archiviati ca ON r.id_corso = ca.id_corso
+            WHERE r.mese LIKE {placeholder}
+            GROUP BY SUBSTR(r.mese, 6, 2), COALESCE(c.cliente, ca.cliente, 'Sconosciuto')
+            ORDER BY cliente, mese
+        """, (f"{anno_selezionato}-%",))
         
-        tutte_lezioni = lezioni + lezioni_archiviate
+        riepilogo_mensile = cursor.fetchall()
         
         mesi = ['Gennaio', 'Febbraio', 'Marzo', 'Aprile', 'Maggio', 'Giugno', 
                 'Luglio', 'Agosto', 'Settembre', 'Ottobre', 'Novembre', 'Dicembre']
@@ -71,31 +62,23 @@ def resoconto_annuale():
         
         clienti_dict = {}
         
-        for lezione in tutte_lezioni:
-            ore = calcola_ore(lezione['ora_inizio'], lezione['ora_fine'])
-            if ore is None:
-                continue
-                
-            compenso = ore * lezione['compenso_orario']
+        for row in riepilogo_mensile:
+            indice_mese = int(row['mese']) - 1
+            fatturate = row['fatturate'] or 0
+            da_fatturare = row['da_fatturare'] or 0
+            pianificate = row['pianificate'] or 0
+            cancellate = row['cancellate'] or 0
             
-            if lezione['stato'] == 'Completato':
-                if lezione['fatturato'] == 1:
-                    totale_fatturate += compenso
-                    dati_mensili_fatturate[int(lezione['mese']) - 1] += compenso
-                else:
-                    totale_da_fatturare += compenso
-                    dati_mensili_da_fatturare[int(lezione['mese']) - 1] += compenso
-            elif lezione['stato'] == 'Pianificato':
-                totale_pianificate += compenso
-                dati_mensili_pianificate[int(lezione['mese']) - 1] += compenso
-            elif lezione['stato'] == 'Cancellato':
-                totale_cancellate += compenso
-                dati_mensili_cancellate[int(lezione['mese']) - 1] += compenso
+            totale_fatturate += fatturate
+            totale_da_fatturare += da_fatturare
+            totale_pianificate += pianificate
+            totale_cancellate += cancellate
+            dati_mensili_fatturate[indice_mese] += fatturate
+            dati_mensili_da_fatturare[indice_mese] += da_fatturare
+            dati_mensili_pianificate[indice_mese] += pianificate
+            dati_mensili_cancellate[indice_mese] += cancellate
             
-            try:
-                cliente = lezione['cliente'] if lezione['cliente'] is not None else 'Sconosciuto'
-            except (KeyError, IndexError):
-                cliente = 'Sconosciuto'
+            cliente = row['cliente']
             if cliente not in clienti_dict:
                 clienti_dict[cliente] = {
                     'fatturate': 0,
@@ -103,16 +86,10 @@ def resoconto_annuale():
                     'pianificate': 0,
                     'cancellate': 0
                 }
-            
-            if lezione['stato'] == 'Completato':
-                if lezione['fatturato'] == 1:
-                    clienti_dict[cliente]['fatturate'] += compenso
-                else:
-                    clienti_dict[cliente]['da_fatturare'] += compenso
-            elif lezione['stato'] == 'Pianificato':
-                clienti_dict[cliente]['pianificate'] += compenso
-            elif lezione['stato'] == 'Cancellato':
-                clienti_dict[cliente]['cancellate'] += compenso
+            clienti_dict[cliente]['fatturate'] += fatturate
+            clienti_dict[cliente]['da_fatturare'] += da_fatturare
+            clienti_dict[cliente]['pianificate'] += pianificate
+            clienti_dict[cliente]['cancellate'] += cancellate
         
         clienti = list(clienti_dict.keys())
         dati_clienti_fatturate = [clienti_dict[c]['fatturate'] for c in clienti]
@@ -130,68 +107,34 @@ def resoconto_annuale():
         else:
             percentuale_fatturate = percentuale_da_fatturare = percentuale_pianificate = percentuale_cancellate = 0
         
-        totali_per_anno = {}
-        
         cursor.execute("""
-            SELECT l.*, extract_year(l.data) as anno,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
-            UNION ALL
-            SELECT a.*, extract_year(a.data) as anno,
-                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
-            FROM archiviate a
-            LEFT JOIN corsi c ON a.id_corso = c.id_corso
-            LEFT JOIN corsi_archiviati ca ON a.id_corso = ca.id_corso
+            SELECT SUBSTR(mese, 1, 4) as anno,
+                   SUM(credito_fatturato) as fatturate,
+                   SUM(importo_completato - credito_fatturato) as da_fatturare,
+                   SUM(importo_pianificato) as pianificate,
+                   SUM(importo_cancellato) as cancellate,
+                   SUM(importo_totale) as totale,
+                   SUM(lezioni_completate) as n_completate,
+                   SUM(lezioni_completate_fatturate) as n_fatturate
+            FROM riepilogo_corsi
+            WHERE mese != ''
+            GROUP BY SUBSTR(mese, 1, 4)
+            ORDER BY anno
         """)
         
-        tutte_lezioni_storiche = cursor.fetchall()
-        
-        for lezione in tutte_lezioni_storiche:
-            anno = lezione['anno']
-            if anno not in totali_per_anno:
-                totali_per_anno[anno] = {
-                    'fatturate': 0,
-                    'da_fatturare': 0,
-                    'pianificate': 0,
-                    'cancellate': 0,
-                    'totale': 0,
-                    'n_completate': 0,
-                    'n_fatturate': 0
-                }
-
-            ore = calcola_ore(lezione['ora_inizio'], lezione['ora_fine'])
-            if ore is None:
-                continue
-
-            compenso = ore * lezione['compenso_orario']
-
-            if lezione['stato'] == 'Completato':
-                totali_per_anno[anno]['n_completate'] += 1
-                if lezione['fatturato'] == 1:
-                    totali_per_anno[anno]['fatturate'] += compenso
-                    totali_per_anno[anno]['n_fatturate'] += 1
-                else:
-                    totali_per_anno[anno]['da_fatturare'] += compenso
-            elif lezione['stato'] == 'Pianificato':
-                totali_per_anno[anno]['pianificate'] += compenso
-            elif lezione['stato'] == 'Cancellato':
-                totali_per_anno[anno]['cancellate'] += compenso
-
-            totali_per_anno[anno]['totale'] += compenso
+        totali_per_anno = {row['anno']: row for row in cursor.fetchall()}
 
         anni_grafico = sorted(totali_per_anno.keys())
-        dati_fatturate_per_anno = [totali_per_anno[a]['fatturate'] for a in anni_grafico]
-        dati_da_fatturare_per_anno = [totali_per_anno[a]['da_fatturare'] for a in anni_grafico]
-        dati_pianificate_per_anno = [totali_per_anno[a]['pianificate'] for a in anni_grafico]
-        dati_cancellate_per_anno = [totali_per_anno[a]['cancellate'] for a in anni_grafico]
-        dati_totali_per_anno = [totali_per_anno[a]['totale'] for a in anni_grafico]
-        n_completate_per_anno = [totali_per_anno[a]['n_completate'] for a in anni_grafico]
-        n_fatturate_per_anno = [totali_per_anno[a]['n_fatturate'] for a in anni_grafico]
+        dati_fatturate_per_anno = [totali_per_anno[a]['fatturate'] or 0 for a in anni_grafico]
+        dati_da_fatturare_per_anno = [totali_per_anno[a]['da_fatturare'] or 0 for a in anni_grafico]
+        dati_pianificate_per_anno = [totali_per_anno[a]['pianificate'] or 0 for a in anni_grafico]
+        dati_cancellate_per_anno = [totali_per_anno[a]['cancellate'] or 0 for a in anni_grafico]
+        dati_totali_per_anno = [totali_per_anno[a]['totale'] or 0 for a in anni_grafico]
+        n_completate_per_anno = [totali_per_anno[a]['n_completate'] or 0 for a in anni_grafico]
+        n_fatturate_per_anno = [totali_per_anno[a]['n_fatturate'] or 0 for a in anni_grafico]
         
         # ========== NUOVA SEZIONE: FATTURE EMESSE NELL'ANNO ==========
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT f.id_fattura, f.numero_fattura, f.id_corso, f.data_fattura, 
                    f.importo, f.tipo_fatturazione, f.note,
                    COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente,
@@ -199,7 +142,7 @@ def resoconto_annuale():
             FROM fatture f
             LEFT JOIN corsi c ON f.id_corso = c.id_corso
             LEFT JOIN corsi_archiviati ca ON f.id_corso = ca.id_corso
-            WHERE EXTRACT(YEAR FROM TO_DATE(f.data_fattura, 'YYYY-MM-DD')) = %s
+            WHERE extract_year(f.data_fattura) = {placeholder}
             ORDER BY f.data_fattura DESC, f.numero_fattura DESC
         """, (anno_selezionato,))
         
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template
 from flask_login import login_required
-from db_utils import db_connection, get_placeholder
+from db_utils import db_connection
+from utils.riepilogo_corsi import statistiche_da_riepilogo
 
 stato_crediti_bp = Blueprint('stato_crediti', __name__)
 
@@ -10,60 +11,12 @@ def stato_crediti():
     """Mostra lo stato di completamento e i crediti maturati per ogni corso, raggruppati per cliente"""
     with db_connection() as conn:
         cursor = conn.cursor()
-        placeholder = get_placeholder()
         
-        # Query compatibile sia con SQLite che PostgreSQL
-        if placeholder == "%s":  # PostgreSQL
-            query = """
-            SELECT 
-                COALESCE(c.cliente, 'Senza Cliente') as cliente,
-                l.id_corso,
-                COALESCE(c.nome, l.id_corso) as nome_corso,
-                COUNT(l.id) as totale_lezioni,
-                SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) as lezioni_completate,
-                SUM(CASE WHEN l.stato = 'Completato' THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_completato,
-                SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 1 THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_fatturato,
-                SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0 THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_maturato,
-                SUM(CASE WHEN l.stato != 'Completato' THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_futuro,
-                MAX(l.data) as ultima_data_lezione
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
-            ORDER BY cliente, nome_corso
-            """
-        else:  # SQLite
-            query = """
-            SELECT 
-                COALESCE(c.cliente, 'Senza Cliente') as cliente,
-                l.id_corso,
-                COALESCE(c.nome, l.id_corso) as nome_corso,
-                COUNT(l.id) as totale_lezioni,
-                SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) as lezioni_completate,
-                SUM(CASE WHEN l.stato = 'Completato' THEN 
-                    ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario 
-                ELSE 0 END) as credito_completato,
-                SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 1 THEN 
-                    ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario 
-                ELSE 0 END) as credito_fatturato,
-                SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0 THEN 
-                    ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario 
-                ELSE 0 END) as credito_maturato,
-                SUM(CASE WHEN l.stato != 'Completato' THEN 
-                    ((julianday(l.ora_fine) - julianday(l.ora_inizio)) * 24) * l.compenso_orario 
-                ELSE 0 END) as credito_futuro,
-                MAX(l.data) as ultima_data_lezione
-            FROM lezioni l
-            LEFT JOIN corsi c ON l.id_corso = c.id_corso
-            GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
-            ORDER BY cliente, nome_corso
-            """
-        
-        cursor.execute(query)
-        risultati = cursor.fetchall()
+        statistiche = statistiche_da_riepilogo(cursor)
         
         # Raggruppamento per cliente con classificazione per stato
         corsi_per_cliente = {}
-        for row in risultati:
+        for row in statistiche.values():
             cliente = row['cliente']
             if cliente not in corsi_per_cliente:
                 corsi_per_cliente[cliente] = {
@@ -76,17 +29,17 @@ def stato_crediti():
                     'totale_futuro': 0
                 }
             
-            totale_lezioni = row['totale_lezioni'] or 0
-            lezioni_completate = row['lezioni_completate'] or 0
+            totale_lezioni = row['totale_lezioni']
+            lezioni_completate = row['lezioni_completate']
             percentuale = (lezioni_completate / totale_lezioni * 100) if totale_lezioni > 0 else 0
             
-            credito_completato = float(row['credito_completato'] or 0)
-            credito_fatturato = float(row['credito_fatturato'] or 0)
-            credito_maturato = float(row['credito_maturato'] or 0)
-            credito_futuro = float(row['credito_futuro'] or 0)
+            credito_completato = row['importo_completato']
+            credito_fatturato = row['credito_fatturato']
+            credito_maturato = row['credito_maturato']
+            credito_futuro = row['credito_futuro']
             
             # Formatta la data dell'ultima lezione
-            ultima_data = row['ultima_data_lezione']
+            ultima_data = row['ultima_data']
             if ultima_data:
                 # Converti la data in formato leggibile (da YYYY-MM-DD a DD/MM/YYYY)
                 from datetime import datetime
@@ -30,7 +30,7 @@ CREATE TABLE archiviate (
 );
 CREATE TABLE fatture (
     id_fattura INTEGER PRIMARY KEY AUTOINCREMENT,
-    numero_fattura TEXT NOT NULL UNIQUE,
+    numero_fattura TEXT NOT NULL,
     id_corso TEXT,
     data_fattura TEXT NOT NULL,
     importo REAL NOT NULL,
@@ -100,13 +100,14 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Se ora_fine precede ora_inizio la lezione passa la mezzanotte (23:00-01:00 = 2 ore)
 CREATE OR REPLACE FUNCTION calcola_ore(ora_inizio TEXT, ora_fine TEXT) 
 RETURNS REAL AS $$
 BEGIN
-    RETURN EXTRACT(EPOCH FROM (
+    RETURN MOD(EXTRACT(EPOCH FROM (
         TO_TIMESTAMP('2000-01-01 ' || ora_fine, 'YYYY-MM-DD HH24:MI') - 
         TO_TIMESTAMP('2000-01-01 ' || ora_inizio, 'YYYY-MM-DD HH24:MI')
-    )) / 3600.0;
+    )) + 86400, 86400) / 3600.0;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -0,0 +1,119 @@
+"""
+Cache delle risposte della chat sui contratti (SQLite/PostgreSQL).
+
+La chiave è lo SHA-256 del testo del contratto più la domanda normalizzata
+(minuscole, senza accenti, punteggiatura e spazi multipli): la stessa domanda
+sullo stesso contratto viene servita senza chiamare Claude. Si usa solo a inizio
+conversazione, quando la risposta non dipende dallo storico della chat.
+Le voci scadono dopo CHAT_CACHE_TTL_ORE e oltre CHAT_CACHE_MAX_VOCI vengono
+eliminate quelle usate meno di recente. I contatori hit/miss sono salvati nel
+database, così sono condivisi tra i worker di gunicorn. Le tabelle sono create
+dalla migrazione 15 (migrazioni.py).
+"""
+import hashlib
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+from db_utils import db_connection, get_placeholder
+
+TTL_ORE = int(os.environ.get('CHAT_CACHE_TTL_ORE', str(24 * 7)))
+MAX_VOCI = int(os.environ.get('CHAT_CACHE_MAX_VOCI', '2000'))
+
+_FORMATO = "%Y-%m-%d %H:%M:%S.%f"  # microsecondi: ordine LRU stabile
+
+
+def normalizza_domanda(domanda):
+    """Forma canonica della domanda: 'Qual è il compenso?' → 'qual e il compenso'"""
+    testo = unicodedata.normalize('NFKD', domanda or "")
+    testo = "".join(c for c in testo if not unicodedata.combining(c)).lower()
+    testo = re.sub(r"[^\w\s]", " ", testo)
+    return " ".join(testo.split())
+
+
+def chiave_risposta(testo_contratto, domanda):
+    hash_contenuto = hashlib.sha256((testo_contratto or "").encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{hash_contenuto}\n{normalizza_domanda(domanda)}".encode('utf-8')).hexdigest()
+
+
+def _incrementa(cursor, nome):
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        INSERT INTO contatori_cache (nome, valore) VALUES ({placeholder}, 1)
+        ON CONFLICT (nome) DO UPDATE SET valore = contatori_cache.valore + 1
+    """, (nome,))
+
+
+def leggi_risposta(testo_contratto, domanda):
+    """Risposta in cache ancora valida (None se assente o scaduta); aggiorna i contatori"""
+    placeholder = get_placeholder()
+    chiave = chiave_risposta(testo_contratto, domanda)
+    adesso = datetime.now()
+    limite = (adesso - timedelta(hours=TTL_ORE)).strftime(_FORMATO)
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT risposta FROM cache_risposte_contratti
+            WHERE chiave = {placeholder} AND creato_il >= {placeholder}
+        """, (chiave, limite))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute(f"UPDATE cache_risposte_contratti SET ultimo_uso = {placeholder} WHERE chiave = {placeholder}",
+                           (adesso.strftime(_FORMATO), chiave))
+            _incrementa(cursor, 'chat_contratto_hit')
+        else:
+            _incrementa(cursor, 'chat_contratto_miss')
+        conn.commit()
+    return row['risposta'] if row else None
+
+
+def salva_risposta(testo_contratto, domanda, risposta):
+    """Salva la risposta ed elimina le voci scadute o in eccesso (LRU)"""
+    placeholder = get_placeholder()
+    adesso = datetime.now()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT INTO cache_risposte_contratti (chiave, domanda, risposta, creato_il, ultimo_uso)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+            ON CONFLICT (chiave) DO UPDATE SET
+                risposta = excluded.risposta,
+                creato_il = excluded.creato_il,
+                ultimo_uso = excluded.ultimo_uso
+        """, (chiave_risposta(testo_contratto, domanda), normalizza_domanda(domanda), risposta,
+              adesso.strftime(_FORMATO), adesso.strftime(_FORMATO)))
+
+        cursor.execute(f"DELETE FROM cache_risposte_contratti WHERE creato_il < {placeholder}",
+                       ((adesso - timedelta(hours=TTL_ORE)).strftime(_FORMATO),))
+        cursor.execute(f"""
+            DELETE FROM cache_risposte_contratti
+            WHERE chiave NOT IN (
+                SELECT chiave FROM cache_risposte_contratti
+                ORDER BY ultimo_uso DESC
+                LIMIT {placeholder}
+            )
+        """, (MAX_VOCI,))
+        conn.commit()
+
+
+def statistiche():
+    """Contatori hit/miss e numero di voci in cache"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT nome, valore FROM contatori_cache")
+        contatori = {r['nome']: r['valore'] for r in cursor.fetchall()}
+        cursor.execute("SELECT COUNT(*) FROM cache_risposte_contratti")
+        voci = cursor.fetchone()[0]
+
+    hit = contatori.get('chat_contratto_hit', 0)
+    miss = contatori.get('chat_contratto_miss', 0)
+    return {
+        "hit": hit,
+        "miss": miss,
+        "hit_rate": round(hit / (hit + miss), 3) if hit + miss else 0.0,
+        "voci": voci,
+        "max_voci": MAX_VOCI,
+        "ttl_ore": TTL_ORE,
+    }
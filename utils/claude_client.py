@@ -0,0 +1,165 @@
+"""
+Wrapper unico per le chiamate a Claude (contratti e fatture).
+
+- crea il client Anthropic dalla variabile ANTHROPIC_API_KEY (o usa quello passato);
+- registra per ogni chiamata i token di input, output e cache nella tabella
+  `utilizzo_claude` (creata dalla migrazione 14);
+- fornisce i blocchi di sistema cacheabili (prompt caching) e il taglio dello
+  storico di una conversazione entro un budget di token;
+- ClientFinto simula l'API (risposte, usage e cache) per test e benchmark.
+"""
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from db_utils import db_connection, get_placeholder
+
+MODELLO = "claude-sonnet-4-5-20250929"
+
+
+def crea_client(client=None):
+    """Restituisce (client, errore): il client passato o uno nuovo da ANTHROPIC_API_KEY"""
+    if client is not None:
+        return client, None
+    api_key = os.environ.get('ANTHROPIC_API_KEY')
+    if not api_key:
+        return None, "Chiave API Anthropic non configurata"
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key), None
+
+
+def stima_token(testo):
+    """Stima grossolana dei token di un testo (~4 caratteri per token)"""
+    return len(testo or "") // 4 + 1
+
+
+def blocco_cacheabile(testo):
+    """Blocco di testo marcato per il prompt caching (riusato tra chiamate successive)"""
+    return {"type": "text", "text": testo, "cache_control": {"type": "ephemeral"}}
+
+
+def _testo_messaggio(messaggio):
+    contenuto = messaggio['content']
+    if isinstance(contenuto, str):
+        return contenuto
+    return "".join(b.get('text', '') for b in contenuto if isinstance(b, dict))
+
+
+def tronca_storico(storico, budget_token):
+    """Tiene i messaggi più recenti dello storico entro `budget_token`.
+
+    Elimina gli scambi più vecchi e fa sì che lo storico inizi sempre con un
+    messaggio dell'utente, come richiesto dall'API.
+    """
+    tenuti = []
+    totale = 0
+    for messaggio in reversed(storico):
+        token = stima_token(_testo_messaggio(messaggio))
+        if totale + token > budget_token:
+            break
+        tenuti.append(messaggio)
+        totale += token
+    tenuti.reverse()
+    while tenuti and tenuti[0]['role'] != 'user':
+        tenuti.pop(0)
+    return tenuti
+
+
+def registra_utilizzo(operazione, riferimento, usage, durata_ms):
+    """Salva i token di una chiamata; un errore qui non deve mai bloccare la risposta"""
+    placeholder = get_placeholder()
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                INSERT INTO utilizzo_claude (data, operazione, riferimento, modello, input_tokens, output_tokens,
+                                             cache_creation_tokens, cache_read_tokens, durata_ms)
+                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder},
+                        {placeholder}, {placeholder}, {placeholder}, {placeholder})
+            """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), operazione,
+                  str(riferimento) if riferimento is not None else None, MODELLO,
+                  getattr(usage, 'input_tokens', 0) or 0,
+                  getattr(usage, 'output_tokens', 0) or 0,
+                  getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                  getattr(usage, 'cache_read_input_tokens', 0) or 0,
+                  int(durata_ms)))
+            conn.commit()
+    except Exception as e:
+        print(f"⚠️ Utilizzo Claude non registrato: {e}")
+
+
+def invia_messaggio(client, messages, max_tokens, system=None, operazione="generica", riferimento=None):
+    """Chiama messages.create, registra l'utilizzo e restituisce il testo della risposta"""
+    parametri = {"model": MODELLO, "max_tokens": max_tokens, "messages": messages}
+    if system is not None:
+        parametri["system"] = system
+
+    inizio = time.perf_counter()
+    message = client.messages.create(**parametri)
+    durata_ms = (time.perf_counter() - inizio) * 1000
+
+    registra_utilizzo(operazione, riferimento, getattr(message, 'usage', None), durata_ms)
+    return message.content[0].text
+
+
+class ClientFinto:
+    """Client Anthropic finto per test e benchmark: nessuna chiamata di rete.
+
+    Simula `usage` come l'API reale: il prefisso più lungo già messo in cache
+    da una chiamata precedente viene contato come cache_read, quello fino
+    all'ultimo blocco con cache_control come cache_creation, il resto come input.
+    La latenza simulata cresce con i token non letti dalla cache.
+    """
+    TOKEN_PER_IMMAGINE = 1500
+
+    def __init__(self, risposta="Risposta di prova", secondi_per_mille_token=0.0):
+        self.risposta = risposta
+        self.secondi_per_mille_token = secondi_per_mille_token
+        self.messages = self
+        self.chiamate = []
+        self._prefissi_in_cache = set()
+
+    def _blocchi(self, system, messages):
+        blocchi = []
+        if isinstance(system, str):
+            blocchi.append({"type": "text", "text": system})
+        elif system:
+            blocchi.extend(system)
+        for m in messages:
+            if isinstance(m['content'], str):
+                blocchi.append({"type": "text", "text": m['content']})
+            else:
+                blocchi.extend(m['content'])
+        return blocchi
+
+    def create(self, model, max_tokens, messages, system=None, **kwargs):
+        sha = hashlib.sha256()
+        totale = 0
+        prefissi = []     # (hash prefisso, token prefisso) dopo ogni blocco
+        punti_cache = []  # idem, solo per i blocchi con cache_control
+        for blocco in self._blocchi(system, messages):
+            if blocco.get('type') == 'image':
+                totale += self.TOKEN_PER_IMMAGINE
+                sha.update(json.dumps(blocco.get('source', {}), sort_keys=True).encode())
+            else:
+                totale += stima_token(blocco.get('text', ''))
+                sha.update(blocco.get('text', '').encode())
+            prefissi.append((sha.hexdigest(), totale))
+            if blocco.get('cache_control'):
+                punti_cache.append(prefissi[-1])
+
+        letti = max((token for h, token in prefissi if h in self._prefissi_in_cache), default=0)
+        scritti = punti_cache[-1][1] - letti if punti_cache and punti_cache[-1][0] not in self._prefissi_in_cache else 0
+        self._prefissi_in_cache.update(h for h, _ in punti_cache)
+
+        usage = SimpleNamespace(input_tokens=totale - letti - scritti,
+                                output_tokens=stima_token(self.risposta),
+                                cache_creation_input_tokens=scritti,
+                                cache_read_input_tokens=letti)
+        self.chiamate.append({"model": model, "system": system, "messages": messages, "usage": usage})
+        if self.secondi_per_mille_token:
+            time.sleep((totale - letti) / 1000 * self.secondi_per_mille_token)
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=self.risposta)], usage=usage)
@@ -0,0 +1,104 @@
+"""
+Report dei compensi (pagina /compenso): totali per stato della lezione e per
+cliente, su lezioni e archiviate.
+
+Una sola query: le due tabelle filtrate nello stesso modo sono unite con
+UNION ALL e raggruppate per cliente con somme condizionali per stato e
+fatturato; i totali generali sono la somma delle poche righe per cliente.
+
+Il compenso di una lezione è ore * compenso_orario con le ore di
+utils.time_utils.calcola_ore: durata in minuti riportata tra 0 e 24 ore (una
+lezione che passa la mezzanotte vale le ore fino alla fine) e 0 se gli orari
+non sono validi (durata_minuti NULL).
+"""
+import db_utils
+from db_utils import get_placeholder
+
+# Importi del report: nome -> condizione SQL sulla lezione
+CATEGORIE = (
+    ("completate", "stato = 'Completato'"),
+    ("fatturate", "stato = 'Completato' AND fatturato = 1"),
+    ("da_fatturare", "stato = 'Completato' AND (fatturato IS NULL OR fatturato <> 1)"),
+    ("pianificate", "stato = 'Pianificato'"),
+    ("cancellate", "stato = 'Cancellato'"),
+)
+
+# Cliente della lezione: quello del corso, poi del corso archiviato
+CLIENTE = "COALESCE(NULLIF(c.cliente, ''), NULLIF(ca.cliente, ''), 'Sconosciuto')"
+
+
+def compensi_vuoti():
+    return {nome: 0.0 for nome, _ in CATEGORIE}
+
+
+def _compenso_lezione():
+    """Espressione SQL del compenso di una lezione l"""
+    # Con PostgreSQL compenso_orario è REAL: in NUMERIC vale quanto letto da Python (20.1, non 20.100000381)
+    compenso_orario = "CAST(l.compenso_orario AS NUMERIC)" if db_utils.USE_POSTGRES else "l.compenso_orario"
+    # psycopg2 con parametri: il modulo si scrive %%
+    modulo = "%%" if db_utils.USE_POSTGRES else "%"
+    return f"((COALESCE(l.durata_minuti, 0) {modulo} 1440 + 1440) {modulo} 1440) / 60.0 * {compenso_orario}"
+
+
+def filtri_compensi(cliente="", corso="", periodo="tutti", data_inizio="", data_fine=""):
+    """Condizioni SQL (su l, c, ca) e parametri dei filtri della pagina; un periodo senza date non filtra"""
+    placeholder = get_placeholder()
+    condizioni = ["l.ora_inizio IS NOT NULL", "l.ora_fine IS NOT NULL"]
+    params = []
+    if cliente:
+        condizioni.append(f"(c.cliente = {placeholder} OR ca.cliente = {placeholder})")
+        params += [cliente, cliente]
+    if corso:
+        condizioni.append(f"l.id_corso = {placeholder}")
+        params.append(corso)
+
+    if periodo == "giorno" and data_inizio:
+        condizioni.append(f"l.data = {placeholder}")
+        params.append(data_inizio)
+    elif periodo == "settimana" and data_inizio:
+        condizioni.append(f"extract_year_week(l.data) = extract_year_week({placeholder})")
+        params.append(data_inizio)
+    elif periodo == "mese" and data_inizio:
+        condizioni.append(f"extract_year_month(l.data) = {placeholder}")
+        params.append(data_inizio)
+    elif periodo == "anno" and data_inizio:
+        condizioni.append(f"extract_year(l.data) = {placeholder}")
+        params.append(data_inizio)
+    elif periodo == "intervallo" and data_inizio and data_fine:
+        condizioni.append(f"l.data BETWEEN {placeholder} AND {placeholder}")
+        params += [data_inizio, data_fine]
+    return " AND ".join(condizioni), params
+
+
+def report_compensi(cursor, **filtri):
+    """(compensi, compensi_cliente) per il template compenso.html.
+
+    compensi: {categoria: importo}; compensi_cliente: {cliente: {categoria: importo}}
+    in ordine di cliente. filtri: cliente, corso, periodo, data_inizio, data_fine.
+    """
+    condizioni, params = filtri_compensi(**filtri)
+    righe = " UNION ALL ".join(f"""
+            SELECT {CLIENTE} AS cliente, l.stato, l.fatturato, {_compenso_lezione()} AS compenso
+            FROM {tabella} l
+            LEFT JOIN corsi c ON l.id_corso = c.id_corso
+            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
+            WHERE {condizioni}
+        """ for tabella in ("lezioni", "archiviate"))
+    somme = ",\n               ".join(f"SUM(CASE WHEN {condizione} THEN compenso ELSE 0 END) AS {nome}"
+                                     for nome, condizione in CATEGORIE)
+    cursor.execute(f"""
+        SELECT cliente,
+               {somme}
+        FROM ({righe}) righe
+        GROUP BY cliente
+        ORDER BY cliente
+    """, params * 2)
+
+    compensi = compensi_vuoti()
+    compensi_cliente = {}
+    for row in cursor.fetchall():
+        importi = {nome: float(row[nome] or 0) for nome, _ in CATEGORIE}
+        compensi_cliente[row["cliente"]] = importi
+        for nome, importo in importi.items():
+            compensi[nome] += importo
+    return compensi, compensi_cliente
@@ -0,0 +1,63 @@
+"""
+Export CSV in streaming: le righe di una query vengono lette a blocchi e
+scritte con csv.writer man mano che la risposta viene inviata, quindi la
+memoria usata non dipende dal numero di righe.
+
+Con PostgreSQL la query usa un cursore lato server (named cursor), che
+trasferisce BLOCCO_RIGHE righe per volta; con SQLite fetchmany() avanza sul
+risultato senza caricarlo tutto.
+
+Uso in una route:
+    return risposta_csv(query, params, intestazione, "lezioni.csv")
+"""
+import csv
+import io
+import os
+
+from flask import Response, stream_with_context
+
+import db_utils
+from db_utils import db_connection
+
+BLOCCO_RIGHE = int(os.environ.get('CSV_BLOCCO_RIGHE', '2000'))
+
+
+def cursore_lettura(conn, nome):
+    """Cursore per leggere molte righe: lato server con PostgreSQL, normale con SQLite"""
+    if db_utils.USE_POSTGRES:
+        cursor = conn.cursor(name=nome)
+        cursor.itersize = BLOCCO_RIGHE
+        return cursor
+    return conn.cursor()
+
+
+def righe_csv(query, params, intestazione, nome_cursore="esporta_csv"):
+    """Generatore del testo CSV (intestazione e poi un blocco di righe per volta)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(intestazione)
+    yield buffer.getvalue()
+
+    with db_connection() as conn:
+        cursor = cursore_lettura(conn, nome_cursore)
+        try:
+            cursor.execute(query, params)
+            while True:
+                righe = cursor.fetchmany(BLOCCO_RIGHE)
+                if not righe:
+                    break
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerows(righe)
+                yield buffer.getvalue()
+        finally:
+            cursor.close()
+
+
+def risposta_csv(query, params, intestazione, filename):
+    """Response Flask che invia il CSV della query in streaming"""
+    return Response(
+        stream_with_context(righe_csv(query, params, intestazione)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
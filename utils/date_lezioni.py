@@ -0,0 +1,93 @@
+"""
+Date delle lezioni nel formato canonico YYYY-MM-DD.
+
+lezioni.data e archiviate.data contenevano formati misti (YYYY-MM-DD e
+DD/MM/YYYY), quindi filtri per intervallo (BETWEEN, >=) e ordinamenti come
+stringa erano sbagliati sulle righe non ISO. La migrazione 11 riscrive una
+volta tutte le date con canonicalizza_date() e registra ogni riga riscritta
+in date_riscritte; da allora le route validano la data in scrittura con
+utils.time_utils.data_iso.
+
+Righe riscritte dalla migrazione e date rimaste non valide:
+    python -m utils.date_lezioni
+"""
+import sys
+
+from db_utils import db_connection
+from utils.time_utils import data_iso
+
+TABELLE_DATE = ("lezioni", "archiviate")
+
+
+def crea_tabella_report(cursor, postgres):
+    """Tabella date_riscritte: una riga per ogni data riscritta dalla migrazione"""
+    chiave = "SERIAL PRIMARY KEY" if postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS date_riscritte (
+            id {chiave},
+            tabella TEXT NOT NULL,
+            id_lezione INTEGER NOT NULL,
+            data_originale TEXT,
+            data_nuova TEXT NOT NULL,
+            riscritta_il TEXT NOT NULL
+        )
+    """)
+
+
+def _da_riscrivere(cursor, tabella):
+    """[(id, data originale, data ISO o None se non interpretabile)] delle righe con data non canonica"""
+    cursor.execute(f"SELECT id, data FROM {tabella} WHERE data IS NOT NULL")
+    righe = []
+    for id_lezione, data in cursor.fetchall():
+        nuova = data_iso(data)
+        if nuova != data:
+            righe.append((id_lezione, data, nuova))
+    return righe
+
+
+def canonicalizza_date(cursor, postgres, riscritta_il):
+    """Riscrive in YYYY-MM-DD le date di lezioni e archiviate (senza commit).
+
+    Restituisce {tabella: (righe riscritte, [(id, data) non interpretabili])};
+    le date non interpretabili restano invariate.
+    """
+    placeholder = "%s" if postgres else "?"
+    esito = {}
+    for tabella in TABELLE_DATE:
+        righe = _da_riscrivere(cursor, tabella)
+        riscritte = [(nuova, id_lezione) for id_lezione, _, nuova in righe if nuova]
+        cursor.executemany(f"UPDATE {tabella} SET data = {placeholder} WHERE id = {placeholder}", riscritte)
+        cursor.executemany(f"""
+            INSERT INTO date_riscritte (tabella, id_lezione, data_originale, data_nuova, riscritta_il)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+        """, [(tabella, id_lezione, data, nuova, riscritta_il) for id_lezione, data, nuova in righe if nuova])
+        esito[tabella] = (len(riscritte), [(id_lezione, data) for id_lezione, data, nuova in righe if not nuova])
+    return esito
+
+
+def main():
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT tabella, id_lezione, data_originale, data_nuova, riscritta_il
+            FROM date_riscritte ORDER BY riscritta_il, tabella, id_lezione
+        """)
+        riscritte = cursor.fetchall()
+        non_valide = {tabella: [(id_lezione, data) for id_lezione, data, _ in _da_riscrivere(cursor, tabella)]
+                      for tabella in TABELLE_DATE}
+
+    print(f"Date riscritte dalla migrazione: {len(riscritte)}")
+    for riga in riscritte:
+        print(f"  {riga['tabella']} id={riga['id_lezione']}: {riga['data_originale']!r} → {riga['data_nuova']}")
+
+    errori = sum(len(righe) for righe in non_valide.values())
+    for tabella, righe in non_valide.items():
+        for id_lezione, data in righe:
+            print(f"❌ {tabella} id={id_lezione}: data non valida {data!r}")
+    if errori:
+        sys.exit(f"\n❌ {errori} date non in formato YYYY-MM-DD da correggere a mano")
+    print("✅ Tutte le date sono in formato YYYY-MM-DD")
+
+
+if __name__ == "__main__":
+    main()
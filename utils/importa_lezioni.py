@@ -0,0 +1,242 @@
+"""
+Import CSV delle lezioni in blocco.
+
+valida_csv() legge e valida tutto il file in Python, senza query: orari, data,
+compenso, durata e importo (con durata_e_importo, come le route) vengono
+calcolati localmente. confronta_lezioni() carica una volta gli id dei corsi
+esistenti in un set; importa_lezioni() inserisce i corsi nuovi e le lezioni
+con un'unica executemany (execute_values con PostgreSQL) e aggiorna
+riepilogo_corsi, tutto nella stessa transazione.
+
+Le righe non valide non interrompono l'import: finiscono nel report errori
+come {"riga": numero di riga nel file, "messaggio": ...}.
+
+Reimportare lo stesso file non crea doppioni: confronta_lezioni() fa un hash
+join in memoria tra le righe del file e le lezioni esistenti nel periodo del
+file (una sola query), con chiave (id_corso, data, ora_inizio, ora_fine);
+gli orari sono normalizzati con correggi_orario da entrambi i lati.
+Ogni riga risulta nuova, modificata (stessa chiave, altri campi diversi) o
+duplicata; importa_lezioni() applica solo le nuove e le modificate. Lo stesso
+confronto, senza scritture, è l'anteprima mostrata prima dell'import.
+
+Il file caricato viene copiato a blocchi in uploads/import_csv (salva_csv) e
+letto da lì con csv.reader, senza tenerlo tutto in memoria.
+"""
+import csv
+import os
+import re
+import uuid
+
+import db_utils
+from utils.riepilogo_corsi import aggiorna_riepilogo
+from utils.time_utils import correggi_orario, data_iso, durata_e_importo
+from utils.upload import CARTELLA_IMPORT_CSV, salva_upload
+
+COLONNE_MINIME = ("id_corso", "materia", "data", "ora_inizio", "ora_fine")
+COLONNE_OPZIONALI = ("luogo", "compenso_orario", "stato", "fatturato", "mese_fatturato", "ore_fatturate")
+
+COLONNE_LEZIONE = ("id_corso", "materia", "data", "ora_inizio", "ora_fine", "luogo", "compenso_orario", "stato",
+                   "fatturato", "mese_fatturato", "ore_fatturate", "durata_minuti", "importo")
+
+# Righe per comando con execute_values / execute_batch (PostgreSQL)
+PAGINA_INSERT = 1000
+
+# Una lezione del file corrisponde a una esistente se coincide la chiave;
+# è modificata se differisce uno dei campi confrontati
+CHIAVE_LEZIONE = ("id_corso", "data", "ora_inizio", "ora_fine")
+CAMPI_CONFRONTO = ("materia", "luogo", "compenso_orario", "stato", "fatturato", "mese_fatturato")
+CAMPI_AGGIORNATI = tuple(c for c in COLONNE_LEZIONE if c not in CHIAVE_LEZIONE)
+
+_INDICE = {colonna: i for i, colonna in enumerate(COLONNE_LEZIONE)}
+
+
+class ErroreColonne(ValueError):
+    """Mancano colonne essenziali nell'intestazione del CSV"""
+
+
+def _campo(row, nome, predefinito=""):
+    return (row.get(nome) or "").strip() or predefinito
+
+
+def _lezione(row):
+    """Tupla dei valori di COLONNE_LEZIONE e cliente della riga; ValueError se la riga non è valida"""
+    id_corso = _campo(row, "id_corso")
+    materia = _campo(row, "materia")
+    if not id_corso:
+        raise ValueError("id_corso mancante")
+
+    ora_inizio = correggi_orario(_campo(row, "ora_inizio"))
+    ora_fine = correggi_orario(_campo(row, "ora_fine"))
+    if not ora_inizio or not ora_fine:
+        raise ValueError(f"Orario non valido per la lezione '{materia}'")
+
+    data = data_iso(_campo(row, "data"))
+    if not data:
+        raise ValueError(f"Data non valida '{_campo(row, 'data')}' per la lezione '{materia}'")
+
+    try:
+        compenso_orario = float(_campo(row, "compenso_orario", "0").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"Compenso orario non valido '{_campo(row, 'compenso_orario')}'") from None
+
+    try:
+        fatturato = int(_campo(row, "fatturato", "0"))
+    except ValueError:
+        fatturato = 0
+
+    durata_minuti, importo = durata_e_importo(ora_inizio, ora_fine, compenso_orario)
+    ore_fatturate = durata_minuti / 60.0 if fatturato > 0 else 0.0
+
+    lezione = (id_corso, materia, data, ora_inizio, ora_fine, _campo(row, "luogo"), compenso_orario,
+               _campo(row, "stato", "Pianificato"), fatturato, _campo(row, "mese_fatturato") or None,
+               ore_fatturate, durata_minuti, importo)
+    return lezione, _campo(row, "cliente")
+
+
+def valida_csv(righe):
+    """Valida un CSV (file di testo aperto o righe) in un solo passaggio, leggendolo riga per riga.
+
+    Restituisce (lezioni, clienti, errori, colonne opzionali mancanti): le tuple
+    pronte per l'INSERT, {id_corso: cliente} dal primo cliente non vuoto di ogni
+    corso e il report delle righe scartate. ErroreColonne se mancano colonne
+    essenziali.
+    """
+    reader = csv.DictReader(righe)
+    fieldnames = reader.fieldnames or []
+    mancanti = [col for col in COLONNE_MINIME if col not in fieldnames]
+    if mancanti:
+        raise ErroreColonne(f"Colonne essenziali mancanti nel CSV: {', '.join(mancanti)}")
+
+    lezioni, clienti, errori = [], {}, []
+    for row in reader:
+        try:
+            lezione, cliente = _lezione(row)
+        except ValueError as e:
+            errori.append({"riga": reader.line_num, "messaggio": str(e)})
+            continue
+        lezioni.append(lezione)
+        if cliente and not clienti.get(lezione[0]):
+            clienti[lezione[0]] = cliente
+        else:
+            clienti.setdefault(lezione[0], "")
+    return lezioni, clienti, errori, [col for col in COLONNE_OPZIONALI if col not in fieldnames]
+
+
+def inserisci_righe(cursor, tabella, colonne, righe):
+    """INSERT di molte righe: execute_values con PostgreSQL, executemany con SQLite"""
+    if not righe:
+        return
+    if db_utils.USE_POSTGRES:
+        from psycopg2.extras import execute_values
+        execute_values(cursor, f"INSERT INTO {tabella} ({', '.join(colonne)}) VALUES %s", righe,
+                       page_size=PAGINA_INSERT)
+    else:
+        valori = ", ".join(["?"] * len(colonne))
+        cursor.executemany(f"INSERT INTO {tabella} ({', '.join(colonne)}) VALUES ({valori})", righe)
+
+
+def _confrontabili(valori):
+    """Campi di CAMPI_CONFRONTO normalizzati (numeri come numeri, vuoto come None)"""
+    materia, luogo, compenso_orario, stato, fatturato, mese_fatturato = valori
+    # compenso arrotondato al centesimo: con PostgreSQL la colonna è REAL
+    return (materia or "", luogo or "", round(float(compenso_orario or 0), 2), stato or "", int(fatturato or 0),
+            mese_fatturato or None)
+
+
+def _chiave_salvata(valori):
+    """Chiave di una lezione del database con gli orari nel formato del file ('9:00' → '09:00')"""
+    id_corso, data, ora_inizio, ora_fine = valori
+    return (id_corso, data, correggi_orario(ora_inizio or "") or ora_inizio,
+            correggi_orario(ora_fine or "") or ora_fine)
+
+
+def confronta_lezioni(cursor, lezioni, clienti):
+    """Confronta le lezioni validate con quelle nel database (hash join sulla chiave).
+
+    Restituisce {"nuove": [lezione], "modificate": [(id, lezione)], "duplicate": n,
+    "corsi_nuovi": [(id_corso, nome, cliente)]}. Le righe ripetute nel file
+    contano come duplicate della prima.
+    """
+    cursor.execute("SELECT id_corso FROM corsi")
+    esistenti = {row[0] for row in cursor.fetchall()}
+    corsi_nuovi = [(id_corso, f"Corso {id_corso}", cliente)
+                   for id_corso, cliente in clienti.items() if id_corso not in esistenti]
+
+    indice = {}
+    if lezioni:
+        date = [lezione[_INDICE["data"]] for lezione in lezioni]
+        placeholder = "%s" if db_utils.USE_POSTGRES else "?"
+        cursor.execute(f"""
+            SELECT id, {', '.join(CHIAVE_LEZIONE + CAMPI_CONFRONTO)} FROM lezioni
+            WHERE data >= {placeholder} AND data <= {placeholder}
+            ORDER BY id
+        """, (min(date), max(date)))
+        n_chiave = len(CHIAVE_LEZIONE)
+        for row in cursor.fetchall():
+            # Con lezioni già doppie nel database vale la prima
+            indice.setdefault(_chiave_salvata(row[1:n_chiave + 1]), (row[0], _confrontabili(row[n_chiave + 1:])))
+
+    chiave = [_INDICE[c] for c in CHIAVE_LEZIONE]
+    campi = [_INDICE[c] for c in CAMPI_CONFRONTO]
+    nuove, modificate, duplicate = [], [], 0
+    visti = set()
+    for lezione in lezioni:
+        k = tuple(lezione[i] for i in chiave)
+        if k in visti:
+            duplicate += 1
+            continue
+        visti.add(k)
+        esistente = indice.get(k)
+        if esistente is None:
+            nuove.append(lezione)
+        elif esistente[1] != _confrontabili([lezione[i] for i in campi]):
+            modificate.append((esistente[0], lezione))
+        else:
+            duplicate += 1
+    return {"nuove": nuove, "modificate": modificate, "duplicate": duplicate, "corsi_nuovi": corsi_nuovi}
+
+
+def importa_lezioni(cursor, confronto):
+    """Applica un confronto (senza commit): corsi mancanti, lezioni nuove e lezioni modificate"""
+    inserisci_righe(cursor, "corsi", ("id_corso", "nome", "cliente"), confronto["corsi_nuovi"])
+    inserisci_righe(cursor, "lezioni", COLONNE_LEZIONE, confronto["nuove"])
+
+    if confronto["modificate"]:
+        placeholder = "%s" if db_utils.USE_POSTGRES else "?"
+        assegnazioni = ", ".join(f"{c} = {placeholder}" for c in CAMPI_AGGIORNATI)
+        campi = [_INDICE[c] for c in CAMPI_AGGIORNATI]
+        valori = [tuple(lezione[i] for i in campi) + (id_lezione,) for id_lezione, lezione in confronto["modificate"]]
+        query = f"UPDATE lezioni SET {assegnazioni} WHERE id = {placeholder}"
+        if db_utils.USE_POSTGRES:
+            from psycopg2.extras import execute_batch
+            execute_batch(cursor, query, valori, page_size=PAGINA_INSERT)
+        else:
+            cursor.executemany(query, valori)
+
+    aggiorna_riepilogo(cursor, {lezione[0] for lezione in confronto["nuove"]} |
+                       {lezione[0] for _, lezione in confronto["modificate"]})
+
+
+def salva_csv(file):
+    """Salva a blocchi il CSV caricato in CARTELLA_IMPORT_CSV; restituisce (codice, percorso).
+
+    Il file resta lì finché l'import non viene confermato o annullato (al più
+    fino alla pulizia dei file temporanei).
+    """
+    codice = uuid.uuid4().hex
+    return codice, salva_upload(file, CARTELLA_IMPORT_CSV, {"csv"}, nome=f"{codice}.csv")
+
+
+def apri_csv(percorso):
+    """File di testo del CSV salvato, da leggere riga per riga con valida_csv (BOM di Excel ignorato)"""
+    return open(percorso, encoding="utf-8-sig", newline="")
+
+
+def percorso_anteprima(codice):
+    """Percorso del CSV di un'anteprima; ValueError se il codice non è valido, FileNotFoundError se scaduto"""
+    if not re.fullmatch(r"[0-9a-f]{32}", codice or ""):
+        raise ValueError("Codice anteprima non valido")
+    percorso = os.path.join(CARTELLA_IMPORT_CSV, f"{codice}.csv")
+    if not os.path.exists(percorso):
+        raise FileNotFoundError("Anteprima scaduta: carica di nuovo il file")
+    return percorso
@@ -0,0 +1,241 @@
+"""
+Coda di lavori in background (SQLite/PostgreSQL).
+
+Le analisi PDF con Claude Vision (contratti e verifica fatture) richiedono
+minuti: le route accodano un lavoro nella tabella `jobs` e rispondono subito,
+il processo `worker.py` lo preleva, lo esegue e scrive il risultato.
+I template interrogano `/jobs/<id>` finché il lavoro non è concluso.
+La tabella `jobs` è creata dalla migrazione 13 (migrazioni.py).
+"""
+import json
+import traceback
+from datetime import datetime
+
+from db_utils import db_connection, get_placeholder
+
+STATO_IN_CODA = 'in_coda'
+STATO_IN_CORSO = 'in_corso'
+STATO_COMPLETATO = 'completato'
+STATO_ERRORE = 'errore'
+STATO_ANNULLATO = 'annullato'
+
+# tipo → funzione(payload, client, progresso) che restituisce il risultato (serializzabile JSON)
+_HANDLERS = {}
+
+
+def registra_job(tipo):
+    """Decoratore: registra la funzione che esegue i lavori di un certo tipo"""
+    def decoratore(func):
+        _HANDLERS[tipo] = func
+        return func
+    return decoratore
+
+
+def _adesso():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _riga_a_job(row):
+    """Converte una riga della tabella jobs in dict con payload/risultato decodificati"""
+    if not row:
+        return None
+    job = dict(row)
+    for campo in ('payload', 'risultato'):
+        job[campo] = json.loads(job[campo]) if job.get(campo) else None
+    return job
+
+
+def accoda_job(tipo, payload, chiave=None):
+    """Accoda un lavoro e ne restituisce l'id.
+
+    Se `chiave` è indicata e c'è già un lavoro attivo con la stessa chiave
+    (es. "contratto:12") viene restituito quello, senza duplicarlo.
+    """
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+
+        if chiave:
+            esistente = _job_attivo(cursor, chiave)
+            if esistente:
+                return esistente['id']
+
+        adesso = _adesso()
+        cursor.execute(f"""
+            INSERT INTO jobs (tipo, chiave, stato, progresso, messaggio, payload, creato_il, aggiornato_il)
+            VALUES ({placeholder}, {placeholder}, {placeholder}, 0, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+            RETURNING id
+        """, (tipo, chiave, STATO_IN_CODA, "In coda", json.dumps(payload), adesso, adesso))
+        job_id = cursor.fetchone()[0]
+        conn.commit()
+    return job_id
+
+
+def _job_attivo(cursor, chiave):
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        SELECT * FROM jobs
+        WHERE chiave = {placeholder} AND stato IN ({placeholder}, {placeholder})
+        ORDER BY id DESC
+        LIMIT 1
+    """, (chiave, STATO_IN_CODA, STATO_IN_CORSO))
+    return _riga_a_job(cursor.fetchone())
+
+
+def job_attivo(chiave):
+    """Restituisce l'ultimo lavoro in coda o in corso con questa chiave (o None)"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        return _job_attivo(cursor, chiave)
+
+
+def ultimo_job(*chiavi):
+    """Restituisce l'ultimo lavoro (in qualsiasi stato) con una delle chiavi indicate (o None)"""
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT * FROM jobs
+            WHERE chiave IN ({', '.join([placeholder] * len(chiavi))})
+            ORDER BY id DESC
+            LIMIT 1
+        """, chiavi)
+        return _riga_a_job(cursor.fetchone())
+
+
+def leggi_job(job_id):
+    """Restituisce il lavoro come dict (None se non esiste)"""
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM jobs WHERE id = {placeholder}", (job_id,))
+        return _riga_a_job(cursor.fetchone())
+
+
+def aggiorna_progresso(job_id, progresso, messaggio=None):
+    """Aggiorna la percentuale di avanzamento (0-100) e il messaggio di stato"""
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE jobs
+            SET progresso = {placeholder}, messaggio = COALESCE({placeholder}, messaggio), aggiornato_il = {placeholder}
+            WHERE id = {placeholder} AND stato = {placeholder}
+        """, (int(progresso), messaggio, _adesso(), job_id, STATO_IN_CORSO))
+        conn.commit()
+
+
+def preleva_job():
+    """Preleva in modo atomico il lavoro in coda più vecchio e lo segna 'in_corso'.
+
+    Su PostgreSQL usa FOR UPDATE SKIP LOCKED, su SQLite basta la singola
+    UPDATE (le scritture sono serializzate). Restituisce None se la coda è vuota.
+    """
+    placeholder = get_placeholder()
+    blocco = "FOR UPDATE SKIP LOCKED" if placeholder == "%s" else ""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE jobs
+            SET stato = {placeholder}, messaggio = {placeholder}, aggiornato_il = {placeholder}
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE stato = {placeholder}
+                ORDER BY id
+                LIMIT 1
+                {blocco}
+            )
+            RETURNING *
+        """, (STATO_IN_CORSO, "Avviato", _adesso(), STATO_IN_CODA))
+        job = _riga_a_job(cursor.fetchone())
+        conn.commit()
+    return job
+
+
+def _chiudi_job(job_id, stato, risultato=None, errore=None):
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE jobs
+            SET stato = {placeholder}, progresso = {placeholder}, messaggio = {placeholder},
+                risultato = {placeholder}, errore = {placeholder}, aggiornato_il = {placeholder}
+            WHERE id = {placeholder} AND stato = {placeholder}
+        """, (stato, 100, "Completato" if stato == STATO_COMPLETATO else "Errore",
+              json.dumps(risultato) if risultato is not None else None, errore, _adesso(),
+              job_id, STATO_IN_CORSO))
+        conn.commit()
+
+
+def annulla_job(job_id):
+    """Segna come annullato un lavoro in coda o in corso; True se è stato annullato.
+
+    Un lavoro in corso si interrompe al successivo controllo di
+    annullamento_richiesto (es. tra una pagina e l'altra del PDF).
+    """
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE jobs SET stato = {placeholder}, messaggio = {placeholder}, aggiornato_il = {placeholder}
+            WHERE id = {placeholder} AND stato IN ({placeholder}, {placeholder})
+        """, (STATO_ANNULLATO, "Annullato", _adesso(), job_id, STATO_IN_CODA, STATO_IN_CORSO))
+        annullato = cursor.rowcount > 0
+        conn.commit()
+    return annullato
+
+
+def annullamento_richiesto(job_id):
+    """True se il lavoro è stato annullato (da usare come callback `annulla`)"""
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT stato FROM jobs WHERE id = {placeholder}", (job_id,))
+        row = cursor.fetchone()
+    return row is not None and row['stato'] == STATO_ANNULLATO
+
+
+def ripristina_job_interrotti():
+    """Rimette in coda i lavori rimasti 'in_corso' (worker terminato a metà)"""
+    placeholder = get_placeholder()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            UPDATE jobs SET stato = {placeholder}, messaggio = {placeholder}, aggiornato_il = {placeholder}
+            WHERE stato = {placeholder}
+        """, (STATO_IN_CODA, "Rimesso in coda dopo un riavvio", _adesso(), STATO_IN_CORSO))
+        ripristinati = cursor.rowcount
+        conn.commit()
+    return ripristinati
+
+
+def esegui_job(job, client=None):
+    """Esegue un lavoro già prelevato e ne salva l'esito.
+
+    `client` è il client Anthropic da usare: None = client reale creato
+    dall'handler con ANTHROPIC_API_KEY (i test passano un client finto).
+    """
+    handler = _HANDLERS.get(job['tipo'])
+    if handler is None:
+        _chiudi_job(job['id'], STATO_ERRORE, errore=f"Tipo di lavoro sconosciuto: {job['tipo']}")
+        return False
+
+    def progresso(percentuale, messaggio=None):
+        aggiorna_progresso(job['id'], percentuale, messaggio)
+
+    # l'handler riceve anche l'id del lavoro (es. per collegarlo ai risultati salvati)
+    payload = dict(job['payload'] or {})
+    payload['id_job'] = job['id']
+
+    try:
+        risultato = handler(payload, client, progresso)
+    except Exception as e:
+        if annullamento_richiesto(job['id']):
+            print(f"🛑 Lavoro {job['id']} annullato")
+            return False
+        traceback.print_exc()
+        _chiudi_job(job['id'], STATO_ERRORE, errore=str(e))
+        return False
+
+    _chiudi_job(job['id'], STATO_COMPLETATO, risultato=risultato)
+    return True
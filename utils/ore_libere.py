@@ -0,0 +1,109 @@
+"""
+Fasce orarie libere (senza lezioni) nei giorni lavorativi di un periodo,
+per l'export "giorni liberi" di esporta_csv.
+
+Una sola query carica le lezioni del periodo (ordinate per data e ora, sull'indice
+(data, ora_inizio, id)); per ogni giorno gli intervalli occupati vengono
+uniti e confrontati con le fasce in un'unica scansione, senza query per
+giorno o per fascia. Una fascia [inizio, inizio + durata) è libera se nessuna
+lezione la interseca.
+"""
+from datetime import date, timedelta
+from itertools import groupby
+
+from db_utils import get_placeholder
+from utils.time_utils import minuti_da_orario
+
+GIORNI_SETTIMANA = ["Lunedì", "Martedì", "Mercoledì", "Giovedì", "Venerdì", "Sabato", "Domenica"]
+
+# Predefiniti: fasce di un'ora dalle 08:00 alle 21:00 (ultima fascia 20:00-21:00), dal lunedì al venerdì
+ORA_INIZIO_LAVORO = "08:00"
+ORA_FINE_LAVORO = "21:00"
+DURATA_FASCIA = 60
+GIORNI_LAVORATIVI = (0, 1, 2, 3, 4)
+
+
+def periodo(tipo_periodo, valore):
+    """(primo giorno, ultimo giorno) di una settimana (lunedì-domenica della data),
+    di un mese 'YYYY-MM' o di un anno 'YYYY'; ValueError se il valore non è valido"""
+    if tipo_periodo == "settimana":
+        giorno = date.fromisoformat(valore)
+        inizio = giorno - timedelta(days=giorno.weekday())
+        return inizio, inizio + timedelta(days=6)
+    if tipo_periodo == "mese":
+        anno, mese = (int(parte) for parte in valore.split("-"))
+        inizio = date(anno, mese, 1)
+        return inizio, (inizio + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    if tipo_periodo == "anno":
+        return date(int(valore), 1, 1), date(int(valore), 12, 31)
+    raise ValueError(f"Tipo di periodo non valido: {tipo_periodo!r}")
+
+
+def _intervalli_occupati(lezioni):
+    """Intervalli (inizio, fine) in minuti, uniti e ordinati, delle lezioni di un giorno"""
+    intervalli = []
+    for lezione in lezioni:
+        inizio, fine = minuti_da_orario(lezione["ora_inizio"]), minuti_da_orario(lezione["ora_fine"])
+        if inizio is None or fine is None:
+            continue
+        # Lezione che passa la mezzanotte: occupa il giorno fino alla fine
+        intervalli.append((inizio, fine if fine > inizio else 24 * 60))
+    intervalli.sort()
+
+    uniti = []
+    for inizio, fine in intervalli:
+        if uniti and inizio <= uniti[-1][1]:
+            uniti[-1][1] = max(uniti[-1][1], fine)
+        else:
+            uniti.append([inizio, fine])
+    return uniti
+
+
+def fasce_libere_giorno(occupati, inizio_lavoro, fine_lavoro, durata):
+    """Inizi (in minuti) delle fasce libere, dati gli intervalli occupati uniti e ordinati"""
+    libere = []
+    i = 0
+    fascia = inizio_lavoro
+    while fascia + durata <= fine_lavoro:
+        # Scarta gli intervalli finiti prima dell'inizio della fascia
+        while i < len(occupati) and occupati[i][1] <= fascia:
+            i += 1
+        if i == len(occupati) or occupati[i][0] >= fascia + durata:
+            libere.append(fascia)
+        fascia += durata
+    return libere
+
+
+def _orario(minuti):
+    return f"{minuti // 60:02d}:{minuti % 60:02d}"
+
+
+def ore_libere(cursor, inizio, fine, ora_inizio_lavoro=ORA_INIZIO_LAVORO, ora_fine_lavoro=ORA_FINE_LAVORO,
+               durata_fascia=DURATA_FASCIA, giorni_lavorativi=GIORNI_LAVORATIVI):
+    """[(data 'YYYY-MM-DD', nome del giorno, ['HH:MM', ...])] dei giorni lavorativi da inizio a fine
+    (inclusi) con almeno una fascia libera"""
+    inizio_lavoro, fine_lavoro = minuti_da_orario(ora_inizio_lavoro), minuti_da_orario(ora_fine_lavoro)
+    if inizio_lavoro is None or fine_lavoro is None or inizio_lavoro >= fine_lavoro:
+        raise ValueError(f"Orario di lavoro non valido: {ora_inizio_lavoro!r} - {ora_fine_lavoro!r}")
+    if durata_fascia <= 0:
+        raise ValueError(f"Durata della fascia non valida: {durata_fascia!r}")
+
+    placeholder = get_placeholder()
+    cursor.execute(f"""
+        SELECT data, ora_inizio, ora_fine FROM lezioni
+        WHERE data >= {placeholder} AND data <= {placeholder}
+        ORDER BY data, ora_inizio
+    """, (inizio.isoformat(), fine.isoformat()))
+    lezioni_per_giorno = {data: list(lezioni) for data, lezioni in groupby(cursor.fetchall(), key=lambda l: l["data"])}
+
+    risultato = []
+    giorno = inizio
+    while giorno <= fine:
+        if giorno.weekday() in giorni_lavorativi:
+            data = giorno.isoformat()
+            occupati = _intervalli_occupati(lezioni_per_giorno.get(data, ()))
+            libere = fasce_libere_giorno(occupati, inizio_lavoro, fine_lavoro, durata_fascia)
+            if libere:
+                risultato.append((data, GIORNI_SETTIMANA[giorno.weekday()], [_orario(m) for m in libere]))
+        giorno += timedelta(days=1)
+    return risultato
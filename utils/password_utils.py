@@ -47,6 +47,9 @@ def rehash_password_if_needed(user_id, current_hash, password):
             )
             conn.commit()
         
+        from models.user import invalida_utente
+        invalida_utente(user_id)
+        
         print(f"✅ Password rehashed for user ID {user_id} from Werkzeug to Bcrypt format")
         return True
     
@@ -0,0 +1,240 @@
+"""
+Cache su disco, indirizzata per contenuto, del testo e delle pagine JPEG dei PDF.
+
+La chiave è lo SHA-256 dei byte del file: lo stesso PDF analizzato più volte
+(upload, dettaglio contratto, ri-analisi, verifiche della stessa fattura)
+viene letto con PyPDF2 e renderizzato una sola volta.
+
+Struttura:  <PDF_CACHE_DIR>/<sha[:2]>/<sha>/testo.txt
+            <PDF_CACHE_DIR>/<sha[:2]>/<sha>/pagine_<max>_<lato>_q<qualità>/0001.jpg ...
+
+La dimensione totale è limitata da PDF_CACHE_MAX_MB: oltre il limite vengono
+eliminate le voci usate meno di recente (LRU sulla data di ultimo accesso).
+
+Manutenzione: python -m utils.pdf_cache [--svuota | --invalida SHA | --invalida-file PDF | --applica-limite]
+(senza opzioni stampa solo le statistiche della cache)
+"""
+import argparse
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+from utils.pdf_images import LATO_MAX_PX, QUALITA_JPEG, pagine_jpeg_base64
+
+CACHE_DIR = os.environ.get(
+    'PDF_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads', 'cache_pdf')
+)
+CACHE_MAX_MB = int(os.environ.get('PDF_CACHE_MAX_MB', '200'))
+
+_FILE_ACCESSO = '.ultimo_accesso'
+
+# (percorso, dimensione, mtime) → sha256, per non rileggere il file più volte
+_hash_memo = {}
+_lock_memo = threading.Lock()
+
+
+def hash_file(file_path):
+    """SHA-256 del contenuto del file (None se il file non esiste)"""
+    if not file_path or not os.path.exists(file_path):
+        return None
+    stat = os.stat(file_path)
+    chiave_memo = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with _lock_memo:
+        if chiave_memo in _hash_memo:
+            return _hash_memo[chiave_memo]
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for blocco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(blocco)
+    digest = sha.hexdigest()
+
+    with _lock_memo:
+        if len(_hash_memo) > 1000:
+            _hash_memo.clear()
+        _hash_memo[chiave_memo] = digest
+    return digest
+
+
+def _cartella_voce(sha):
+    return os.path.join(CACHE_DIR, sha[:2], sha)
+
+
+def _tocca(sha):
+    """Aggiorna la data di ultimo accesso della voce (per l'LRU)"""
+    percorso = os.path.join(_cartella_voce(sha), _FILE_ACCESSO)
+    try:
+        with open(percorso, 'a'):
+            pass
+        os.utime(percorso, None)
+    except OSError:
+        pass
+
+
+def _dimensione_cartella(percorso):
+    totale = 0
+    for radice, _, files in os.walk(percorso):
+        for nome in files:
+            try:
+                totale += os.path.getsize(os.path.join(radice, nome))
+            except OSError:
+                pass
+    return totale
+
+
+def _voci():
+    """Lista (sha, percorso, ultimo_accesso, byte) di tutte le voci in cache"""
+    voci = []
+    if not os.path.isdir(CACHE_DIR):
+        return voci
+    for prefisso in os.listdir(CACHE_DIR):
+        cartella_prefisso = os.path.join(CACHE_DIR, prefisso)
+        if len(prefisso) != 2 or not os.path.isdir(cartella_prefisso):
+            continue
+        for sha in os.listdir(cartella_prefisso):
+            percorso = os.path.join(cartella_prefisso, sha)
+            try:
+                accesso = os.path.getmtime(os.path.join(percorso, _FILE_ACCESSO))
+            except OSError:
+                accesso = os.path.getmtime(percorso)
+            voci.append((sha, percorso, accesso, _dimensione_cartella(percorso)))
+    return voci
+
+
+def applica_limite(max_mb=None):
+    """Elimina le voci meno usate finché la cache non rientra nel limite; restituisce le voci eliminate"""
+    limite = (CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    voci = sorted(_voci(), key=lambda v: v[2])
+    totale = sum(v[3] for v in voci)
+    eliminate = 0
+    for sha, percorso, _, dimensione in voci:
+        if totale <= limite:
+            break
+        shutil.rmtree(percorso, ignore_errors=True)
+        totale -= dimensione
+        eliminate += 1
+    return eliminate
+
+
+def invalida(sha):
+    """Elimina dalla cache testo e pagine di un file (per hash)"""
+    if sha:
+        shutil.rmtree(_cartella_voce(sha), ignore_errors=True)
+
+
+def invalida_file(file_path):
+    """Elimina dalla cache le voci del file indicato (da chiamare prima di cancellarlo)"""
+    invalida(hash_file(file_path))
+
+
+def svuota():
+    """Elimina l'intera cache"""
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def statistiche():
+    voci = _voci()
+    return {'voci': len(voci), 'mb': round(sum(v[3] for v in voci) / (1024 * 1024), 1),
+            'limite_mb': CACHE_MAX_MB, 'cartella': CACHE_DIR}
+
+
+def testo_pdf(file_path, estrai):
+    """Testo del PDF dalla cache; se assente lo calcola con `estrai(file_path)` e lo salva.
+
+    Viene salvato anche il testo vuoto (PDF scansionato senza layer testuale).
+    """
+    sha = hash_file(file_path)
+    if sha is None:
+        return estrai(file_path)
+
+    percorso = os.path.join(_cartella_voce(sha), 'testo.txt')
+    if os.path.exists(percorso):
+        _tocca(sha)
+        with open(percorso, encoding='utf-8') as f:
+            return f.read()
+
+    testo = estrai(file_path)
+    try:
+        os.makedirs(_cartella_voce(sha), exist_ok=True)
+        fd, temporaneo = tempfile.mkstemp(dir=_cartella_voce(sha), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(testo or "")
+        os.replace(temporaneo, percorso)
+        _tocca(sha)
+        applica_limite()
+    except OSError as e:
+        print(f"⚠️ Cache PDF: testo non salvato ({e})")
+    return testo
+
+
+def pagine_jpeg_con_cache(file_path, max_pagine=20, lato_max=LATO_MAX_PX, qualita=QUALITA_JPEG,
+                          annulla=None, **opzioni):
+    """Pagine JPEG base64 del PDF dalla cache; se assenti le renderizza e le salva.
+
+    Le pagine vengono salvate in una cartella temporanea e rese visibili solo a
+    conversione completata, così una conversione annullata non lascia voci parziali.
+    Le altre opzioni (processi, limite_memoria_mb) vanno a pagine_jpeg_base64.
+    """
+    sha = hash_file(file_path)
+    if sha is None:
+        return list(pagine_jpeg_base64(file_path, max_pagine=max_pagine, lato_max=lato_max,
+                                       qualita=qualita, annulla=annulla, **opzioni))
+
+    cartella = os.path.join(_cartella_voce(sha), f"pagine_{max_pagine}_{lato_max}_q{qualita}")
+    if os.path.isdir(cartella):
+        _tocca(sha)
+        pagine = []
+        for nome in sorted(os.listdir(cartella)):
+            with open(os.path.join(cartella, nome), 'rb') as f:
+                pagine.append(base64.b64encode(f.read()).decode())
+        return pagine
+
+    os.makedirs(_cartella_voce(sha), exist_ok=True)
+    temporanea = tempfile.mkdtemp(dir=_cartella_voce(sha), prefix='.pagine_')
+    try:
+        pagine = []
+        for numero, pagina in enumerate(pagine_jpeg_base64(file_path, max_pagine=max_pagine, lato_max=lato_max,
+                                                           qualita=qualita, annulla=annulla, **opzioni), start=1):
+            with open(os.path.join(temporanea, f"{numero:04d}.jpg"), 'wb') as f:
+                f.write(base64.b64decode(pagina))
+            pagine.append(pagina)
+        try:
+            os.rename(temporanea, cartella)
+        except OSError:
+            pass  # un altro processo ha già salvato le stesse pagine
+        _tocca(sha)
+        applica_limite()
+        return pagine
+    finally:
+        shutil.rmtree(temporanea, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenzione cache PDF (testo e pagine JPEG)")
+    gruppo = parser.add_mutually_exclusive_group()
+    gruppo.add_argument('--svuota', action='store_true', help="elimina l'intera cache")
+    gruppo.add_argument('--invalida', metavar='SHA', help="elimina la voce con questo SHA-256")
+    gruppo.add_argument('--invalida-file', metavar='PDF', help="elimina la voce di questo file")
+    gruppo.add_argument('--applica-limite', action='store_true', help="applica subito il limite di dimensione")
+    args = parser.parse_args()
+
+    if args.svuota:
+        svuota()
+        print("✅ Cache PDF svuotata")
+    elif args.invalida:
+        invalida(args.invalida)
+        print(f"✅ Voce {args.invalida} eliminata")
+    elif args.invalida_file:
+        invalida_file(args.invalida_file)
+        print(f"✅ Voce di {args.invalida_file} eliminata")
+    elif args.applica_limite:
+        print(f"✅ {applica_limite()} voci eliminate")
+    print(statistiche())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Conversione PDF → immagini JPEG base64 per Claude Vision, una pagina alla volta.
+
+Usato da routes/contratti.py (contratti) e fatture.py (verifica fatture).
+Ogni pagina viene renderizzata da sola, al DPI che porta il lato lungo a
+LATO_MAX_PX (il limite consigliato da Anthropic) invece che a 300 DPI fissi,
+codificata in JPEG e rilasciata prima di passare alla successiva: in memoria
+resta al massimo un bitmap alla volta più i JPEG già codificati.
+
+Con `processi` > 1 le pagine vengono renderizzate in parallelo da un pool di
+processi (al massimo un bitmap per processo), mantenendo l'ordine delle pagine.
+"""
+import base64
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoNonPronto
+from io import BytesIO
+
+import PyPDF2
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+
+LATO_MAX_PX = 1568      # lato lungo massimo consigliato da Anthropic per le immagini
+DPI_MASSIMO = 300       # mai oltre la risoluzione usata finora per l'OCR
+DPI_MINIMO = 72
+QUALITA_JPEG = 92
+
+# Tetto di memoria del processo (RSS) oltre il quale la conversione si interrompe
+LIMITE_MEMORIA_MB = int(os.environ.get('PDF_LIMITE_MEMORIA_MB', '768'))
+# Tetto di pixel per il bitmap di una singola pagina (RGB = 3 byte/pixel)
+MAX_PIXEL_PAGINA = int(os.environ.get('PDF_MAX_PIXEL_PAGINA', str(LATO_MAX_PX * LATO_MAX_PX)))
+# Processi per il rendering parallelo (1 = seriale). Ogni processo costa ~50 MB
+# più un bitmap di pagina: su Render (2 GB) conviene non superare 2-3.
+PROCESSI_PDF = int(os.environ.get('PDF_PROCESSI', '1'))
+
+
+class MemoriaPDFEsaurita(MemoryError):
+    """La conversione del PDF supererebbe il tetto di memoria configurato"""
+
+
+class ConversioneAnnullata(Exception):
+    """La conversione è stata annullata (richiesta o lavoro abbandonato)"""
+
+
+def rss_corrente_mb():
+    """Memoria residente attuale del processo in MB (None se non misurabile)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pagine_residenti = int(f.read().split()[1])
+        return pagine_residenti * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def calcola_dpi(larghezza_pt, altezza_pt, lato_max=LATO_MAX_PX):
+    """DPI che porta il lato lungo della pagina (in punti PDF, 1/72") a `lato_max` pixel.
+
+    Limitato a [DPI_MINIMO, DPI_MASSIMO] e abbassato se il bitmap supererebbe
+    MAX_PIXEL_PAGINA (pagine con proporzioni anomale).
+    """
+    lato_lungo = max(larghezza_pt, altezza_pt)
+    if lato_lungo <= 0:
+        return DPI_MASSIMO
+    dpi = lato_max * 72 / lato_lungo
+
+    pixel = (larghezza_pt * dpi / 72) * (altezza_pt * dpi / 72)
+    if pixel > MAX_PIXEL_PAGINA:
+        dpi *= (MAX_PIXEL_PAGINA / pixel) ** 0.5
+
+    return int(max(DPI_MINIMO, min(DPI_MASSIMO, dpi)))
+
+
+def dimensioni_pagine(file_path, max_pagine=None):
+    """Lista (larghezza_pt, altezza_pt) delle pagine, letta con PyPDF2 senza renderizzare"""
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        pagine = reader.pages if max_pagine is None else reader.pages[:max_pagine]
+        dimensioni = []
+        for pagina in pagine:
+            box = pagina.mediabox
+            larghezza, altezza = float(box.width), float(box.height)
+            if (pagina.get('/Rotate') or 0) % 180:
+                larghezza, altezza = altezza, larghezza
+            dimensioni.append((larghezza, altezza))
+    return dimensioni
+
+
+def _verifica_memoria(limite_mb):
+    if not limite_mb:
+        return
+    rss = rss_corrente_mb()
+    if rss is not None and rss > limite_mb:
+        raise MemoriaPDFEsaurita(
+            f"Memoria del processo {rss:.0f} MB oltre il limite di {limite_mb} MB: conversione PDF interrotta"
+        )
+
+
+def _verifica_annullamento(annulla):
+    if annulla is not None and annulla():
+        raise ConversioneAnnullata("Conversione PDF annullata")
+
+
+def codifica_jpeg(img, lato_max=LATO_MAX_PX, qualita=QUALITA_JPEG):
+    """Ridimensiona (se serve) e codifica un'immagine PIL in JPEG base64; chiude l'immagine"""
+    try:
+        if img.width > lato_max or img.height > lato_max:
+            ratio = min(lato_max / img.width, lato_max / img.height)
+            ridotta = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.Resampling.LANCZOS)
+            img.close()
+            img = ridotta
+        if img.mode != 'RGB':
+            convertita = img.convert('RGB')
+            img.close()
+            img = convertita
+        buffered = BytesIO()
+        img.save(buffered, format="JPEG", quality=qualita, optimize=True)
+        return base64.b64encode(buffered.getvalue()).decode()
+    finally:
+        img.close()
+
+
+def renderizza_pagina(file_path, numero_pagina, dpi, lato_max=LATO_MAX_PX, qualita=QUALITA_JPEG):
+    """Renderizza una singola pagina (1-based) e la restituisce come JPEG base64"""
+    immagini = convert_from_path(file_path, dpi=dpi, first_page=numero_pagina, last_page=numero_pagina)
+    if not immagini:
+        raise ValueError(f"Pagina {numero_pagina} non renderizzabile")
+    return codifica_jpeg(immagini[0], lato_max=lato_max, qualita=qualita)
+
+
+def _pagine_in_parallelo(file_path, lavori, processi, lato_max, qualita, limite_memoria_mb, annulla):
+    """Renderizza le pagine con un pool di processi e le restituisce nell'ordine originale.
+
+    Tiene in volo al massimo 2 pagine per processo; alla chiusura del
+    generatore (o su annullamento) le pagine non ancora avviate vengono scartate.
+    """
+    executor = ProcessPoolExecutor(max_workers=processi, mp_context=multiprocessing.get_context('spawn'))
+    in_volo = deque()
+    prossima = 0
+    try:
+        while prossima < len(lavori) or in_volo:
+            while prossima < len(lavori) and len(in_volo) < processi * 2:
+                _verifica_memoria(limite_memoria_mb)
+                numero, dpi = lavori[prossima]
+                in_volo.append(executor.submit(renderizza_pagina, file_path, numero, dpi, lato_max, qualita))
+                prossima += 1
+
+            futuro = in_volo.popleft()
+            while True:
+                _verifica_annullamento(annulla)
+                try:
+                    risultato = futuro.result(timeout=0.5)
+                    break
+                except FuturoNonPronto:
+                    continue
+            yield risultato
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def pagine_jpeg_base64(file_path, max_pagine=20, lato_max=LATO_MAX_PX, qualita=QUALITA_JPEG,
+                       limite_memoria_mb=LIMITE_MEMORIA_MB, processi=None, annulla=None):
+    """Generatore: restituisce una pagina alla volta come stringa JPEG base64, in ordine.
+
+    Prima di ogni pagina controlla la memoria del processo e, oltre
+    `limite_memoria_mb`, solleva MemoriaPDFEsaurita (None/0 = nessun limite).
+    `processi` > 1 attiva il pool di processi (default: PDF_PROCESSI).
+    `annulla` è una funzione senza argomenti: se restituisce True la
+    conversione si interrompe con ConversioneAnnullata.
+    """
+    try:
+        dimensioni = dimensioni_pagine(file_path, max_pagine)
+    except Exception as e:
+        # PDF che PyPDF2 non riesce a leggere: numero di pagine da poppler, formato A4
+        print(f"⚠️ Dimensioni pagine non leggibili ({e}), uso il formato A4")
+        dimensioni = [(595, 842)] * min(pdfinfo_from_path(file_path)['Pages'], max_pagine or 10**6)
+
+    lavori = [(numero, calcola_dpi(larghezza, altezza, lato_max))
+              for numero, (larghezza, altezza) in enumerate(dimensioni, start=1)]
+
+    processi = PROCESSI_PDF if processi is None else processi
+    if processi > 1 and len(lavori) > 1:
+        yield from _pagine_in_parallelo(file_path, lavori, min(processi, len(lavori)),
+                                        lato_max, qualita, limite_memoria_mb, annulla)
+        return
+
+    for numero, dpi in lavori:
+        _verifica_annullamento(annulla)
+        _verifica_memoria(limite_memoria_mb)
+        yield renderizza_pagina(file_path, numero, dpi, lato_max=lato_max, qualita=qualita)
@@ -0,0 +1,174 @@
+"""
+Tabella riepilogo_corsi: le metriche di utils/statistiche_corsi già aggregate
+per corso, mese della lezione (YYYY-MM) e tabella di provenienza (lezioni o
+archiviate).
+
+Ogni route che inserisce, modifica, elimina, completa, fattura o archivia
+lezioni chiama aggiorna_riepilogo() con i corsi toccati, sullo stesso cursore
+e prima del commit: le righe di quei corsi vengono ricalcolate nella stessa
+transazione della modifica. stato_crediti, l'avviso "arretrati" della
+dashboard e resoconto_annuale leggono solo questa tabella, quindi il loro
+costo dipende dal numero di corsi e mesi, non di lezioni.
+
+Dopo modifiche fatte fuori dall'app (script, SQL a mano):
+    python -m utils.riepilogo_corsi --ricostruisci
+Per controllare che la tabella coincida con le lezioni:
+    python -m utils.riepilogo_corsi --verifica
+"""
+import argparse
+import math
+import sys
+
+from db_utils import db_connection, get_placeholder
+from utils.statistiche_corsi import METRICHE, completa_statistiche
+
+# Metriche salvate per (corso, mese, archiviata): quelle delle statistiche
+# corsi più le somme per stato usate da resoconto_annuale
+METRICHE_RIEPILOGO = METRICHE + (
+    ("lezioni_completate_fatturate", "SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 1 THEN 1 ELSE 0 END)"),
+    ("importo_pianificato", "SUM(CASE WHEN l.stato = 'Pianificato' THEN l.importo ELSE 0 END)"),
+    ("importo_cancellato", "SUM(CASE WHEN l.stato = 'Cancellato' THEN l.importo ELSE 0 END)"),
+)
+
+CHIAVE = ("id_corso", "mese", "archiviata")
+COLONNE = CHIAVE + tuple(nome for nome, _ in METRICHE_RIEPILOGO)
+
+
+def _importo(nome):
+    return nome.startswith(("importo", "credito"))
+
+
+def crea_tabella(cursor, postgres):
+    """CREATE TABLE riepilogo_corsi (usata dalla migrazione 8)"""
+    reale = "DOUBLE PRECISION" if postgres else "REAL"
+    colonne = ",\n            ".join(
+        f"{nome} {'TEXT' if nome == 'ultima_data' else reale if _importo(nome) else 'INTEGER'}"
+        for nome, _ in METRICHE_RIEPILOGO)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS riepilogo_corsi (
+            id_corso TEXT NOT NULL,
+            mese TEXT NOT NULL,
+            archiviata INTEGER NOT NULL,
+            {colonne},
+            PRIMARY KEY (id_corso, mese, archiviata)
+        )
+    """)
+
+
+def _select_aggregati(id_corsi=None):
+    """SELECT delle righe del riepilogo calcolate da lezioni e archiviate"""
+    metriche = ",\n                   ".join(f"{sql} AS {nome}" for nome, sql in METRICHE_RIEPILOGO)
+    filtro = ""
+    if id_corsi is not None:
+        filtro = f"WHERE l.id_corso IN ({','.join([get_placeholder()] * len(id_corsi))})"
+    parti = [f"""
+            SELECT l.id_corso, COALESCE(extract_year_month(l.data), '') AS mese, {archiviata} AS archiviata,
+                   {metriche}
+            FROM {tabella} l
+            {filtro}
+            GROUP BY l.id_corso, COALESCE(extract_year_month(l.data), '')
+        """ for tabella, archiviata in (("lezioni", 0), ("archiviate", 1))]
+    parametri = tuple(id_corsi) * 2 if id_corsi is not None else ()
+    return " UNION ALL ".join(parti), parametri
+
+
+def aggiorna_riepilogo(cursor, id_corsi):
+    """Ricalcola le righe del riepilogo dei corsi indicati (senza commit)"""
+    id_corsi = sorted({c for c in id_corsi if c is not None})
+    if not id_corsi:
+        return
+    placeholders = ','.join([get_placeholder()] * len(id_corsi))
+    cursor.execute(f"DELETE FROM riepilogo_corsi WHERE id_corso IN ({placeholders})", id_corsi)
+    select, parametri = _select_aggregati(id_corsi)
+    cursor.execute(f"INSERT INTO riepilogo_corsi ({', '.join(COLONNE)}) {select}", parametri)
+
+
+def corsi_delle_lezioni(cursor, ids, tabella="lezioni"):
+    """Corsi a cui appartengono le lezioni indicate (da leggere prima di eliminarle)"""
+    if not ids:
+        return set()
+    placeholders = ','.join([get_placeholder()] * len(ids))
+    cursor.execute(f"SELECT DISTINCT id_corso FROM {tabella} WHERE id IN ({placeholders})", list(ids))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ricostruisci_riepilogo(cursor):
+    """Ricostruisce da zero l'intera tabella (senza commit); restituisce il numero di righe"""
+    cursor.execute("DELETE FROM riepilogo_corsi")
+    select, parametri = _select_aggregati()
+    cursor.execute(f"INSERT INTO riepilogo_corsi ({', '.join(COLONNE)}) {select}", parametri)
+    cursor.execute("SELECT COUNT(*) FROM riepilogo_corsi")
+    return cursor.fetchone()[0]
+
+
+def _uguali(a, b):
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+    return a == b
+
+
+def verifica_riepilogo(cursor):
+    """Confronta la tabella con le lezioni; restituisce l'elenco delle differenze"""
+    select, parametri = _select_aggregati()
+    cursor.execute(select, parametri)
+    attese = {tuple(row[c] for c in CHIAVE): dict(row) for row in cursor.fetchall()}
+    cursor.execute(f"SELECT {', '.join(COLONNE)} FROM riepilogo_corsi")
+    salvate = {tuple(row[c] for c in CHIAVE): dict(row) for row in cursor.fetchall()}
+
+    differenze = []
+    for chiave in sorted(attese.keys() | salvate.keys(), key=str):
+        attesa, salvata = attese.get(chiave), salvate.get(chiave)
+        if salvata is None:
+            differenze.append(f"{chiave}: riga mancante")
+        elif attesa is None:
+            differenze.append(f"{chiave}: riga in più")
+        else:
+            for nome, _ in METRICHE_RIEPILOGO:
+                if not _uguali(attesa[nome], salvata[nome]):
+                    differenze.append(f"{chiave} {nome}: atteso {attesa[nome]!r}, salvato {salvata[nome]!r}")
+    return differenze
+
+
+def statistiche_da_riepilogo(cursor):
+    """Come statistiche_corsi(cursor) (lezioni non archiviate), lette dal riepilogo"""
+    somme = ",\n               ".join(
+        f"{'MAX' if nome == 'ultima_data' else 'SUM'}(r.{nome}) AS {nome}" for nome, _ in METRICHE)
+    cursor.execute(f"""
+        SELECT r.id_corso,
+               COALESCE(c.cliente, 'Senza Cliente') AS cliente,
+               COALESCE(c.nome, r.id_corso) AS nome_corso,
+               {somme}
+        FROM riepilogo_corsi r
+        LEFT JOIN corsi c ON r.id_corso = c.id_corso
+        WHERE r.archiviata = 0
+        GROUP BY r.id_corso, c.cliente, c.nome
+        ORDER BY cliente, nome_corso
+    """)
+    return {row['id_corso']: completa_statistiche(dict(row)) for row in cursor.fetchall()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tabella riepilogo_corsi")
+    azione = parser.add_mutually_exclusive_group(required=True)
+    azione.add_argument('--ricostruisci', action='store_true', help="ricalcola l'intera tabella dalle lezioni")
+    azione.add_argument('--verifica', action='store_true', help="confronta la tabella con le lezioni")
+    args = parser.parse_args()
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if args.ricostruisci:
+            righe = ricostruisci_riepilogo(cursor)
+            conn.commit()
+            print(f"✅ Riepilogo ricostruito: {righe} righe")
+            return
+        differenze = verifica_riepilogo(cursor)
+
+    for differenza in differenze[:50]:
+        print(f"❌ {differenza}")
+    if differenze:
+        sys.exit(f"\n❌ {len(differenze)} differenze: eseguire python -m utils.riepilogo_corsi --ricostruisci")
+    print("✅ Riepilogo coerente con le lezioni")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Statistiche dei corsi (ore, importi, stato di fatturazione) calcolate con una
+sola scansione di `lezioni` e somme condizionali sulle colonne salvate
+durata_minuti e importo.
+
+Usate da dettagli_corso, lista_corsi, aggiungi_lezione e stato_crediti, così
+che tutte le pagine mostrino gli stessi numeri. stato_fatturazione_corsi parte
+da `corsi` e restituisce in una sola query anche i corsi senza lezioni.
+"""
+from db_utils import get_placeholder
+
+# Metriche calcolate per ogni corso: nome -> espressione SQL su lezioni l
+METRICHE = (
+    ("totale_lezioni", "COUNT(l.id)"),
+    ("lezioni_completate", "SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END)"),
+    ("lezioni_fatturate", "SUM(CASE WHEN l.fatturato = 1 THEN 1 ELSE 0 END)"),
+    ("lezioni_parzialmente_fatturate", "SUM(CASE WHEN l.fatturato = 2 THEN 1 ELSE 0 END)"),
+    ("minuti_totali", "SUM(l.durata_minuti)"),
+    ("minuti_completati", "SUM(CASE WHEN l.stato = 'Completato' THEN l.durata_minuti ELSE 0 END)"),
+    ("minuti_fatturati", "SUM(CASE WHEN l.fatturato = 1 THEN l.durata_minuti ELSE 0 END)"),
+    ("importo_totale", "SUM(l.importo)"),
+    ("importo_completato", "SUM(CASE WHEN l.stato = 'Completato' THEN l.importo ELSE 0 END)"),
+    ("importo_fatturato", "SUM(CASE WHEN l.fatturato = 1 THEN l.importo ELSE 0 END)"),
+    ("credito_fatturato", "SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 1 THEN l.importo ELSE 0 END)"),
+    ("credito_maturato", "SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0 THEN l.importo ELSE 0 END)"),
+    ("credito_futuro", "SUM(CASE WHEN l.stato != 'Completato' THEN l.importo ELSE 0 END)"),
+    ("ultima_data", "MAX(l.data)"),
+)
+
+
+def statistiche_vuote(id_corso, nome=None, cliente=None):
+    """Statistiche di un corso senza lezioni"""
+    stat = {"id_corso": id_corso, "nome_corso": nome or id_corso, "cliente": cliente or 'Senza Cliente'}
+    stat.update({nome_metrica: 0 for nome_metrica, _ in METRICHE})
+    stat["ultima_data"] = None
+    return completa_statistiche(stat)
+
+
+def completa_statistiche(stat):
+    """Valori nulli a zero, importi in float e ore derivate dai minuti"""
+    for nome_metrica, _ in METRICHE:
+        if nome_metrica == "ultima_data":
+            continue
+        valore = stat[nome_metrica] or 0
+        stat[nome_metrica] = float(valore) if nome_metrica.startswith(("importo", "credito")) else int(valore)
+    stat["ore_totali"] = stat["minuti_totali"] / 60
+    stat["ore_completate"] = stat["minuti_completati"] / 60
+    stat["ore_fatturate"] = stat["minuti_fatturati"] / 60
+    stat["ore_rimanenti"] = stat["ore_totali"] - stat["ore_fatturate"]
+    stat["completamente_fatturato"] = stat["totale_lezioni"] > 0 and stat["lezioni_fatturate"] == stat["totale_lezioni"]
+    stat["parzialmente_fatturato"] = stat["lezioni_parzialmente_fatturate"] > 0
+    return stat
+
+
+def _select_metriche():
+    return ",\n               ".join(f"{sql} AS {nome}" for nome, sql in METRICHE)
+
+
+def statistiche_corsi(cursor, id_corso=None):
+    """Statistiche per corso in una sola query: {id_corso: {metrica: valore}}.
+
+    Con id_corso limita il calcolo a quel corso. Solo i corsi con almeno una
+    lezione compaiono nel risultato, ordinati per cliente e nome.
+    """
+    metriche = _select_metriche()
+    filtro = ""
+    parametri = ()
+    if id_corso is not None:
+        filtro = f"WHERE l.id_corso = {get_placeholder()}"
+        parametri = (id_corso,)
+
+    cursor.execute(f"""
+        SELECT l.id_corso,
+               COALESCE(c.cliente, 'Senza Cliente') AS cliente,
+               COALESCE(c.nome, l.id_corso) AS nome_corso,
+               {metriche}
+        FROM lezioni l
+        LEFT JOIN corsi c ON l.id_corso = c.id_corso
+        {filtro}
+        GROUP BY l.id_corso, c.cliente, c.nome
+        ORDER BY cliente, nome_corso
+    """, parametri)
+    return {row['id_corso']: completa_statistiche(dict(row)) for row in cursor.fetchall()}
+
+
+def statistiche_corso(cursor, id_corso):
+    """Statistiche di un singolo corso (tutte a zero se non ha lezioni)"""
+    return statistiche_corsi(cursor, id_corso).get(id_corso) or statistiche_vuote(id_corso)
+
+
+def stato_fatturazione_corsi(cursor):
+    """Tutti i corsi (ordinati per nome) con le statistiche delle loro lezioni.
+
+    Una sola query corsi LEFT JOIN lezioni GROUP BY id_corso al posto di una
+    query per corso; i corsi senza lezioni hanno le metriche a zero.
+    """
+    cursor.execute(f"""
+        SELECT c.id_corso, c.nome, c.cliente,
+               {_select_metriche()}
+        FROM corsi c
+        LEFT JOIN lezioni l ON l.id_corso = c.id_corso
+        GROUP BY c.id_corso, c.nome, c.cliente
+        ORDER BY c.nome
+    """)
+    return [completa_statistiche(dict(row)) for row in cursor.fetchall()]
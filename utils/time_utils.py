@@ -1,5 +1,11 @@
-from datetime import datetime
+import re
+from datetime import date, datetime
+from functools import lru_cache
 
+# Formati di data accettati in input (form, CSV, vecchi dati); nel database solo YYYY-MM-DD
+FORMATI_DATA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d", "%d/%m/%y")
+
+@lru_cache(maxsize=4096)
 def correggi_orario(orario):
     """
     Corregge il formato dell'orario assicurandosi che sia nel formato HH:MM
@@ -14,15 +20,57 @@ def correggi_orario(orario):
 
 def calcola_ore(ora_inizio, ora_fine):
     """
-    Calcola le ore tra ora_inizio e ora_fine
+    Calcola le ore tra ora_inizio e ora_fine (se ora_fine precede ora_inizio, passa la mezzanotte)
     """
-    try:
-        inizio = datetime.strptime(ora_inizio, "%H:%M")
-        fine = datetime.strptime(ora_fine, "%H:%M")
-        return (fine - inizio).seconds / 3600
-    except Exception as e:
-        print(f"❌ Errore orario: {e}")
+    inizio, fine = minuti_da_orario(ora_inizio), minuti_da_orario(ora_fine)
+    if inizio is None or fine is None:
+        print(f"❌ Errore orario: {ora_inizio!r} - {ora_fine!r}")
         return 0.0
+    return (fine - inizio) % (24 * 60) / 60
+
+@lru_cache(maxsize=4096)
+def minuti_da_orario(ora):
+    """
+    Minuti dalla mezzanotte di un orario 'HH:MM' (accetta anche 'H:MM' e 'HH.MM'), None se non valido
+    """
+    try:
+        ore, minuti = re.split(r"[:.]", ora.strip())[:2]
+        return int(ore) * 60 + int(minuti)
+    except (AttributeError, ValueError):
+        return None
+
+@lru_cache(maxsize=4096)
+def data_iso(valore):
+    """
+    Data nel formato del database 'YYYY-MM-DD' (giorno prima del mese nei formati con '/', '-' o '.'),
+    None se vuota o non valida
+    """
+    if isinstance(valore, date):
+        return valore.strftime("%Y-%m-%d")
+    if not valore:
+        return None
+    testo = str(valore).strip()
+    # 'YYYY-MM-DD HH:MM:SS' / 'YYYY-MM-DDTHH:MM': conta solo la data
+    if re.match(r"^\d{4}-\d{1,2}-\d{1,2}[ T]", testo):
+        testo = re.split(r"[ T]", testo, maxsplit=1)[0]
+    for formato in FORMATI_DATA:
+        try:
+            return datetime.strptime(testo, formato).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+def durata_e_importo(ora_inizio, ora_fine, compenso_orario):
+    """
+    Valori delle colonne durata_minuti e importo di una lezione
+    (stesse ore di calcola_ore e della funzione SQL calcola_ore; None se un orario non è valido)
+    """
+    inizio, fine = minuti_da_orario(ora_inizio), minuti_da_orario(ora_fine)
+    if inizio is None or fine is None:
+        return None, None
+    durata = (fine - inizio) % (24 * 60)
+    importo = durata / 60.0 * float(compenso_orario) if compenso_orario is not None else None
+    return durata, importo
 
 def get_local_now():
     """
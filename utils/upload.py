@@ -0,0 +1,115 @@
+"""
+Upload di file (CSV delle lezioni, PDF di contratti e fatture) e pulizia dei
+file temporanei.
+
+salva_upload() copia il file caricato su disco a blocchi di BLOCCO_BYTE,
+senza leggerlo tutto in memoria, e interrompe la copia oltre il limite di
+dimensione del tipo di file. Il corpo della richiesta è già limitato da
+MAX_CONTENT_LENGTH (config dell'app): oltre il limite Flask risponde 413
+prima che la route legga il file.
+
+I file temporanei (anteprime dell'import CSV, PDF da verificare, vecchi
+export in static/temp) vengono eliminati da pulisci_temporanei() dopo
+ORE_CONSERVAZIONE_TEMP ore; il worker la esegue ogni INTERVALLO_PULIZIA secondi.
+
+Pulizia manuale: python -m utils.upload [--ore 24]
+"""
+import argparse
+import os
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', '20')) * 1024 * 1024
+BLOCCO_BYTE = 64 * 1024
+
+CARTELLA_TEMP = os.path.join(BASE_DIR, 'uploads', 'tmp')
+CARTELLA_IMPORT_CSV = os.path.join(BASE_DIR, 'uploads', 'import_csv')
+CARTELLE_TEMP = (CARTELLA_TEMP, CARTELLA_IMPORT_CSV, os.path.join(BASE_DIR, 'static', 'temp'))
+
+ORE_CONSERVAZIONE_TEMP = float(os.environ.get('TEMP_ORE_CONSERVAZIONE', '24'))
+INTERVALLO_PULIZIA = float(os.environ.get('TEMP_INTERVALLO_PULIZIA_SECONDI', '3600'))
+
+
+class UploadNonValido(ValueError):
+    """File mancante, con estensione non ammessa o troppo grande"""
+
+
+def estensione_ammessa(filename, estensioni):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in estensioni
+
+
+def salva_upload(file, cartella, estensioni, nome=None, prefisso=None, max_byte=MAX_CONTENT_LENGTH):
+    """Salva un file caricato (FileStorage) nella cartella, a blocchi.
+
+    Il nome è quello indicato o, se None, quello del file reso sicuro con
+    secure_filename, preceduto da "<prefisso>_" se indicato. Restituisce il
+    percorso del file salvato; UploadNonValido se il file manca, ha
+    un'estensione non ammessa o supera max_byte (il file parziale viene
+    eliminato).
+    """
+    if not file or not file.filename:
+        raise UploadNonValido("Nessun file selezionato")
+    if not estensione_ammessa(file.filename, estensioni):
+        formati = ", ".join(sorted(e.upper() for e in estensioni))
+        raise UploadNonValido(f"Formato file non valido. Formati ammessi: {formati}")
+
+    nome = nome or secure_filename(file.filename)
+    if prefisso:
+        nome = f"{prefisso}_{nome}"
+    os.makedirs(cartella, exist_ok=True)
+    percorso = os.path.join(cartella, nome)
+    parziale = f"{percorso}.{uuid.uuid4().hex}.part"
+    scritti = 0
+    try:
+        with open(parziale, 'wb') as destinazione:
+            for blocco in iter(lambda: file.stream.read(BLOCCO_BYTE), b''):
+                scritti += len(blocco)
+                if scritti > max_byte:
+                    raise UploadNonValido(f"File troppo grande (massimo {max_byte // (1024 * 1024)} MB)")
+                destinazione.write(blocco)
+        os.replace(parziale, percorso)
+    finally:
+        if os.path.exists(parziale):
+            os.remove(parziale)
+    return percorso
+
+
+def salva_upload_temporaneo(file, estensioni, max_byte=MAX_CONTENT_LENGTH):
+    """Salva il file in CARTELLA_TEMP con un nome univoco (eliminato dalla pulizia se dimenticato)"""
+    estensione = file.filename.rsplit('.', 1)[-1].lower() if file and file.filename else ''
+    return salva_upload(file, CARTELLA_TEMP, estensioni, nome=f"{uuid.uuid4().hex}.{estensione}", max_byte=max_byte)
+
+
+def pulisci_temporanei(ore=ORE_CONSERVAZIONE_TEMP, cartelle=CARTELLE_TEMP):
+    """Elimina i file delle cartelle temporanee modificati più di `ore` ore fa; restituisce quanti"""
+    limite = time.time() - ore * 3600
+    eliminati = 0
+    for cartella in cartelle:
+        if not os.path.isdir(cartella):
+            continue
+        for voce in os.scandir(cartella):
+            try:
+                if voce.is_file() and voce.stat().st_mtime < limite:
+                    os.remove(voce.path)
+                    eliminati += 1
+            except FileNotFoundError:
+                # eliminato nel frattempo (import confermato, worker)
+                continue
+    return eliminati
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Elimina i file temporanei degli upload")
+    parser.add_argument('--ore', type=float, default=ORE_CONSERVAZIONE_TEMP,
+                        help=f"età minima in ore dei file da eliminare (predefinito {ORE_CONSERVAZIONE_TEMP:g})")
+    args = parser.parse_args()
+    eliminati = pulisci_temporanei(args.ore)
+    print(f"✅ {eliminati} file temporanei eliminati (più vecchi di {args.ore:g} ore)")
+
+
+if __name__ == "__main__":
+    main()
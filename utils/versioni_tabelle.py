@@ -0,0 +1,80 @@
+"""
+Contatori di modifica per tabella (tabella versioni_tabelle).
+
+Ogni INSERT, UPDATE o DELETE sulle tabelle in TABELLE_CONTATE incrementa la
+versione della tabella e ne aggiorna la data di modifica, tramite trigger
+creati dalla migrazione 10: valgono anche per script e SQL eseguiti fuori
+dall'app. Le API di sola lettura (es. /api/eventi) ne ricavano ETag e
+Last-Modified e rispondono 304 senza rieseguire la query se nulla è cambiato.
+"""
+from datetime import datetime, timezone
+
+from db_utils import get_placeholder
+
+TABELLE_CONTATE = ("lezioni", "corsi")
+
+
+def crea_contatori(cursor, postgres):
+    """Tabella versioni_tabelle e trigger di incremento (usata dalla migrazione 10)"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS versioni_tabelle (
+            tabella TEXT PRIMARY KEY,
+            versione INTEGER NOT NULL DEFAULT 0,
+            modificata_il TEXT NOT NULL
+        )
+    """)
+    placeholder = "%s" if postgres else "?"
+    adesso = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    for tabella in TABELLE_CONTATE:
+        cursor.execute(f"SELECT 1 FROM versioni_tabelle WHERE tabella = {placeholder}", (tabella,))
+        if not cursor.fetchone():
+            cursor.execute(f"""
+                INSERT INTO versioni_tabelle (tabella, versione, modificata_il)
+                VALUES ({placeholder}, 1, {placeholder})
+            """, (tabella, adesso))
+
+    if postgres:
+        # Un incremento per istruzione, non per riga
+        cursor.execute("""
+            CREATE OR REPLACE FUNCTION incrementa_versione_tabella() RETURNS trigger AS $$
+            BEGIN
+                UPDATE versioni_tabelle
+                SET versione = versione + 1,
+                    modificata_il = to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+                WHERE tabella = TG_TABLE_NAME;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        for tabella in TABELLE_CONTATE:
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_versione_{tabella} ON {tabella}")
+            cursor.execute(f"""
+                CREATE TRIGGER trg_versione_{tabella}
+                AFTER INSERT OR UPDATE OR DELETE ON {tabella}
+                FOR EACH STATEMENT EXECUTE PROCEDURE incrementa_versione_tabella()
+            """)
+        return
+
+    # SQLite ha solo trigger per riga e uno per tipo di operazione
+    for tabella in TABELLE_CONTATE:
+        for operazione in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_versione_{tabella}_{operazione.lower()}
+                AFTER {operazione} ON {tabella}
+                BEGIN
+                    UPDATE versioni_tabelle
+                    SET versione = versione + 1, modificata_il = datetime('now')
+                    WHERE tabella = '{tabella}';
+                END
+            """)
+
+
+def versioni(cursor, tabelle):
+    """(versioni delle tabelle in ordine, ultima modifica UTC) per ETag e Last-Modified"""
+    placeholders = ','.join([get_placeholder()] * len(tabelle))
+    cursor.execute(f"SELECT tabella, versione, modificata_il FROM versioni_tabelle WHERE tabella IN ({placeholders})",
+                   tuple(tabelle))
+    righe = {row['tabella']: row for row in cursor.fetchall()}
+    ultima = max((str(righe[t]['modificata_il']) for t in tabelle if t in righe), default=None)
+    modificata_il = datetime.strptime(ultima, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc) if ultima else None
+    return tuple(righe[t]['versione'] if t in righe else 0 for t in tabelle), modificata_il
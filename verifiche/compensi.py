@@ -0,0 +1,239 @@
+"""
+Verifica di regressione (golden output) di utils/compensi: compensi e
+compensi_cliente passati a compenso.html devono coincidere con quelli del
+calcolo precedente (due query su lezioni e archiviate e un ciclo Python con
+calcola_ore per lezione), per tutti i filtri della pagina.
+
+Per default popola un database SQLite temporaneo con dati sintetici (lezioni
+che passano la mezzanotte, orari non validi, corsi solo archiviati, clienti
+vuoti); con --database-corrente confronta in sola lettura i dati del database
+configurato (SQLite o DATABASE_URL PostgreSQL).
+
+Uso: python verifiche/compensi.py [--corsi 40] [--lezioni 3000] [--database-corrente]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+
+ORARI = [("09:00", "13:00"), ("14:00", "18:00"), ("9:30", "12:15"), ("22:00", "01:30"), ("08:45", "10:05")]
+STATI = ["Completato", "Completato", "Pianificato", "Cancellato", "Sospeso"]
+CLIENTI = ["Alfa", "Beta", "Gamma", "", None]
+
+
+def popola(n_corsi, n_lezioni):
+    from db_utils import db_connection
+    from utils.time_utils import durata_e_importo
+
+    rnd = random.Random(11)
+    corsi = [f"C{i:03d}" for i in range(n_corsi)]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # Un corso su cinque solo tra gli archiviati, uno su sette in entrambe le tabelle
+        # (con lo stesso cliente: il calcolo precedente sceglieva a caso tra i due)
+        attivi, archiviati = [], []
+        for i, c in enumerate(corsi):
+            cliente = rnd.choice(CLIENTI)
+            if i % 5:
+                attivi.append((c, f"Corso {c}", cliente))
+            if i % 5 == 0 or i % 7 == 0:
+                archiviati.append((c, f"Corso {c}", cliente if i % 5 else rnd.choice(CLIENTI), "2025-01-01"))
+        cursor.executemany("INSERT INTO corsi (id_corso, nome, cliente) VALUES (?, ?, ?)", attivi)
+        cursor.executemany("INSERT INTO corsi_archiviati (id_corso, nome, cliente, data_archiviazione) VALUES (?, ?, ?, ?)", archiviati)
+
+        for tabella, n in (("lezioni", n_lezioni), ("archiviate", n_lezioni // 3)):
+            righe = []
+            for _ in range(n):
+                ora_inizio, ora_fine = rnd.choice(ORARI)
+                compenso = rnd.choice([25.0, 30.0, 37.5, 20.1])
+                giorno = date(2024, 1, 1) + timedelta(days=rnd.randrange(700))
+                righe.append((rnd.choice(corsi + ["ORFANO"]), "Materia", giorno.isoformat(), ora_inizio, ora_fine,
+                              "Aula", compenso, rnd.choice(STATI), rnd.choice([0, 0, 1, 1, 2, None]),
+                              *durata_e_importo(ora_inizio, ora_fine, compenso)))
+            # Orario non valido: durata NULL, compenso 0 ma il cliente compare nel report
+            righe.append(("C001", "Materia", "2024-03-01", "9", "10:00", "Aula", 30.0, "Completato", 0, None, None))
+            cursor.executemany(f"""
+                INSERT INTO {tabella} (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato,
+                                       fatturato, durata_minuti, importo)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, righe)
+        conn.commit()
+
+
+# ---------------------------------------------------
+# Calcolo precedente di lezioni.compenso
+# ---------------------------------------------------
+
+def compensi_precedenti(cursor, cliente="", corso="", periodo="tutti", data_inizio="", data_fine=""):
+    """Il codice di prima della route, con i filtri con gli stessi nomi di report_compensi"""
+    from utils.time_utils import calcola_ore
+
+    cliente_filtro, corso_filtro, periodo_filtro = cliente, corso, periodo
+
+    cursor.execute("""
+        SELECT c.id_corso, c.nome, c.cliente
+        FROM corsi c
+        UNION
+        SELECT ca.id_corso, ca.nome, ca.cliente
+        FROM corsi_archiviati ca
+    """)
+    corsi_dict = {}
+    for row in cursor.fetchall():
+        cliente_corso = row["cliente"] if row["cliente"] is not None else ""
+        corsi_dict[row["id_corso"]] = {"id_corso": row["id_corso"], "nome": row["nome"], "cliente": cliente_corso}
+
+    placeholder = db_utils.get_placeholder()
+    tutte_lezioni = []
+    for tabella in ("lezioni", "archiviate"):
+        query = f"""
+            SELECT l.id, l.id_corso, l.materia, l.data, l.ora_inizio, l.ora_fine,
+                   l.luogo, l.compenso_orario, l.stato, l.fatturato, l.mese_fatturato,
+                   COALESCE(c.cliente, ca.cliente, 'Sconosciuto') as cliente
+            FROM {tabella} l
+            LEFT JOIN corsi c ON l.id_corso = c.id_corso
+            LEFT JOIN corsi_archiviati ca ON l.id_corso = ca.id_corso
+            WHERE l.ora_inizio IS NOT NULL AND l.ora_fine IS NOT NULL
+        """
+        params = []
+        if cliente_filtro:
+            query += f" AND (c.cliente = {placeholder} OR ca.cliente = {placeholder})"
+            params += [cliente_filtro, cliente_filtro]
+        if corso_filtro:
+            query += f" AND l.id_corso = {placeholder}"
+            params.append(corso_filtro)
+        if periodo_filtro == "giorno" and data_inizio:
+            query += f" AND l.data = {placeholder}"
+            params.append(data_inizio)
+        elif periodo_filtro == "settimana" and data_inizio:
+            query += f" AND extract_year_week(l.data) = extract_year_week({placeholder})"
+            params.append(data_inizio)
+        elif periodo_filtro == "mese" and data_inizio:
+            query += f" AND extract_year_month(l.data) = {placeholder}"
+            params.append(data_inizio)
+        elif periodo_filtro == "anno" and data_inizio:
+            query += f" AND extract_year(l.data) = {placeholder}"
+            params.append(data_inizio)
+        elif periodo_filtro == "intervallo" and data_inizio and data_fine:
+            query += f" AND l.data BETWEEN {placeholder} AND {placeholder}"
+            params += [data_inizio, data_fine]
+        cursor.execute(query, params)
+        tutte_lezioni += cursor.fetchall()
+
+    def vuoti():
+        return {"completate": 0, "fatturate": 0, "da_fatturare": 0, "pianificate": 0, "cancellate": 0}
+
+    compensi = vuoti()
+    compensi_cliente = {}
+    for lezione in tutte_lezioni:
+        compenso = calcola_ore(lezione["ora_inizio"], lezione["ora_fine"]) * lezione["compenso_orario"]
+        cliente_lezione = lezione["cliente"] if lezione["cliente"] and lezione["cliente"] != "Sconosciuto" else None
+        if not cliente_lezione:
+            corso_info = corsi_dict.get(lezione["id_corso"])
+            if corso_info and corso_info["cliente"]:
+                cliente_lezione = corso_info["cliente"]
+        cliente_lezione = cliente_lezione or "Sconosciuto"
+        compensi_cliente.setdefault(cliente_lezione, vuoti())
+        for totali in (compensi, compensi_cliente[cliente_lezione]):
+            if lezione["stato"] == "Completato":
+                if lezione["fatturato"] == 1:
+                    totali["fatturate"] += compenso
+                else:
+                    totali["da_fatturare"] += compenso
+                totali["completate"] += compenso
+            elif lezione["stato"] == "Pianificato":
+                totali["pianificate"] += compenso
+            elif lezione["stato"] == "Cancellato":
+                totali["cancellate"] += compenso
+    return compensi, compensi_cliente
+
+
+def filtri_da_verificare(cursor):
+    """Combinazioni dei filtri della pagina, con valori presi dai dati"""
+    cursor.execute("SELECT MIN(data), MAX(data) FROM lezioni")
+    prima, ultima = cursor.fetchone()
+    cursor.execute("SELECT id_corso FROM lezioni GROUP BY id_corso ORDER BY COUNT(*) DESC LIMIT 1")
+    corso = cursor.fetchone()
+    cursor.execute("""
+        SELECT cliente FROM corsi WHERE cliente IS NOT NULL AND cliente != ''
+        UNION SELECT cliente FROM corsi_archiviati WHERE cliente IS NOT NULL AND cliente != ''
+    """)
+    clienti = sorted(row[0] for row in cursor.fetchall())
+
+    filtri = [{}]
+    filtri += [{"cliente": cliente} for cliente in clienti[:3]]
+    if corso:
+        filtri.append({"corso": corso[0]})
+        if clienti:
+            filtri.append({"corso": corso[0], "cliente": clienti[0]})
+    if prima:
+        filtri += [
+            {"periodo": "giorno", "data_inizio": prima},
+            {"periodo": "settimana", "data_inizio": prima},
+            {"periodo": "mese", "data_inizio": prima[:7]},
+            {"periodo": "anno", "data_inizio": prima[:4]},
+            {"periodo": "intervallo", "data_inizio": prima, "data_fine": ultima[:8] + "01"},
+            {"periodo": "intervallo", "data_inizio": prima},
+        ]
+    return filtri
+
+
+def uguali(a, b):
+    return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-6)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corsi', type=int, default=40)
+    parser.add_argument('--lezioni', type=int, default=3000)
+    parser.add_argument('--database-corrente', action='store_true',
+                        help="confronta i dati del database configurato (sola lettura)")
+    args = parser.parse_args()
+
+    if not args.database_corrente:
+        if db_utils.USE_POSTGRES:
+            sys.exit("I dati sintetici vanno in un database SQLite temporaneo: eseguire senza DATABASE_URL "
+                     "oppure con --database-corrente")
+        import database
+        database.DB_PATH = os.path.join(tempfile.mkdtemp(), 'verifica_compensi.db')
+        database.init_db()
+        from migrazioni import applica_migrazioni
+        applica_migrazioni()
+        popola(args.corsi, args.lezioni)
+
+    from utils.compensi import report_compensi
+
+    differenze = []
+    with db_utils.db_connection() as conn:
+        cursor = conn.cursor()
+        filtri = filtri_da_verificare(cursor)
+        for filtro in filtri:
+            atteso, atteso_cliente = compensi_precedenti(cursor, **filtro)
+            ottenuto, ottenuto_cliente = report_compensi(cursor, **filtro)
+            for nome, valore in atteso.items():
+                if not uguali(valore, ottenuto[nome]):
+                    differenze.append(f"{filtro} totale {nome}: prima {valore!r}, ora {ottenuto[nome]!r}")
+            if set(atteso_cliente) != set(ottenuto_cliente):
+                differenze.append(f"{filtro} clienti: prima {sorted(atteso_cliente)}, ora {sorted(ottenuto_cliente)}")
+                continue
+            for cliente, valori in atteso_cliente.items():
+                for nome, valore in valori.items():
+                    if not uguali(valore, ottenuto_cliente[cliente][nome]):
+                        differenze.append(f"{filtro} {cliente} {nome}: prima {valore!r}, "
+                                          f"ora {ottenuto_cliente[cliente][nome]!r}")
+
+    for differenza in differenze[:20]:
+        print(f"❌ {differenza}")
+    if differenze:
+        sys.exit(f"\n❌ {len(differenze)} valori diversi su {len(filtri)} combinazioni di filtri")
+    print(f"✅ Compensi identici al calcolo precedente per {len(filtri)} combinazioni di filtri")
+
+
+if __name__ == "__main__":
+    main()
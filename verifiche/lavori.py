@@ -0,0 +1,191 @@
+"""
+Verifica della coda dei lavori (utils/job_queue.py e worker.esegui_coda) con
+il client Anthropic finto (utils.claude_client.ClientFinto), su un database
+SQLite temporaneo: nessuna chiamata di rete.
+
+Accoda un'analisi di contratto (testuale e Vision), una verifica di fattura,
+un lavoro annullato prima dell'avvio, uno con contratto inesistente e uno di
+tipo sconosciuto, esegue il worker una volta e controlla:
+- stato, progresso e messaggio finale di ogni lavoro;
+- il progresso registrato al momento della chiamata a Claude;
+- le righe scritte in contratti_analisi, verifiche_fatture e utilizzo_claude;
+- che il lavoro annullato non venga eseguito e il PDF temporaneo della
+  fattura venga eliminato.
+
+Le pagine JPEG dei PDF vengono messe nella cache (in una cartella temporanea)
+prima di eseguire il worker, così la verifica non richiede poppler.
+
+Uso: python verifiche/lavori.py
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CARTELLA = tempfile.mkdtemp()
+os.environ['PDF_CACHE_DIR'] = os.path.join(CARTELLA, 'cache_pdf')
+
+import db_utils
+if db_utils.USE_POSTGRES:
+    sys.exit("Questa verifica usa un database SQLite temporaneo: eseguirla senza DATABASE_URL")
+
+import database
+database.DB_PATH = os.path.join(CARTELLA, 'verifica_lavori.db')
+database.init_db()
+from migrazioni import applica_migrazioni
+applica_migrazioni()
+
+from PIL import Image
+
+from db_utils import db_connection
+from routes.contratti import PROMPT_ANALISI_VERSIONE, _accoda_analisi
+from utils import pdf_cache
+from utils.claude_client import ClientFinto
+from utils.job_queue import (STATO_ANNULLATO, STATO_COMPLETATO, STATO_ERRORE, accoda_job, annulla_job,
+                             leggi_job)
+from utils.pdf_images import LATO_MAX_PX, QUALITA_JPEG
+from worker import esegui_coda
+
+TESTO_CONTRATTO = ("Contratto di docenza per il corso C1. Lezioni dal 10/01/2025 al 28/02/2025, "
+                   "monte ore 40, compenso orario 30 euro.")
+RISPOSTA = json.dumps({"numero_fattura": "7", "monte_ore": 40.0, "importo_lordo": 1200.0})
+
+
+class ClientConProgresso(ClientFinto):
+    """ClientFinto che annota progresso e messaggio del lavoro in corso a ogni chiamata"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.progressi = []
+
+    def create(self, *args, **kwargs):
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT tipo, progresso, messaggio FROM jobs WHERE stato = 'in_corso'")
+            self.progressi.append(tuple(cursor.fetchone()))
+        return super().create(*args, **kwargs)
+
+
+def crea_pdf(nome, pagine):
+    """PDF di `pagine` pagine bianche, con le pagine JPEG già nella cache per max_pagine 10 e 20"""
+    percorso = os.path.join(CARTELLA, nome)
+    immagini = [Image.new('RGB', (595, 842), 'white') for _ in range(pagine)]
+    immagini[0].save(percorso, save_all=True, append_images=immagini[1:])
+
+    sha = pdf_cache.hash_file(percorso)
+    for max_pagine in (10, 20):
+        cartella = os.path.join(pdf_cache._cartella_voce(sha), f"pagine_{max_pagine}_{LATO_MAX_PX}_q{QUALITA_JPEG}")
+        os.makedirs(cartella, exist_ok=True)
+        for numero, immagine in enumerate(immagini, start=1):
+            jpeg = BytesIO()
+            immagine.save(jpeg, format='JPEG', quality=QUALITA_JPEG)
+            with open(os.path.join(cartella, f"{numero:04d}.jpg"), 'wb') as f:
+                f.write(jpeg.getvalue())
+    return percorso
+
+
+def inserisci_contratto(cursor, file_path, testo):
+    cursor.execute("INSERT INTO contratti (nome_file, file_path, data_upload, contenuto_estratto) VALUES (?, ?, ?, ?)",
+                   (os.path.basename(file_path), file_path, "2025-01-01", testo))
+    return cursor.lastrowid
+
+
+def main():
+    pdf_contratto = crea_pdf('contratto.pdf', 2)
+    pdf_fattura = crea_pdf('fattura.pdf', 1)
+    pdf_temporaneo = os.path.join(CARTELLA, 'fattura_caricata.pdf')
+    shutil.copy(pdf_fattura, pdf_temporaneo)
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        contratto = inserisci_contratto(cursor, pdf_contratto, TESTO_CONTRATTO)
+        contratto_vision = inserisci_contratto(cursor, pdf_contratto, "")
+        contratto_annullato = inserisci_contratto(cursor, pdf_contratto, TESTO_CONTRATTO)
+        cursor.execute("""
+            INSERT INTO fatture (numero_fattura, data_fattura, importo, tipo_fatturazione, file_pdf)
+            VALUES ('7', '2025-03-01', 1200, 'totale', 'fattura.pdf')
+        """)
+        fattura = cursor.lastrowid
+        conn.commit()
+
+    lavori = {
+        "analisi testuale": _accoda_analisi(contratto),
+        "analisi Vision": _accoda_analisi(contratto_vision, force_vision=True, sovrascrivi_testo=True),
+        "verifica fattura": accoda_job('verifica_fattura', {
+            'id_fattura': fattura, 'pdf_path': pdf_temporaneo, 'is_temp': True}),
+        "annullato in coda": _accoda_analisi(contratto_annullato),
+        "contratto inesistente": _accoda_analisi(9999),
+        "tipo sconosciuto": accoda_job('sconosciuto', {}),
+    }
+    controlli = [("stessa chiave: nessun doppione", _accoda_analisi(contratto) == lavori["analisi testuale"]),
+                 ("annulla_job su un lavoro in coda", annulla_job(lavori["annullato in coda"]))]
+
+    client = ClientConProgresso(RISPOSTA)
+    eseguiti = esegui_coda(client=client, una_volta=True)
+    controlli.append((f"lavori eseguiti dal worker: {eseguiti}", eseguiti == len(lavori) - 1))
+    controlli.append(("annulla_job su un lavoro concluso", not annulla_job(lavori["analisi testuale"])))
+
+    attesi = {
+        "analisi testuale": (STATO_COMPLETATO, 100, "Completato", None),
+        "analisi Vision": (STATO_COMPLETATO, 100, "Completato", None),
+        "verifica fattura": (STATO_COMPLETATO, 100, "Completato", None),
+        "annullato in coda": (STATO_ANNULLATO, 0, "Annullato", None),
+        "contratto inesistente": (STATO_ERRORE, 100, "Errore", "Contratto non trovato"),
+        "tipo sconosciuto": (STATO_ERRORE, 100, "Errore", "Tipo di lavoro sconosciuto: sconosciuto"),
+    }
+    for nome, job_id in lavori.items():
+        job = leggi_job(job_id)
+        ottenuto = (job['stato'], job['progresso'], job['messaggio'], job['errore'])
+        controlli.append((f"lavoro '{nome}': {ottenuto}", ottenuto == attesi[nome]))
+
+    controlli.append((f"progresso alla chiamata a Claude: {client.progressi}", client.progressi == [
+        ('analisi_contratto', 20, "Analisi con Claude AI"),
+        ('analisi_contratto', 20, f"Analisi con Claude AI (Vision, pagine fino a {LATO_MAX_PX} px)"),
+        ('verifica_fattura', 40, "Lettura della fattura con Claude AI"),
+    ]))
+    immagini = [sum(b.get('type') == 'image' for b in c['messages'][0]['content'])
+                for c in client.chiamate if isinstance(c['messages'][0]['content'], list)]
+    controlli.append((f"pagine inviate a Claude (Vision, fattura): {immagini}", immagini == [2, 1]))
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id_contratto, hash_pdf, versione_prompt, analisi FROM contratti_analisi ORDER BY id_contratto")
+        analisi = [tuple(row) for row in cursor.fetchall()]
+        sha = pdf_cache.hash_file(pdf_contratto)
+        controlli.append(("righe di contratti_analisi", analisi == [
+            (contratto, sha, PROMPT_ANALISI_VERSIONE, RISPOSTA),
+            (contratto_vision, sha, PROMPT_ANALISI_VERSIONE, RISPOSTA),
+        ]))
+        cursor.execute("SELECT contenuto_estratto FROM contratti WHERE id = ?", (contratto_vision,))
+        controlli.append(("testo Vision salvato nel contratto", cursor.fetchone()[0] == RISPOSTA))
+
+        cursor.execute("SELECT id_fattura, id_job, dati_ai FROM verifiche_fatture")
+        verifiche = [(row[0], row[1], json.loads(row[2])) for row in cursor.fetchall()]
+        controlli.append(("righe di verifiche_fatture",
+                          verifiche == [(fattura, lavori["verifica fattura"], json.loads(RISPOSTA))]))
+
+        cursor.execute("SELECT operazione, riferimento FROM utilizzo_claude ORDER BY id")
+        utilizzo = [tuple(row) for row in cursor.fetchall()]
+        controlli.append((f"righe di utilizzo_claude: {utilizzo}", utilizzo == [
+            ("analisi_contratto", str(contratto)),
+            ("analisi_contratto_vision", str(contratto_vision)),
+            ("verifica_fattura", str(fattura)),
+        ]))
+    controlli.append(("PDF temporaneo della fattura eliminato", not os.path.exists(pdf_temporaneo)))
+
+    errori = 0
+    for descrizione, ok in controlli:
+        print(f"{'✅' if ok else '❌'} {descrizione}")
+        errori += not ok
+    shutil.rmtree(CARTELLA, ignore_errors=True)
+    if errori:
+        sys.exit(f"\n❌ {errori} controlli non superati")
+    print("\n✅ Coda dei lavori verificata con il client finto")
+
+
+if __name__ == "__main__":
+    main()
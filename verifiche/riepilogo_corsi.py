@@ -0,0 +1,180 @@
+"""
+Verifica di utils/riepilogo_corsi su un database SQLite temporaneo.
+
+Esegue tramite il client di test di Flask le route che modificano le lezioni
+(aggiunta, modifica, completamento, eliminazione, archiviazione, fatturazione,
+import CSV) e dopo ognuna controlla con verifica_riepilogo() che la tabella
+riepilogo_corsi coincida con le lezioni. Alla fine confronta:
+- statistiche_da_riepilogo con statistiche_corsi (stato_crediti, arretrati);
+- i totali di resoconto_annuale con il calcolo precedente lezione per lezione.
+
+Uso: python verifiche/riepilogo_corsi.py
+"""
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+if db_utils.USE_POSTGRES:
+    sys.exit("Questa verifica usa un database SQLite temporaneo: eseguirla senza DATABASE_URL")
+
+import database
+import ensure_db
+database.DB_PATH = ensure_db.DB_PATH = os.path.join(tempfile.mkdtemp(), 'verifica_riepilogo.db')
+database.init_db()
+
+from flask import template_rendered
+
+from app import app
+from db_utils import db_connection
+from utils.riepilogo_corsi import statistiche_da_riepilogo, verifica_riepilogo
+from utils.statistiche_corsi import statistiche_corsi
+from utils.time_utils import calcola_ore
+
+CSV = """id_corso,materia,data,ora_inizio,ora_fine,luogo,compenso_orario,stato,fatturato,cliente
+C1,Excel,2025-01-10,09:00,13:00,Aula,30,Completato,0,Alfa
+C1,Excel,2025-01-17,09:00,13:00,Aula,30,Completato,1,Alfa
+C2,Word,2025-02-03,14:00,17:30,Aula,25,Completato,0,Beta
+C2,Word,2025-02-10,14:00,17:30,Aula,25,Pianificato,0,Beta
+C3,Access,2024-11-05,9:00,12:00,Aula,40,Completato,0,Alfa
+C3,Access,2024-11-12,09:00,12:00,Aula,40,Cancellato,0,Alfa
+C4,Python,2025-03-01,10:00,12:00,Aula,35,Completato,2,Gamma
+C4,Python,2025-03-08,10:00,12:00,Aula,35,Completato,0,Gamma
+"""
+
+
+def id_lezioni(id_corso):
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM lezioni WHERE id_corso = ? ORDER BY id", (id_corso,))
+        return [row[0] for row in cursor.fetchall()]
+
+
+def passi(client):
+    """(descrizione, funzione che esegue la richiesta)"""
+    lezione = {'materia': 'Excel', 'data': '2025-01-24', 'ora_inizio': '09:00', 'ora_fine': '11:30',
+               'luogo': 'Aula', 'compenso_orario': '30', 'stato': 'Pianificato'}
+    return [
+        ("importa_csv", lambda: client.post('/importa_csv', data={
+            'file': (io.BytesIO(CSV.encode()), 'lezioni.csv')}, content_type='multipart/form-data')),
+        ("aggiungi_lezione", lambda: client.post('/aggiungi_lezione', data={
+            'id_corso[]': ['C1', 'C2'], 'materia[]': ['Excel', 'Word'], 'data[]': ['2025-01-24', '2025-02-17'],
+            'ora_inizio[]': ['09:00', '14:00'], 'ora_fine[]': ['11:30', '16:00'], 'luogo[]': ['Aula', 'Aula'],
+            'compenso_orario[]': ['30', '25'], 'stato[]': ['Pianificato', 'Pianificato']})),
+        ("modifica_lezione", lambda: client.post(f'/modifica_lezione/{id_lezioni("C1")[-1]}',
+                                                 data=dict(lezione, data='2025-02-24', ora_fine='12:00'))),
+        ("completa_lezione", lambda: client.post(f'/completa_lezione/{id_lezioni("C1")[-1]}')),
+        ("elimina_lezione", lambda: client.post(f'/elimina_lezione/{id_lezioni("C2")[-1]}',
+                                                data={'csrf_token': 'x'})),
+        ("elimina_lezioni", lambda: client.post('/elimina_lezioni',
+                                                data={'lezioni_selezionate[]': id_lezioni("C4")[:1]})),
+        ("fattura_corso (singole lezioni)", lambda: client.post('/fatture/fattura_corso?corso_scelto=C2',
+                                                                data={'lezioni': id_lezioni("C2")[:1]})),
+        ("segnala_fatturato", lambda: client.post('/segnala_fatturato',
+                                                  data={'corso': 'C1', 'mese_fatturato': '2025-03'})),
+        ("aggiungi_fattura", lambda: client.post('/fatture/aggiungi_fattura', data={
+            'numero_fattura': '7', 'data_fattura': '2025-04-01', 'importo': '100',
+            'tipo_fatturazione': 'parziale', 'lezioni': id_lezioni("C4")})),
+        ("elimina_fattura", lambda: client.post('/fatture/elimina_fattura/1')),
+        ("archivia_lezioni", lambda: client.post('/archivia_lezioni',
+                                                 data={'lezioni_selezionate[]': id_lezioni("C2")[:1]})),
+        ("archivia_corso", lambda: client.post('/archivia_corso/C3')),
+        ("fattura_corso (tutto)", lambda: client.post('/fatture/fattura_corso?corso_scelto=C1',
+                                                      data={'fattura_tutto': '1'})),
+        ("elimina_corso", lambda: client.post('/elimina_corso/C4')),
+    ]
+
+
+def resoconto_precedente(anno):
+    """Totali di resoconto_annuale calcolati lezione per lezione, come prima del riepilogo"""
+    totali = {'fatturate': 0, 'da_fatturare': 0, 'pianificate': 0, 'cancellate': 0}
+    per_anno = {}
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT stato, fatturato, ora_inizio, ora_fine, compenso_orario, extract_year(data) AS anno FROM lezioni
+            UNION ALL
+            SELECT stato, fatturato, ora_inizio, ora_fine, compenso_orario, extract_year(data) AS anno FROM archiviate
+        """)
+        for lezione in cursor.fetchall():
+            ore = calcola_ore(lezione['ora_inizio'], lezione['ora_fine'])
+            compenso = ore * lezione['compenso_orario']
+            voce = per_anno.setdefault(lezione['anno'], {'totale': 0, 'n_completate': 0, 'n_fatturate': 0})
+            voce['totale'] += compenso
+            if lezione['stato'] == 'Completato':
+                voce['n_completate'] += 1
+                chiave = 'fatturate' if lezione['fatturato'] == 1 else 'da_fatturare'
+                voce['n_fatturate'] += lezione['fatturato'] == 1
+            elif lezione['stato'] == 'Pianificato':
+                chiave = 'pianificate'
+            elif lezione['stato'] == 'Cancellato':
+                chiave = 'cancellate'
+            else:
+                continue
+            if lezione['anno'] == anno:
+                totali[chiave] += compenso
+    return totali, per_anno
+
+
+def main():
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    with client.session_transaction() as sessione:
+        sessione['_user_id'] = '1'
+        sessione['_fresh'] = True
+
+    errori = 0
+    for descrizione, richiesta in passi(client):
+        risposta = richiesta()
+        with db_connection() as conn:
+            differenze = verifica_riepilogo(conn.cursor())
+        if risposta.status_code >= 400 or differenze:
+            errori += 1
+            print(f"❌ {descrizione}: HTTP {risposta.status_code}, {len(differenze)} differenze")
+            for differenza in differenze[:5]:
+                print(f"     {differenza}")
+        else:
+            print(f"✅ {descrizione}")
+
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        attese, lette = statistiche_corsi(cursor), statistiche_da_riepilogo(cursor)
+    if list(attese) != list(lette) or any(
+            not math.isclose(attese[c][k], lette[c][k]) if isinstance(attese[c][k], (int, float))
+            else attese[c][k] != lette[c][k] for c in attese for k in attese[c]):
+        errori += 1
+        print("❌ statistiche_da_riepilogo diverse da statistiche_corsi")
+    else:
+        print("✅ stato_crediti e arretrati: statistiche_da_riepilogo = statistiche_corsi")
+
+    contesti = []
+    template_rendered.connect(lambda sender, template, context, **extra: contesti.append(context), app, weak=False)
+    if client.get('/resoconto_annuale?anno=2025').status_code != 200:
+        sys.exit("❌ resoconto_annuale non risponde")
+    contesto = contesti[-1]
+    totali, per_anno = resoconto_precedente('2025')
+    anni = json.loads(contesto['anni_grafico'])
+    confronti = [(f"totale_{k}", totali[k], contesto[f"totale_{k}"]) for k in totali]
+    for chiave, nome in (('totale', 'dati_totali_per_anno'), ('n_completate', 'n_completate_per_anno'),
+                         ('n_fatturate', 'n_fatturate_per_anno')):
+        confronti += [(f"{nome}[{anno}]", per_anno[anno][chiave], valore)
+                      for anno, valore in zip(anni, json.loads(contesto[nome]))]
+    sbagliati = [(nome, prima, ora) for nome, prima, ora in confronti if not math.isclose(prima, ora, abs_tol=1e-6)]
+    if sbagliati or sorted(per_anno) != anni:
+        errori += 1
+        print(f"❌ resoconto_annuale diverso dal calcolo precedente: {sbagliati or anni}")
+    else:
+        print(f"✅ resoconto_annuale: {len(confronti)} totali identici al calcolo lezione per lezione")
+
+    if errori:
+        sys.exit(f"\n❌ {errori} controlli falliti")
+    print("\n✅ Riepilogo coerente dopo ogni modifica")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Verifica di regressione di utils/statistiche_corsi: i numeri del motore
+aggregato devono coincidere con quelli delle query precedenti di
+dettagli_corso, lista_corsi, aggiungi_lezione e stato_crediti (una query per
+metrica, ore ricalcolate riga per riga con calcola_ore).
+
+Per default popola un database SQLite temporaneo con dati sintetici; con
+--database-corrente confronta in sola lettura i dati del database configurato
+(SQLite o DATABASE_URL PostgreSQL).
+
+Uso: python verifiche/statistiche_corsi.py [--corsi 60] [--lezioni 3000] [--database-corrente]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_utils
+
+ORARI = [("09:00", "13:00"), ("14:00", "18:00"), ("9:30", "12:15"), ("15:00", "17:00"), ("08:45", "10:05")]
+STATI = ["Completato", "Completato", "Pianificato", "Cancellato"]
+
+
+def popola(n_corsi, n_lezioni):
+    from db_utils import db_connection
+    from utils.time_utils import durata_e_importo
+
+    rnd = random.Random(7)
+    corsi = [f"C{i:03d}" for i in range(n_corsi)]
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # Un corso su dieci non è in tabella corsi (lezioni importate senza anagrafica)
+        cursor.executemany("INSERT INTO corsi (id_corso, nome, cliente) VALUES (?, ?, ?)",
+                           [(c, f"Corso {c}", rnd.choice(["Alfa", "Beta", None]))
+                            for i, c in enumerate(corsi) if i % 10])
+        righe = []
+        for _ in range(n_lezioni):
+            ora_inizio, ora_fine = rnd.choice(ORARI)
+            compenso = rnd.choice([25.0, 30.0, 37.5])
+            giorno = date(2024, 1, 1) + timedelta(days=rnd.randrange(700))
+            righe.append((rnd.choice(corsi), "Materia", giorno.isoformat(), ora_inizio, ora_fine, "Aula",
+                          compenso, rnd.choice(STATI), rnd.choice([0, 0, 1, 1, 2]),
+                          *durata_e_importo(ora_inizio, ora_fine, compenso)))
+        # Corsi con tutte le lezioni fatturate
+        for c in corsi[1:4]:
+            righe.append((c, "Materia", "2024-02-01", "09:00", "11:00", "Aula", 30.0, "Completato", 1, 120, 60.0))
+        cursor.executemany("""
+            INSERT INTO lezioni (id_corso, materia, data, ora_inizio, ora_fine, luogo, compenso_orario, stato,
+                                 fatturato, durata_minuti, importo)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, righe)
+        cursor.execute("UPDATE lezioni SET fatturato = 1 WHERE id_corso IN ('C001', 'C002', 'C003')")
+        conn.commit()
+
+
+# ---------------------------------------------------
+# Calcolo precedente, una query per metrica
+# ---------------------------------------------------
+
+def dettagli_precedente(cursor, corso):
+    p = db_utils.get_placeholder()
+
+    def valore(sql):
+        cursor.execute(sql, (corso,))
+        return cursor.fetchone()[0] or 0
+
+    return {
+        "ha_lezioni": valore(f"SELECT COUNT(*) FROM lezioni WHERE id_corso = {p}") > 0,
+        "ore_totali": valore(f"SELECT SUM(calcola_ore(ora_inizio, ora_fine)) FROM lezioni WHERE id_corso = {p}"),
+        "ore_completate": valore(f"""SELECT SUM(calcola_ore(ora_inizio, ora_fine))
+                                     FROM lezioni WHERE id_corso = {p} AND stato = 'Completato'"""),
+        "ore_fatturate": valore(f"""SELECT SUM(CASE WHEN fatturato = 1 THEN calcola_ore(ora_inizio, ora_fine) ELSE 0 END)
+                                    FROM lezioni WHERE id_corso = {p}"""),
+        "totale_fatturato_lordo": valore(f"""SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
+                                             FROM lezioni WHERE id_corso = {p} AND fatturato = 1"""),
+        "ammontare_totale": valore(f"""SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
+                                       FROM lezioni WHERE id_corso = {p}"""),
+        "ammontare_completato": valore(f"""SELECT SUM(calcola_ore(ora_inizio, ora_fine) * compenso_orario)
+                                           FROM lezioni WHERE id_corso = {p} AND stato = 'Completato'"""),
+    }
+
+
+def lista_precedente(cursor, corso):
+    p = db_utils.get_placeholder()
+    cursor.execute(f"""
+        SELECT COUNT(*) as totale,
+               SUM(CASE WHEN fatturato = 1 THEN 1 ELSE 0 END) as completamente_fatturate,
+               SUM(CASE WHEN fatturato = 2 THEN 1 ELSE 0 END) as parzialmente_fatturate,
+               SUM(calcola_ore(ora_inizio, ora_fine)) as ore_totali,
+               SUM(CASE WHEN fatturato = 1 THEN calcola_ore(ora_inizio, ora_fine) ELSE 0 END) as ore_fatturate
+        FROM lezioni WHERE id_corso = {p}
+    """, (corso,))
+    r = cursor.fetchone()
+    if not r or r['totale'] == 0:
+        return {"completamente_fatturato": False, "parzialmente_fatturato": False,
+                "ore_totali": 0, "ore_fatturate": 0, "ore_rimanenti": 0, "disponibile": True}
+    return {
+        "completamente_fatturato": r['totale'] == r['completamente_fatturate'],
+        "parzialmente_fatturato": r['parzialmente_fatturate'] > 0,
+        "ore_totali": r['ore_totali'] or 0,
+        "ore_fatturate": r['ore_fatturate'] or 0,
+        "ore_rimanenti": (r['ore_totali'] or 0) - (r['ore_fatturate'] or 0),
+        # aggiungi_lezione: corso proposto se non interamente fatturato
+        "disponibile": r['totale'] != r['completamente_fatturate'],
+    }
+
+
+def stato_crediti_precedente(cursor):
+    cursor.execute("""
+        SELECT COALESCE(c.cliente, 'Senza Cliente') as cliente, l.id_corso,
+               COALESCE(c.nome, l.id_corso) as nome_corso,
+               COUNT(l.id) as totale_lezioni,
+               SUM(CASE WHEN l.stato = 'Completato' THEN 1 ELSE 0 END) as lezioni_completate,
+               SUM(CASE WHEN l.stato = 'Completato' THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_completato,
+               SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 1 THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_fatturato,
+               SUM(CASE WHEN l.stato = 'Completato' AND l.fatturato = 0 THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_maturato,
+               SUM(CASE WHEN l.stato != 'Completato' THEN calcola_ore(l.ora_inizio, l.ora_fine) * l.compenso_orario ELSE 0 END) as credito_futuro,
+               MAX(l.data) as ultima_data_lezione
+        FROM lezioni l
+        LEFT JOIN corsi c ON l.id_corso = c.id_corso
+        GROUP BY COALESCE(c.cliente, 'Senza Cliente'), l.id_corso, c.nome
+        ORDER BY cliente, nome_corso
+    """)
+    return [dict(r) for r in cursor.fetchall()]
+
+
+def uguali(a, b):
+    if isinstance(a, bool) or isinstance(b, bool) or isinstance(a, str) or a is None or b is None:
+        return a == b
+    # calcola_ore su PostgreSQL è REAL (precisione singola)
+    return math.isclose(float(a), float(b), rel_tol=1e-5, abs_tol=1e-3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corsi', type=int, default=60)
+    parser.add_argument('--lezioni', type=int, default=3000)
+    parser.add_argument('--database-corrente', action='store_true',
+                        help="confronta i dati del database configurato (sola lettura)")
+    args = parser.parse_args()
+
+    if not args.database_corrente:
+        if db_utils.USE_POSTGRES:
+            sys.exit("I dati sintetici vanno in un database SQLite temporaneo: eseguire senza DATABASE_URL "
+                     "oppure con --database-corrente")
+        import database
+        database.DB_PATH = os.path.join(tempfile.mkdtemp(), 'verifica_statistiche.db')
+        database.init_db()
+        from migrazioni import applica_migrazioni
+        applica_migrazioni()
+        popola(args.corsi, args.lezioni)
+
+    from utils.statistiche_corsi import stato_fatturazione_corsi, statistiche_corsi, statistiche_corso
+
+    differenze = []
+
+    def confronta(pagina, corso, atteso, ottenuto):
+        for chiave, valore in atteso.items():
+            if not uguali(valore, ottenuto[chiave]):
+                differenze.append(f"{pagina} {corso} {chiave}: prima {valore!r}, ora {ottenuto[chiave]!r}")
+
+    with db_utils.db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id_corso FROM corsi UNION SELECT DISTINCT id_corso FROM lezioni")
+        corsi = sorted(row[0] for row in cursor.fetchall())
+
+        for corso in corsi:
+            stat = statistiche_corso(cursor, corso)
+            confronta("dettagli_corso", corso, dettagli_precedente(cursor, corso), {
+                "ha_lezioni": stat["totale_lezioni"] > 0,
+                "ore_totali": stat["ore_totali"],
+                "ore_completate": stat["ore_completate"],
+                "ore_fatturate": stat["ore_fatturate"],
+                "totale_fatturato_lordo": stat["importo_fatturato"],
+                "ammontare_totale": stat["importo_totale"],
+                "ammontare_completato": stat["importo_completato"],
+            })
+            confronta("lista_corsi/aggiungi_lezione", corso, lista_precedente(cursor, corso),
+                      dict(stat, disponibile=not stat["completamente_fatturato"]))
+
+        raggruppati = stato_fatturazione_corsi(cursor)
+        cursor.execute("SELECT id_corso FROM corsi ORDER BY nome")
+        if [r['id_corso'] for r in raggruppati] != [row[0] for row in cursor.fetchall()]:
+            differenze.append("stato_fatturazione_corsi: corsi o ordinamento diversi")
+        for stat in raggruppati:
+            confronta("stato_fatturazione_corsi", stat['id_corso'], lista_precedente(cursor, stat['id_corso']),
+                      dict(stat, disponibile=not stat["completamente_fatturato"]))
+
+        precedente = stato_crediti_precedente(cursor)
+        attuale = list(statistiche_corsi(cursor).values())
+        if [r['id_corso'] for r in precedente] != [r['id_corso'] for r in attuale]:
+            differenze.append("stato_crediti: corsi o ordinamento diversi")
+        for prima, ora in zip(precedente, attuale):
+            confronta("stato_crediti", prima['id_corso'], prima, dict(
+                ora, credito_completato=ora["importo_completato"], ultima_data_lezione=ora["ultima_data"]))
+
+    for differenza in differenze[:20]:
+        print(f"❌ {differenza}")
+    if differenze:
+        sys.exit(f"\n❌ {len(differenze)} valori diversi su {len(corsi)} corsi")
+    print(f"✅ Statistiche identiche al calcolo precedente per {len(corsi)} corsi "
+          f"(dettagli_corso, lista_corsi, aggiungi_lezione, stato_crediti)")
+
+
+if __name__ == "__main__":
+    main()
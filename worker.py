@@ -0,0 +1,104 @@
+"""
+Worker dei lavori in background (analisi PDF con Claude Vision).
+
+Preleva i lavori dalla tabella `jobs` ed esegue l'handler registrato per il
+tipo di lavoro. Ogni INTERVALLO_PULIZIA secondi elimina anche i file
+temporanei degli upload più vecchi di ORE_CONSERVAZIONE_TEMP ore
+(utils.upload.pulisci_temporanei). Avvio manuale: python worker.py
+Su Render viene avviato da gunicorn.conf.py insieme al server web, in
+sviluppo da `python app.py` (disattivabile in entrambi i casi con
+AVVIA_WORKER_JOB=false, es. per avviarlo a parte).
+"""
+import logging
+import os
+import signal
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from migrazioni import MIGRAZIONI, versione_corrente
+from utils.job_queue import preleva_job, esegui_job, ripristina_job_interrotti
+from utils.upload import INTERVALLO_PULIZIA, ORE_CONSERVAZIONE_TEMP, pulisci_temporanei
+
+# Importati per registrare gli handler dei lavori
+import routes.contratti  # noqa: F401  (analisi_contratto)
+import fatture  # noqa: F401  (verifica_fattura)
+
+INTERVALLO_POLLING = float(os.environ.get('JOB_POLLING_SECONDI', '2'))
+
+_in_esecuzione = True
+
+
+def _arresta(signum, frame):
+    global _in_esecuzione
+    print("🛑 Worker: arresto richiesto, termino dopo il lavoro corrente...")
+    _in_esecuzione = False
+
+
+def _pulisci_temporanei():
+    try:
+        eliminati = pulisci_temporanei()
+    except OSError as e:
+        print(f"⚠️ Worker: pulizia dei file temporanei non riuscita: {e}")
+        return
+    if eliminati:
+        print(f"🧹 Worker: {eliminati} file temporanei eliminati (più vecchi di {ORE_CONSERVAZIONE_TEMP:g} ore)")
+
+
+def esegui_coda(client=None, una_volta=False):
+    """Esegue i lavori in coda finché non viene fermato.
+
+    Con `una_volta=True` svuota la coda e ritorna (usato nei test con un client finto).
+    Restituisce il numero di lavori eseguiti.
+    """
+    eseguiti = 0
+    prossima_pulizia = 0
+    while _in_esecuzione:
+        if not una_volta and time.monotonic() >= prossima_pulizia:
+            _pulisci_temporanei()
+            prossima_pulizia = time.monotonic() + INTERVALLO_PULIZIA
+
+        job = preleva_job()
+        if job is None:
+            if una_volta:
+                break
+            time.sleep(INTERVALLO_POLLING)
+            continue
+
+        print(f"⚙️ Worker: lavoro {job['id']} ({job['tipo']}) avviato")
+        ok = esegui_job(job, client=client)
+        print(f"{'✅' if ok else '❌'} Worker: lavoro {job['id']} concluso")
+        eseguiti += 1
+    return eseguiti
+
+
+def _attendi_migrazioni():
+    """Le tabelle dei lavori le crea l'app (migrazioni all'avvio): il worker può partire prima"""
+    richiesta = MIGRAZIONI[-1][0]
+    avvisato = False
+    while _in_esecuzione and versione_corrente() < richiesta:
+        if not avvisato:
+            print(f"⏳ Worker: in attesa che l'app aggiorni lo schema alla versione {richiesta}...")
+            avvisato = True
+        time.sleep(INTERVALLO_POLLING)
+
+
+def main():
+    # Messaggi dei moduli che usano logging (es. routes.contratti) sul log del worker
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGTERM, _arresta)
+    signal.signal(signal.SIGINT, _arresta)
+
+    _attendi_migrazioni()
+
+    ripristinati = ripristina_job_interrotti()
+    if ripristinati:
+        print(f"⚠️ Worker: {ripristinati} lavori interrotti rimessi in coda")
+
+    print(">>> Worker lavori in background avviato")
+    esegui_coda()
+
+
+if __name__ == "__main__":
+    main()